@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect badge, catalog and course material signals so rule caches,
+        # tool caches and the material search index stay current.
+        from .services import badge_engine, material_index, tool_registry  # noqa: F401
+        from .services.token_budget import load_encoding
+        from .services.usage_quota import check_shared_cache
+
+        # Read the tokenizer from disk now rather than on the first chat request.
+        load_encoding()
+
+        checks.register(check_shared_cache)
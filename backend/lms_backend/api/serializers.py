@@ -4,7 +4,7 @@ from myapp.models import (
     ContentProgress, Payment, Assignment, AssignmentSubmission, Certificate,
     AssignmentQuestion, AssignmentOption, CourseRating, SupportRequest,
     Badge, UserBadge, UserStats, DailyActivity, XPTransaction, ChatSession, ChatMessage,
-    Category
+    Category, GenerationJob
 )
 from django.db.models import Avg, Count
 
@@ -365,6 +365,7 @@ class ChatbotResponseSerializer(serializers.Serializer):
     model_name = serializers.CharField(required=False)
     token_count_input = serializers.IntegerField(required=False)
     token_count_output = serializers.IntegerField(required=False)
+    timings = serializers.DictField(required=False)
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
@@ -374,17 +375,46 @@ class ChatSessionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'role', 'created_at', 'updated_at']
 
 
+class ChatSessionListSerializer(ChatSessionSerializer):
+    """Session row for the history sidebar; the extra fields are query annotations."""
+
+    message_count = serializers.IntegerField(read_only=True)
+    last_query_preview = serializers.CharField(read_only=True, allow_null=True)
+    last_activity_at = serializers.DateTimeField(read_only=True, allow_null=True)
+
+    class Meta(ChatSessionSerializer.Meta):
+        fields = ChatSessionSerializer.Meta.fields + ['message_count', 'last_query_preview', 'last_activity_at']
+
+
 class ChatMessageHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
         fields = [
             'id', 'session', 'role', 'query', 'response', 'function_calls', 'reasoning_trace',
             'source', 'status', 'model_name', 'token_count_input', 'token_count_output',
-            'error_code', 'error_message', 'response_time_ms', 'created_at'
+            'error_code', 'error_message', 'response_time_ms', 'timings', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class GenerationJobListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = [
+            'id', 'kind', 'status', 'title', 'params', 'model_name', 'token_count',
+            'error_message', 'created_at', 'started_at', 'finished_at'
         ]
         read_only_fields = fields
 
 
+class GenerationJobSerializer(GenerationJobListSerializer):
+    """Job with its generated draft; ``result`` has the old synchronous response shape."""
+
+    class Meta(GenerationJobListSerializer.Meta):
+        fields = GenerationJobListSerializer.Meta.fields + ['result']
+        read_only_fields = fields
+
+
 # ==================== GAMIFICATION SERIALIZERS ====================
 
 class BadgeSerializer(serializers.ModelSerializer):
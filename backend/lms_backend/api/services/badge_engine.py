@@ -0,0 +1,182 @@
+"""Indexed badge rule engine for gamification.
+
+Active badges are loaded once per process and turned into rules indexed by
+the stat family they depend on (streak, completion, performance,
+engagement). A version number kept in the Django cache is bumped whenever a
+badge changes so every process reloads its rules on the next evaluation.
+
+Evaluating badges for a user costs at most two queries: one to fetch the
+ids of candidate badges the user already holds and one
+``INSERT ... ON CONFLICT DO NOTHING RETURNING`` for new awards. Only the
+rows that insert actually wrote are reported as earned, so two concurrent
+evaluations never both pay out the same badge. Nothing is queried when no
+rule is satisfied.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from myapp.models import Badge, UserBadge, UserStats
+
+
+BADGE_RULES_VERSION_KEY = "gamification:badge_rules:version"
+
+STREAK = "streak"
+COMPLETION = "completion"
+PERFORMANCE = "performance"
+ENGAGEMENT = "engagement"
+ALL_STATS = (STREAK, COMPLETION, PERFORMANCE, ENGAGEMENT)
+
+
+@dataclass(frozen=True)
+class BadgeRule:
+    badge: Badge
+    stat: str
+    check: Callable[[UserStats, int], bool]
+
+    def is_met(self, stats: UserStats) -> bool:
+        return self.check(stats, self.badge.requirement_value)
+
+
+def _streak_met(stats: UserStats, requirement: int) -> bool:
+    return stats.current_streak >= requirement or stats.longest_streak >= requirement
+
+
+def _courses_met(stats: UserStats, requirement: int) -> bool:
+    return stats.courses_completed >= requirement
+
+
+def _perfect_scores_met(stats: UserStats, requirement: int) -> bool:
+    return stats.perfect_scores >= requirement
+
+
+def _reviews_met(stats: UserStats, requirement: int) -> bool:
+    return stats.reviews_written >= requirement
+
+
+# Streak and completion badges are judged by type; performance and engagement
+# badges only by the codes that have a stat-backed rule. ``quick_learner`` and
+# ``top_3`` are awarded elsewhere.
+_TYPE_RULES = {
+    "streak": (STREAK, _streak_met),
+    "completion": (COMPLETION, _courses_met),
+}
+_CODE_RULES = {
+    "perfect_score": (PERFORMANCE, _perfect_scores_met),
+    "reviewer": (ENGAGEMENT, _reviews_met),
+}
+
+
+def _rule_for(badge: Badge) -> Optional[BadgeRule]:
+    spec = _TYPE_RULES.get(badge.badge_type) or _CODE_RULES.get(badge.code)
+    if spec is None:
+        return None
+    stat, check = spec
+    return BadgeRule(badge=badge, stat=stat, check=check)
+
+
+class BadgeRuleEngine:
+    """Process-wide cache of badge rules indexed by stat family."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._rules: Dict[str, List[BadgeRule]] = {}
+
+    @staticmethod
+    def _current_version() -> int:
+        version = cache.get(BADGE_RULES_VERSION_KEY)
+        if version is None:
+            cache.add(BADGE_RULES_VERSION_KEY, 1, timeout=None)
+            version = cache.get(BADGE_RULES_VERSION_KEY, 1)
+        return version
+
+    def rules(self) -> Dict[str, List[BadgeRule]]:
+        version = self._current_version()
+        if self._version == version:
+            return self._rules
+        with self._lock:
+            if self._version != version:
+                indexed: Dict[str, List[BadgeRule]] = {stat: [] for stat in ALL_STATS}
+                for badge in Badge.objects.filter(is_active=True):
+                    rule = _rule_for(badge)
+                    if rule is not None:
+                        indexed[rule.stat].append(rule)
+                self._rules = indexed
+                self._version = version
+        return self._rules
+
+    def evaluate(
+        self,
+        user,
+        stats: UserStats,
+        changed: Optional[Iterable[str]] = None,
+    ) -> List[Badge]:
+        """Award badges whose rules are met and return the newly earned ones.
+
+        ``changed`` limits evaluation to rules indexed by those stat families;
+        ``None`` evaluates every rule.
+        """
+        indexed = self.rules()
+        families = ALL_STATS if changed is None else [s for s in changed if s in indexed]
+        candidates = {
+            rule.badge.id: rule.badge
+            for stat in families
+            for rule in indexed[stat]
+            if rule.is_met(stats)
+        }
+        if not candidates:
+            return []
+
+        earned_ids = set(
+            UserBadge.objects.filter(user=user, badge_id__in=list(candidates)).values_list(
+                "badge_id", flat=True
+            )
+        )
+        new_ids = [badge_id for badge_id in candidates if badge_id not in earned_ids]
+        if not new_ids:
+            return []
+        inserted = _insert_user_badges(user.pk, new_ids)
+        return [candidates[badge_id] for badge_id in new_ids if badge_id in inserted]
+
+
+def _insert_user_badges(user_id: int, badge_ids: List[int]) -> set:
+    """Insert the awards that do not exist yet; returns the badge ids actually written."""
+    table = connection.ops.quote_name(UserBadge._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = ", ".join(["(%s, %s, %s)"] * len(badge_ids))
+    params = []
+    for badge_id in badge_ids:
+        params.extend([user_id, badge_id, now])
+    # Supported by PostgreSQL and SQLite >= 3.35.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, badge_id, earned_at) VALUES {rows} "
+            "ON CONFLICT (user_id, badge_id) DO NOTHING RETURNING badge_id",
+            params,
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def invalidate_badge_rules() -> None:
+    """Bump the shared rules version so every process reloads its badges."""
+    try:
+        cache.incr(BADGE_RULES_VERSION_KEY)
+    except ValueError:
+        cache.set(BADGE_RULES_VERSION_KEY, 2, timeout=None)
+
+
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def _badge_changed(sender, **kwargs):
+    invalidate_badge_rules()
+
+
+badge_engine = BadgeRuleEngine()
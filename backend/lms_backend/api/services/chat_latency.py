@@ -0,0 +1,118 @@
+"""Latency percentiles over the per-stage timings stored on ``ChatMessage``.
+
+On PostgreSQL the percentiles are computed in the database with
+``percentile_cont`` over the ``timings`` JSON, one pass for the fixed stages
+and one ``jsonb_each`` pass for the per-tool timings. Other databases (local
+SQLite) fall back to the same interpolation in Python.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connection
+
+from myapp.chatbot_models import ChatMessage
+
+
+STAGES = (
+    "session_resolve_ms",
+    "memory_load_ms",
+    "tools_ms",
+    "prompt_build_ms",
+    "ttft_ms",
+    "generation_ms",
+    "tokens_per_second",
+    "persist_ms",
+    "total_ms",
+)
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(values: Optional[Iterable[Optional[float]]]) -> Dict[str, Optional[float]]:
+    values = list(values or [None] * len(PERCENTILES))
+    return {
+        f"p{int(p * 100)}": (round(v, 1) if v is not None else None)
+        for p, v in zip(PERCENTILES, values)
+    }
+
+
+def _percentile_cont(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Linear interpolation, matching PostgreSQL's ``percentile_cont``."""
+    if not sorted_values:
+        return None
+    position = fraction * (len(sorted_values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _postgres_percentiles(since: datetime, until: datetime) -> Dict:
+    table = connection.ops.quote_name(ChatMessage._meta.db_table)
+    array = "ARRAY[" + ", ".join(str(p) for p in PERCENTILES) + "]"
+    columns = ", ".join(
+        f"percentile_cont({array}) WITHIN GROUP (ORDER BY (timings->>%s)::float), "
+        f"COUNT(timings->>%s)"
+        for _ in STAGES
+    )
+    where = "created_at >= %s AND created_at < %s AND status = 'completed'"
+    params: List = []
+    for stage in STAGES:
+        params.extend([stage, stage])
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), {columns} FROM {table} WHERE {where}", params + [since, until])
+        row = cursor.fetchone()
+        cursor.execute(
+            f"SELECT t.key, COUNT(*), percentile_cont({array}) WITHIN GROUP (ORDER BY (t.value #>> '{{}}')::float) "
+            f"FROM {table} m, jsonb_each(m.timings->'tool_ms') t "
+            "WHERE m.created_at >= %s AND m.created_at < %s AND m.status = 'completed' "
+            "AND jsonb_typeof(t.value) = 'number' "
+            "GROUP BY t.key ORDER BY t.key",
+            [since, until],
+        )
+        tool_rows = cursor.fetchall()
+
+    stages = {}
+    for index, stage in enumerate(STAGES):
+        values, count = row[1 + index * 2], row[2 + index * 2]
+        stages[stage] = {"count": count, **_labels(values)}
+    tools = {key: {"count": count, **_labels(values)} for key, count, values in tool_rows}
+    return {"messages": row[0], "stages": stages, "tools": tools}
+
+
+def _python_percentiles(since: datetime, until: datetime) -> Dict:
+    stage_values: Dict[str, List[float]] = defaultdict(list)
+    tool_values: Dict[str, List[float]] = defaultdict(list)
+    messages = 0
+    rows = ChatMessage.objects.filter(
+        created_at__gte=since, created_at__lt=until, status="completed"
+    ).values_list("timings", flat=True)
+    for timings in rows.iterator(chunk_size=2000):
+        messages += 1
+        timings = timings or {}
+        for stage in STAGES:
+            value = timings.get(stage)
+            if isinstance(value, (int, float)):
+                stage_values[stage].append(float(value))
+        for name, value in (timings.get("tool_ms") or {}).items():
+            if isinstance(value, (int, float)):
+                tool_values[name].append(float(value))
+
+    def summarize(values: List[float]) -> Dict:
+        values.sort()
+        return {"count": len(values), **_labels(_percentile_cont(values, p) for p in PERCENTILES)}
+
+    return {
+        "messages": messages,
+        "stages": {stage: summarize(stage_values[stage]) for stage in STAGES},
+        "tools": {name: summarize(values) for name, values in sorted(tool_values.items())},
+    }
+
+
+def latency_percentiles(since: datetime, until: datetime) -> Dict:
+    """p50/p95/p99 per stage and per tool for completed turns in ``[since, until)``."""
+    if connection.vendor == "postgresql":
+        report = _postgres_percentiles(since, until)
+    else:
+        report = _python_percentiles(since, until)
+    return {"since": since.isoformat(), "until": until.isoformat(), **report}
@@ -0,0 +1,168 @@
+"""Full-text search over a user's own chatbot history.
+
+On PostgreSQL the ``query`` and ``response`` of each message are matched
+through a GIN index on their ``tsvector`` (migration 0044); the planner
+combines it with the ``(user, -created_at)`` index, so a search reads only
+matching postings and that user's rows. Hits are ranked with
+``ts_rank_cd`` and snippets are built with ``ts_headline`` for the returned
+page only.
+
+On SQLite the same migration creates an external-content FTS5 table kept in
+sync by triggers; ranking uses ``bm25`` and snippets ``snippet()``. If FTS5
+is not compiled in, a ``user``-scoped ``icontains`` scan is used instead.
+
+Snippets are HTML-escaped with matches wrapped in ``<mark>``.
+"""
+
+import html
+import re
+from typing import Dict, List, Optional, Tuple
+
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from myapp.chatbot_models import ChatMessage
+
+
+# Must match the expression indexed in migration 0044.
+SEARCH_CONFIG = "english"
+SEARCH_DOCUMENT = "coalesce(query, '') || ' ' || coalesce(response, '')"
+FTS_TABLE = "myapp_chatmessage_fts"
+
+MIN_QUERY_CHARS = 2
+MAX_LIMIT = 50
+
+# Placeholders the database wraps matches in; swapped for <mark> after escaping.
+_OPEN = "⟦"
+_CLOSE = "⟧"
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_FALLBACK_CONTEXT_CHARS = 60
+
+_PG_SQL = f"""
+    WITH hits AS (
+        SELECT id, query, response, created_at,
+               ts_rank_cd(to_tsvector('{SEARCH_CONFIG}', {SEARCH_DOCUMENT}), q) AS rank, q
+        FROM myapp_chatmessage, websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS q
+        WHERE user_id = %s AND to_tsvector('{SEARCH_CONFIG}', {SEARCH_DOCUMENT}) @@ q
+        ORDER BY rank DESC, created_at DESC
+        LIMIT %s OFFSET %s
+    )
+    SELECT id, rank,
+           ts_headline('{SEARCH_CONFIG}', query, q, %s),
+           ts_headline('{SEARCH_CONFIG}', response, q, %s)
+    FROM hits
+    ORDER BY rank DESC, created_at DESC
+"""
+
+_SQLITE_SQL = f"""
+    SELECT m.id, -bm25({FTS_TABLE}) AS rank,
+           snippet({FTS_TABLE}, 0, %s, %s, '…', 12),
+           snippet({FTS_TABLE}, 1, %s, %s, '…', 24)
+    FROM {FTS_TABLE} JOIN myapp_chatmessage m ON m.id = {FTS_TABLE}.rowid
+    WHERE {FTS_TABLE} MATCH %s AND m.user_id = %s
+    ORDER BY rank DESC, m.created_at DESC
+    LIMIT %s OFFSET %s
+"""
+
+
+def _headline_options(max_words: int) -> str:
+    return (
+        f"StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords={max_words}, MinWords={max(3, max_words // 3)}, "
+        "MaxFragments=2, FragmentDelimiter=\" … \""
+    )
+
+
+def _mark(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _fts5_query(text: str) -> str:
+    # Quote every word so user input cannot use FTS5 operators; words are ANDed.
+    return " ".join('"' + word.replace('"', '""') + '"' for word in _WORD_RE.findall(text))
+
+
+def _postgres_hits(user_id: int, text: str, limit: int, offset: int) -> List[Tuple]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _PG_SQL, [text, user_id, limit, offset, _headline_options(16), _headline_options(30)]
+        )
+        return cursor.fetchall()
+
+
+def _sqlite_hits(user_id: int, text: str, limit: int, offset: int) -> Optional[List[Tuple]]:
+    match = _fts5_query(text)
+    if not match:
+        return []
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _SQLITE_SQL, [_OPEN, _CLOSE, _OPEN, _CLOSE, match, user_id, limit, offset]
+            )
+            return cursor.fetchall()
+    except DatabaseError:
+        # No FTS5 table (FTS5 not compiled into this SQLite build).
+        return None
+
+
+def _fallback_snippet(value: str, words: List[str]) -> str:
+    lowered = value.lower()
+    positions = [lowered.find(word) for word in words if word in lowered]
+    if not positions:
+        return value[:_FALLBACK_CONTEXT_CHARS * 2]
+    start = max(0, min(positions) - _FALLBACK_CONTEXT_CHARS)
+    window = value[start:start + _FALLBACK_CONTEXT_CHARS * 3]
+    for word in sorted(set(words), key=len, reverse=True):
+        window = re.sub(re.escape(word), lambda m: f"{_OPEN}{m.group(0)}{_CLOSE}", window, flags=re.IGNORECASE)
+    return ("…" if start else "") + window
+
+
+def _fallback_hits(user_id: int, text: str, limit: int, offset: int) -> List[Tuple]:
+    words = [word.lower() for word in _WORD_RE.findall(text)]
+    if not words:
+        return []
+    qs = ChatMessage.objects.filter(user_id=user_id)
+    for word in words:
+        qs = qs.filter(Q(query__icontains=word) | Q(response__icontains=word))
+    rows = qs.order_by("-created_at").values_list("id", "query", "response")[offset:offset + limit]
+    return [
+        (message_id, 0.0, _fallback_snippet(query, words), _fallback_snippet(response, words))
+        for message_id, query, response in rows
+    ]
+
+
+def search_chat_history(user_id: int, text: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """Ranked hits for ``text`` among ``user_id``'s messages, best first."""
+    text = (text or "").strip()
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+    if connection.vendor == "postgresql":
+        hits = _postgres_hits(user_id, text, limit, offset)
+    else:
+        hits = _sqlite_hits(user_id, text, limit, offset) if connection.vendor == "sqlite" else None
+        if hits is None:
+            hits = _fallback_hits(user_id, text, limit, offset)
+    if not hits:
+        return []
+
+    meta = {
+        row["id"]: row
+        for row in ChatMessage.objects.filter(id__in=[hit[0] for hit in hits]).values(
+            "id", "session_id", "session__title", "created_at"
+        )
+    }
+    results = []
+    for message_id, rank, query_snippet, response_snippet in hits:
+        row = meta.get(message_id)
+        if row is None:  # deleted between the two queries
+            continue
+        results.append({
+            "message_id": message_id,
+            "session_id": str(row["session_id"]) if row["session_id"] else None,
+            "session_title": row["session__title"],
+            "created_at": row["created_at"],
+            "rank": round(float(rank or 0), 4),
+            "query_snippet": _mark(query_snippet),
+            "response_snippet": _mark(response_snippet),
+        })
+    return results
@@ -0,0 +1,547 @@
+"""Resumable chat streams.
+
+A streamed turn runs detached from the HTTP response: on a worker thread
+under WSGI, on its own task under ASGI. Every event it produces is appended
+to a ``StreamLog`` with a monotonically increasing id, and the response only
+tails that log. If the browser drops the connection, the generation carries
+on. It checkpoints the text generated so far to ``ChatMessage.response``
+every ``CHATBOT_STREAM_CHECKPOINT_CHARS`` characters or
+``CHATBOT_STREAM_CHECKPOINT_SECONDS``, and the resume endpoint replays the
+events after ``Last-Event-ID`` before attaching to the live stream. Nothing
+is generated twice.
+
+``request_cancel`` stops a turn early: it sets a flag in the Django cache,
+which the generation polls every ``CHATBOT_STREAM_CANCEL_POLL_SECONDS``.
+With the shared Redis cache (``REDIS_URL``) a cancel that reaches any
+worker process is seen there; with the process-local LocMem fallback, only
+a cancel that reaches the generating process takes effect. When the
+generation runs in the same process, the upstream stream is also closed (or
+the task cancelled) right away. The partial answer is then saved with
+status ``cancelled``.
+
+Under WSGI at most ``CHATBOT_STREAM_WORKERS`` generations run per process,
+one per stream-pool thread. Set it to the server's threads per worker
+process (gunicorn ``--threads``), since each open stream also holds a
+request thread while it tails its log. A new stream that finds every slot
+taken is refused with 503 (``reserve_stream_slot``) rather than queued
+behind the others with no ``meta`` event and a quota slot held.
+
+When a worker process exits gracefully, Python waits for the pool's running
+generations to finish. If the process is killed before that, the message
+row stays ``partial``. While a process is alive it touches
+``ChatMessage.heartbeat_at`` on its generating rows every
+``CHATBOT_STREAM_HEARTBEAT_SECONDS``, including through long reasoning and
+tool phases that add no text. The first resume that finds no live log and
+sees neither text nor heartbeat change for ``CHATBOT_RESUME_STALE_SECONDS``
+marks the row failed (``stream_interrupted``) and reports the error. Final
+saves only apply to rows that are still ``partial``, so a generation never
+overwrites that verdict, and the verdict never overwrites a finished turn.
+
+Logs are kept in the process that runs the generation, for
+``CHATBOT_STREAM_LOG_TTL_SECONDS`` after the turn ends. A resume that
+reaches another process (no sticky sessions) or arrives later falls back to
+the message row. The client gets a ``snapshot`` of the checkpointed text,
+then the checkpoints that follow as ``token`` events, then ``done``.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from myapp.chatbot_models import ChatMessage
+
+from .sse_coalescer import SSECoalescer, sse_frame
+from .usage_quota import uses_process_local_cache
+
+
+logger = logging.getLogger(__name__)
+
+STREAM_WORKERS = int(os.getenv("CHATBOT_STREAM_WORKERS", "16"))
+LOG_TTL_SECONDS = float(os.getenv("CHATBOT_STREAM_LOG_TTL_SECONDS", "300"))
+CHECKPOINT_CHARS = int(os.getenv("CHATBOT_STREAM_CHECKPOINT_CHARS", "400"))
+CHECKPOINT_SECONDS = float(os.getenv("CHATBOT_STREAM_CHECKPOINT_SECONDS", "2"))
+KEEPALIVE_SECONDS = float(os.getenv("CHATBOT_SSE_KEEPALIVE_SECONDS", "15"))
+# Checkpoint polling for resumes served from the message row.
+RESUME_POLL_SECONDS = float(os.getenv("CHATBOT_RESUME_POLL_SECONDS", "0.5"))
+RESUME_STALE_SECONDS = float(os.getenv("CHATBOT_RESUME_STALE_SECONDS", "60"))
+CANCEL_POLL_SECONDS = float(os.getenv("CHATBOT_STREAM_CANCEL_POLL_SECONDS", "0.25"))
+HEARTBEAT_SECONDS = float(os.getenv("CHATBOT_STREAM_HEARTBEAT_SECONDS", "15"))
+CANCEL_CACHE_PREFIX = "chat_stream_cancel"
+
+KEEPALIVE_FRAME = ": keepalive\n\n"
+
+_stream_pool = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="chat-stream")
+# One slot per pool thread, so an admitted generation never waits in the
+# executor queue.
+_stream_slots = threading.BoundedSemaphore(STREAM_WORKERS)
+
+StreamEvent = Tuple[int, str, Dict]
+
+
+class StreamLog:
+    """Append-only event log of one streamed turn; ids start at 1."""
+
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+        self.events: List[StreamEvent] = []
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # Cleared once the answer is complete, so a late cancel cannot
+        # interrupt persisting it.
+        self.cancellable = True
+        self._cancel = threading.Event()
+        self._cancel_handlers: List[Callable[[], None]] = []
+        self._cancel_checked_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def append(self, event: str, data: Dict) -> int:
+        with self._cond:
+            event_id = len(self.events) + 1
+            self.events.append((event_id, event, data))
+            self._notify()
+        return event_id
+
+    def finish(self) -> None:
+        with self._cond:
+            self.finished = True
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed.
+                pass
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def on_cancel(self, handler: Callable[[], None]) -> None:
+        """Register a callback that aborts the generation (closes upstream, cancels a task)."""
+        self._cancel_handlers.append(handler)
+        if self._cancel.is_set() and self.cancellable:
+            handler()
+
+    def cancel(self) -> None:
+        """Abort from another thread; runs the registered handlers."""
+        self._cancel.set()
+        if not self.cancellable:
+            return
+        for handler in list(self._cancel_handlers):
+            try:
+                handler()
+            except Exception:
+                logger.warning("Chat stream cancel handler failed for message %s", self.message_id, exc_info=True)
+
+    def _poll_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._cancel_checked_at < CANCEL_POLL_SECONDS:
+            return False
+        self._cancel_checked_at = now
+        return True
+
+    def cancelled(self) -> bool:
+        """Called by the generation itself; also sees cancels requested in other processes."""
+        if not self._cancel.is_set() and self._poll_due() and cache.get(_cancel_key(self.message_id)):
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    async def acancelled(self) -> bool:
+        """``cancelled`` for generations on the event loop; polls the cache without blocking it."""
+        if not self._cancel.is_set() and self._poll_due() and await cache.aget(_cancel_key(self.message_id)):
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    def since(self, last_id: int) -> Tuple[List[StreamEvent], bool]:
+        with self._cond:
+            return self.events[max(0, last_id):], self.finished
+
+    def wait(self, last_id: int, timeout: Optional[float]) -> Tuple[List[StreamEvent], bool]:
+        """Events after ``last_id``, blocking up to ``timeout`` for the next one."""
+        with self._cond:
+            if len(self.events) <= last_id and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[max(0, last_id):], self.finished
+
+    async def await_since(self, last_id: int, timeout: Optional[float]) -> Tuple[List[StreamEvent], bool]:
+        """Async ``wait``; safe while the writer runs on another thread or loop."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            if len(self.events) > last_id or self.finished:
+                return self.events[max(0, last_id):], self.finished
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+        return self.since(last_id)
+
+
+_logs: Dict[int, StreamLog] = {}
+_logs_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+
+
+def _purge_expired() -> None:
+    cutoff = time.monotonic() - LOG_TTL_SECONDS
+    for message_id, log in list(_logs.items()):
+        if log.finished and log.finished_at < cutoff:
+            del _logs[message_id]
+
+
+def open_stream_log(message_id: int) -> StreamLog:
+    global _heartbeat
+    with _logs_lock:
+        _purge_expired()
+        log = _logs[message_id] = StreamLog(message_id)
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_heartbeat_loop, daemon=True, name="chat-stream-heartbeat")
+            _heartbeat.start()
+    return log
+
+
+def _heartbeat_loop() -> None:
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        close_old_connections()
+        try:
+            touch_live_messages()
+        except Exception:
+            logger.warning("Chat stream heartbeat failed", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+def touch_live_messages() -> int:
+    """Mark the messages this process is still generating as alive; returns the rows touched."""
+    with _logs_lock:
+        message_ids = [message_id for message_id, log in _logs.items() if not log.finished]
+    if not message_ids:
+        return 0
+    return ChatMessage.objects.filter(pk__in=message_ids, status="partial").update(heartbeat_at=timezone.now())
+
+
+def get_stream_log(message_id: int) -> Optional[StreamLog]:
+    with _logs_lock:
+        _purge_expired()
+        return _logs.get(message_id)
+
+
+def _cancel_key(message_id: int) -> str:
+    return f"{CANCEL_CACHE_PREFIX}:{message_id}"
+
+
+def request_cancel(message_id: int) -> bool:
+    """Ask the generation of ``message_id`` to stop; ``True`` if it runs in this process.
+
+    Generations in other processes see the cache flag only when the cache
+    is shared (see ``usage_quota.uses_process_local_cache``).
+    """
+    cache.set(_cancel_key(message_id), True, timeout=int(LOG_TTL_SECONDS) + 60)
+    log = get_stream_log(message_id)
+    if log is None or log.finished:
+        if log is None and uses_process_local_cache():
+            logger.warning(
+                "Cancel for chat message %s may not reach its generation: the cache is process-local",
+                message_id,
+            )
+        return False
+    log.cancel()
+    return True
+
+
+class TextCheckpointer:
+    """Saves the answer generated so far to the message row in batches."""
+
+    def __init__(self, message_id: int, chunks: List[str]):
+        self.message_id = message_id
+        self.chunks = chunks
+        self._pending_chars = 0
+        self._last_saved = time.monotonic()
+
+    def due(self, added_chars: int) -> bool:
+        self._pending_chars += added_chars
+        return (
+            self._pending_chars >= CHECKPOINT_CHARS
+            or time.monotonic() - self._last_saved >= CHECKPOINT_SECONDS
+        )
+
+    def _reset(self) -> None:
+        self._pending_chars = 0
+        self._last_saved = time.monotonic()
+
+    def save(self) -> None:
+        ChatMessage.objects.filter(pk=self.message_id, status="partial").update(
+            response="".join(self.chunks), heartbeat_at=timezone.now()
+        )
+        self._reset()
+
+    async def asave(self) -> None:
+        await ChatMessage.objects.filter(pk=self.message_id, status="partial").aupdate(
+            response="".join(self.chunks), heartbeat_at=timezone.now()
+        )
+        self._reset()
+
+
+def _final_values(message: ChatMessage, update_fields: List[str]) -> Dict:
+    return {field: getattr(message, field) for field in update_fields}
+
+
+def save_final(message: ChatMessage, update_fields: List[str]) -> bool:
+    """Persist the end state of a streamed turn unless the row already left ``partial``.
+
+    ``False`` means a resume elsewhere judged the generation dead and marked
+    the row interrupted first; that verdict is kept.
+    """
+    saved = ChatMessage.objects.filter(pk=message.pk, status="partial").update(
+        **_final_values(message, update_fields)
+    )
+    if not saved:
+        logger.warning("Chat message %s was finalized elsewhere; not saving its stream result", message.pk)
+    return bool(saved)
+
+
+async def asave_final(message: ChatMessage, update_fields: List[str]) -> bool:
+    saved = await ChatMessage.objects.filter(pk=message.pk, status="partial").aupdate(
+        **_final_values(message, update_fields)
+    )
+    if not saved:
+        logger.warning("Chat message %s was finalized elsewhere; not saving its stream result", message.pk)
+    return bool(saved)
+
+
+def reserve_stream_slot() -> bool:
+    """Claim a stream-pool thread for a new generation; ``False`` when all are busy."""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot() -> None:
+    """Give back a slot whose generation was never started."""
+    _stream_slots.release()
+
+
+def run_stream_in_background(log: StreamLog, generate: Callable[[], None]) -> None:
+    """Run a sync generation on a slot from ``reserve_stream_slot``; the log is finished when it returns."""
+
+    def run():
+        close_old_connections()
+        try:
+            generate()
+        except Exception:
+            logger.exception("Chat stream generation failed for message %s", log.message_id)
+        finally:
+            log.finish()
+            _stream_slots.release()
+            close_old_connections()
+
+    _stream_pool.submit(run)
+
+
+def start_stream_task(log: StreamLog, generate: Callable) -> None:
+    """Run an async generation as a task that outlives the request.
+
+    The task gets a fresh context with its own thread-sensitive executor,
+    so its ORM calls do not depend on the request's executor, which Django
+    shuts down when the response ends.
+    """
+
+    async def run():
+        async with ThreadSensitiveContext():
+            try:
+                await generate()
+            except Exception:
+                logger.exception("Chat stream generation failed for message %s", log.message_id)
+            finally:
+                log.finish()
+                await sync_to_async(close_old_connections)()
+
+    loop = asyncio.get_running_loop()
+    log.task = loop.create_task(run(), context=contextvars.Context())
+    log.on_cancel(lambda: loop.call_soon_threadsafe(log.task.cancel))
+
+
+def tail_stream_log(log: StreamLog, last_id: int = 0):
+    """SSE body for the events after ``last_id``, following the log until the turn ends."""
+    coalescer = SSECoalescer()
+    while True:
+        due = coalescer.seconds_until_flush()
+        events, finished = log.wait(last_id, KEEPALIVE_SECONDS if due is None else due)
+        for event_id, event, data in events:
+            chunk = coalescer.push(event, data, event_id)
+            if chunk:
+                yield chunk
+        if events:
+            last_id = events[-1][0]
+        elif finished:
+            chunk = coalescer.flush()
+            if chunk:
+                yield chunk
+            return
+        elif due is None:
+            yield KEEPALIVE_FRAME
+        else:
+            chunk = coalescer.flush()
+            if chunk:
+                yield chunk
+
+
+async def atail_stream_log(log: StreamLog, last_id: int = 0):
+    coalescer = SSECoalescer()
+    while True:
+        due = coalescer.seconds_until_flush()
+        events, finished = await log.await_since(last_id, KEEPALIVE_SECONDS if due is None else due)
+        for event_id, event, data in events:
+            chunk = coalescer.push(event, data, event_id)
+            if chunk:
+                yield chunk
+        if events:
+            last_id = events[-1][0]
+        elif finished:
+            chunk = coalescer.flush()
+            if chunk:
+                yield chunk
+            return
+        elif due is None:
+            yield KEEPALIVE_FRAME
+        else:
+            chunk = coalescer.flush()
+            if chunk:
+                yield chunk
+
+
+_CHECKPOINT_FIELDS = (
+    "response",
+    "status",
+    "source",
+    "function_calls",
+    "reasoning_trace",
+    "model_name",
+    "token_count_input",
+    "token_count_output",
+    "error_code",
+    "timings",
+)
+
+
+def _checkpoint_frames(row: Dict, sent_text: Optional[str]) -> Tuple[List[str], str, bool]:
+    """Frames that bring a client from ``sent_text`` to the row's state."""
+    frames = []
+    text = row["response"] or ""
+    if sent_text is None or (text != sent_text and not text.startswith(sent_text)):
+        frames.append(sse_frame("snapshot", {"text": text}))
+    elif text != sent_text:
+        frames.append(sse_frame("token", {"text": text[len(sent_text):]}))
+    status = row["status"]
+    if status == "cancelled":
+        frames.append(sse_frame("cancelled", {"response": text}))
+    elif status == "completed":
+        frames.append(sse_frame("done", {
+            "function_calls": row["function_calls"],
+            "source": row["source"],
+            "warning": None,
+            "response": text,
+            "reasoning_trace": row["reasoning_trace"],
+            "model_name": row["model_name"],
+            "timings": row["timings"],
+            "token_count_input": row["token_count_input"],
+            "token_count_output": row["token_count_output"],
+        }))
+    elif status != "partial":
+        code = "quota_exceeded" if row["error_code"] == "quota_exceeded" else "upstream_error"
+        frames.append(sse_frame("error", {"code": code, "message": "Chatbot stream failed. Please try again."}))
+    return frames, text, status != "partial"
+
+
+def _mark_interrupted(message_id: int) -> None:
+    ChatMessage.objects.filter(pk=message_id, status="partial").update(
+        status="error",
+        error_code="stream_interrupted",
+        error_message="Generation stopped without finishing (worker process exited).",
+    )
+
+
+def _stale_frame() -> str:
+    return sse_frame(
+        "error",
+        {"code": "stream_unavailable", "message": "The answer stopped updating. Please ask again."},
+    )
+
+
+def checkpoint_stream(message_id: int, meta: Dict):
+    """SSE body for a resume without a live log: replay and follow the message row."""
+    yield sse_frame("meta", meta)
+    sent_text = None
+    heartbeat = None
+    last_change = last_write = time.monotonic()
+    while True:
+        row = ChatMessage.objects.filter(pk=message_id).values(*_CHECKPOINT_FIELDS, "heartbeat_at").first()
+        if row is None:
+            return
+        frames, text, finished = _checkpoint_frames(row, sent_text)
+        now = time.monotonic()
+        if text != sent_text or row["heartbeat_at"] != heartbeat:
+            last_change = now
+        sent_text, heartbeat = text, row["heartbeat_at"]
+        if frames:
+            last_write = now
+            yield "".join(frames)
+        if finished:
+            return
+        if now - last_change >= RESUME_STALE_SECONDS:
+            _mark_interrupted(message_id)
+            yield _stale_frame()
+            return
+        if now - last_write >= KEEPALIVE_SECONDS:
+            last_write = now
+            yield KEEPALIVE_FRAME
+        time.sleep(RESUME_POLL_SECONDS)
+
+
+async def acheckpoint_stream(message_id: int, meta: Dict):
+    yield sse_frame("meta", meta)
+    sent_text = None
+    heartbeat = None
+    last_change = last_write = time.monotonic()
+    while True:
+        row = await ChatMessage.objects.filter(pk=message_id).values(*_CHECKPOINT_FIELDS, "heartbeat_at").afirst()
+        if row is None:
+            return
+        frames, text, finished = _checkpoint_frames(row, sent_text)
+        now = time.monotonic()
+        if text != sent_text or row["heartbeat_at"] != heartbeat:
+            last_change = now
+        sent_text, heartbeat = text, row["heartbeat_at"]
+        if frames:
+            last_write = now
+            yield "".join(frames)
+        if finished:
+            return
+        if now - last_change >= RESUME_STALE_SECONDS:
+            await sync_to_async(_mark_interrupted)(message_id)
+            yield _stale_frame()
+            return
+        if now - last_write >= KEEPALIVE_SECONDS:
+            last_write = now
+            yield KEEPALIVE_FRAME
+        await asyncio.sleep(RESUME_POLL_SECONDS)
@@ -0,0 +1,133 @@
+"""Single-transaction gamification event pipeline.
+
+A request collects the gamification events it produced (content completed,
+course completed, assignment passed, ...) and hands them to
+``apply_gamification_events``. All stat deltas are folded into a single
+``F()``-expression UPDATE on ``UserStats``, ``DailyActivity`` is upserted
+once, XP ledger rows are bulk-inserted and badges are evaluated, all inside
+one transaction.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from myapp.models import Badge, DailyActivity, UserStats, XPTransaction
+
+from .badge_engine import COMPLETION, ENGAGEMENT, PERFORMANCE, STREAK, badge_engine
+
+
+STAT_COUNTERS = (
+    'courses_completed',
+    'assignments_completed',
+    'perfect_scores',
+    'reviews_written',
+)
+
+
+@dataclass
+class GamificationEvent:
+    """One gamification-relevant thing that happened during a request.
+
+    ``activity`` marks events that count as learning activity for the day:
+    they are added to ``DailyActivity`` and advance the streak.
+    """
+
+    source: Optional[str] = None
+    xp: int = 0
+    description: str = ""
+    activity: bool = False
+    content_completed: int = 0
+    assignments_completed: int = 0
+    courses_completed: int = 0
+    perfect_scores: int = 0
+    reviews_written: int = 0
+    time_spent_seconds: int = 0
+
+    def changed_stats(self) -> List[str]:
+        changed = []
+        if self.activity:
+            changed.append(STREAK)
+        if self.courses_completed:
+            changed.append(COMPLETION)
+        if self.perfect_scores:
+            changed.append(PERFORMANCE)
+        if self.reviews_written:
+            changed.append(ENGAGEMENT)
+        return changed
+
+
+def _update_or_insert(model, lookup: Dict, updates: Dict) -> None:
+    """UPDATE the row matching ``lookup``; create it first if it is missing."""
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup)
+    except IntegrityError:
+        # Created concurrently by another request; fall through to the update.
+        pass
+    model.objects.filter(**lookup).update(**updates)
+
+
+def _apply_events(user, events: List[GamificationEvent], today: date) -> None:
+    xp_total = sum(event.xp for event in events)
+    activity_events = [event for event in events if event.activity]
+
+    updates = {}
+    if xp_total:
+        updates['total_xp'] = F('total_xp') + xp_total
+        updates.update(UserStats.level_expressions(F('total_xp') + xp_total))
+    for counter in STAT_COUNTERS:
+        delta = sum(getattr(event, counter) for event in events)
+        if delta:
+            updates[counter] = F(counter) + delta
+    learning_seconds = sum(event.time_spent_seconds for event in events)
+    if learning_seconds:
+        updates['total_learning_seconds'] = F('total_learning_seconds') + learning_seconds
+    if activity_events:
+        updates.update(UserStats.streak_expressions(today))
+    if updates:
+        _update_or_insert(UserStats, {'user': user}, updates)
+
+    if activity_events:
+        daily_updates = {
+            field: F(field) + sum(getattr(event, field) for event in activity_events)
+            for field in ('content_completed', 'assignments_completed', 'time_spent_seconds')
+        }
+        daily_updates['xp_earned'] = F('xp_earned') + sum(event.xp for event in activity_events)
+        _update_or_insert(DailyActivity, {'user': user, 'date': today}, daily_updates)
+
+    ledger = [
+        XPTransaction(user=user, amount=event.xp, source=event.source, description=event.description[:200])
+        for event in events
+        if event.xp and event.source
+    ]
+    if ledger:
+        XPTransaction.objects.bulk_create(ledger)
+
+
+def apply_gamification_events(
+    user, events: Iterable[GamificationEvent]
+) -> Tuple[UserStats, List[Badge]]:
+    """Apply a request's events atomically and return fresh stats and new badges."""
+    events = [event for event in events if event is not None]
+    today = date.today()
+    with transaction.atomic():
+        _apply_events(user, events, today)
+        stats, _ = UserStats.objects.get_or_create(user=user)
+
+        changed = sorted({stat for event in events for stat in event.changed_stats()})
+        newly_earned = badge_engine.evaluate(user, stats, changed=changed) if changed else []
+        badge_events = [
+            GamificationEvent(source='badge', xp=badge.xp_reward, description=f'Earned badge: {badge.name}')
+            for badge in newly_earned
+            if badge.xp_reward > 0
+        ]
+        if badge_events:
+            _apply_events(user, badge_events, today)
+            stats.refresh_from_db()
+    return stats, newly_earned
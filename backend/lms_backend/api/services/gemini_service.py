@@ -1,60 +1,109 @@
+import hashlib
 import json
+import logging
 import os
 import re
-from typing import Dict, Generator, List, Optional, Tuple
-from openai import OpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import AsyncGenerator, Callable, Dict, Generator, List, Optional, Tuple
 
-from .postgres_functions import PostgreSQLFunctions
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+
+from .intent_router import RouteDecision, get_intent_router, log_misroute
+from .llm_client import ChatbotConfigurationError, llm_model_name
 from .prompt_builder import PromptBuilder
-from .tool_registry import ChatTool, build_tool_registry
+from .provider_pool import Backend, CompletionStream, ProviderUnavailable, get_provider_pool
+from .token_budget import ContextBudget, count_tokens, fit_json, fit_lines, truncate_tokens
+from .tool_registry import CACHE_HIT, ChatTool, call_tool, get_tool_registry
+
+
+logger = logging.getLogger(__name__)
+
+TOOL_TIMEOUT_SECONDS = float(os.getenv("CHATBOT_TOOL_TIMEOUT_SECONDS", "5"))
+TOOL_WORKERS = int(os.getenv("CHATBOT_TOOL_WORKERS", "8"))
+# Shared across requests so concurrent chat turns cannot open unbounded
+# threads (and DB connections) between them.
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="chat-tool")
+# Tools that timed out but are still occupying a pool thread.
+_overrunning = 0
+_overrunning_lock = threading.Lock()
+
+RESPONSE_CACHE_PREFIX = "chat_response"
+RESPONSE_CACHE_TTL = int(os.getenv("CHATBOT_RESPONSE_CACHE_TTL", "600"))
+
 
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
 
-class ChatbotConfigurationError(RuntimeError):
-    pass
+
+def _generation_timings(requested: float, first_token: Optional[float], finished: float, output_tokens) -> Dict:
+    """Time to first token, generation time after it, and output tokens per second."""
+    if first_token is None:
+        return {"ttft_ms": None, "generation_ms": None, "tokens_per_second": None}
+    generation = finished - first_token
+    return {
+        "ttft_ms": round((first_token - requested) * 1000, 1),
+        "generation_ms": round(generation * 1000, 1),
+        "tokens_per_second": round(output_tokens / generation, 1) if output_tokens and generation > 0 else None,
+    }
 
 
 class CerebrasChatbotService:
     """Role-aware chatbot service with tool routing, memory, and streaming."""
 
     def __init__(self):
-        self.model_name = os.getenv("CEREBRAS_MODEL", "zai-glm-4.7")
-        self.api_key = (
-            os.getenv("CEREBRAS_API_KEY", "").strip()
-            or os.getenv("CEREBRAS_ROUTER_API_KEY", "").strip()
-            or os.getenv("CEREBRAS_ROUTER_KEY", "").strip()
-            or os.getenv("CEREBRAS_KEY", "").strip()
-        )
-        self.base_url = os.getenv("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1").strip()
+        self.model_name = llm_model_name("zai-glm-4.7")
         self.temperature = float(os.getenv("CHATBOT_TEMPERATURE", "1.0"))
         self.top_p = float(os.getenv("CHATBOT_TOP_P", "0.95"))
-        self.max_completion_tokens = int(os.getenv("CHATBOT_MAX_COMPLETION_TOKENS", "128000"))
-        if not self.api_key:
-            raise ChatbotConfigurationError(
-                "Cerebras API key is not configured. Set one of: "
-                "CEREBRAS_API_KEY, CEREBRAS_ROUTER_API_KEY, CEREBRAS_ROUTER_KEY, CEREBRAS_KEY."
-            )
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        self.db = PostgreSQLFunctions()
+        self.max_completion_tokens = int(os.getenv("CHATBOT_MAX_COMPLETION_TOKENS", "8192"))
+        # The provider pool, prompt templates and the tool registry are
+        # process-wide, so building a service per request costs no
+        # connections or file reads.
+        self.pool = get_provider_pool("zai-glm-4.7")
         self.prompt_builder = PromptBuilder()
-        self.registry = build_tool_registry(self.db)
+        self.registry = get_tool_registry()
+        self.router = get_intent_router()
 
     @staticmethod
-    def _token_estimate(text: str) -> int:
-        # Lightweight estimate for reporting only.
-        return max(1, len((text or "").split()))
+    def _token_counts(usage, system_prompt: str, payload: str, output_text: str) -> Dict:
+        """Provider-reported usage when available, tokenizer counts otherwise."""
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        return {
+            "token_count_input": (
+                prompt_tokens if prompt_tokens is not None
+                else count_tokens(system_prompt) + count_tokens(payload)
+            ),
+            "token_count_output": (
+                completion_tokens if completion_tokens is not None else count_tokens(output_text)
+            ),
+        }
 
     @staticmethod
-    def _compact_memory(memory_messages: List[Dict], limit: int = 10) -> str:
-        recent = memory_messages[-max(0, limit):]
+    def _compact_memory(memory_messages: List[Dict], limit: int = 10, max_tokens: int = 1200) -> str:
+        """Session summary plus recent turns, newest kept first, within ``max_tokens``."""
+        summary = next((item["summary"] for item in memory_messages if item.get("summary")), "")
+        turns = [item for item in memory_messages if not item.get("summary")]
+        recent = turns[-max(0, limit):]
         lines: List[str] = []
         for item in recent:
             user_text = (item.get("query") or "").replace("\n", " ").strip()
             assistant_text = (item.get("response") or "").replace("\n", " ").strip()
             if user_text:
-                lines.append(f"User: {user_text[:260]}")
+                lines.append(f"User: {truncate_tokens(user_text, 80)}")
             if assistant_text:
-                lines.append(f"Assistant: {assistant_text[:260]}")
-        return "\n".join(lines)
+                lines.append(f"Assistant: {truncate_tokens(assistant_text, 120)}")
+        if not summary:
+            return "\n".join(fit_lines(lines, max_tokens))
+        # The summary gets up to half the budget; recent turns fill the rest.
+        summary_line = truncate_tokens(
+            "Summary of earlier conversation: " + " ".join(summary.split()), max_tokens // 2
+        )
+        remaining = max_tokens - count_tokens(summary_line) - 1
+        return "\n".join(([summary_line] if summary_line else []) + fit_lines(lines, remaining))
 
     def _capability_manifest(self, role: str) -> List[str]:
         items = []
@@ -113,122 +162,166 @@ class CerebrasChatbotService:
     def _available_tools(self, role: str) -> Dict[str, ChatTool]:
         return {name: tool for name, tool in self.registry.items() if role in tool.roles}
 
-    def _call_tool(
-        self,
+    @staticmethod
+    def _plan_tool(
         available_tools: Dict[str, ChatTool],
         tool_name: str,
         args: Dict,
+        planned: List[Tuple[ChatTool, Dict]],
+    ) -> None:
+        tool = available_tools.get(tool_name)
+        if tool:
+            planned.append((tool, args))
+
+    @staticmethod
+    def _run_tool(tool: ChatTool, args: Dict) -> Tuple[object, Optional[str], float]:
+        # Pool threads keep their own DB connection; recycle it per task so
+        # CONN_MAX_AGE and broken-connection handling still apply.
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if connection.vendor == "postgresql":
+                    # Cancel the tool's queries server-side once the caller
+                    # has given up, so a hung query frees its pool thread.
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT set_config('statement_timeout', %s, true)",
+                            [str(max(1, int(TOOL_TIMEOUT_SECONDS * 1000)))],
+                        )
+                result, cache_status = call_tool(tool, args)
+        finally:
+            close_old_connections()
+        return result, cache_status, (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _abandon_tool(tool: ChatTool, future, submitted: float) -> None:
+        """Cancel a timed-out tool; if it is already running, log until it finally returns."""
+        global _overrunning
+        if future.cancel():
+            return
+        with _overrunning_lock:
+            _overrunning += 1
+            overrunning = _overrunning
+        logger.warning(
+            "Chatbot tool %s timed out and is still running (%d of %d tool workers busy with timed-out tools)",
+            tool.name, overrunning, TOOL_WORKERS,
+        )
+
+        def finished(_future):
+            global _overrunning
+            with _overrunning_lock:
+                _overrunning -= 1
+            logger.warning("Timed-out chatbot tool %s finished after %.1fs", tool.name, time.perf_counter() - submitted)
+
+        future.add_done_callback(finished)
+
+    def _run_tools(
+        self,
+        planned: List[Tuple[ChatTool, Dict]],
         context_data: Dict,
         function_calls: List[Dict],
+        reasoning_trace: List[Dict],
+        timings: Optional[Dict] = None,
     ) -> None:
-        tool = available_tools.get(tool_name)
-        if not tool:
+        """Run the planned tools concurrently; drop any that fail or time out."""
+        if not planned:
             return
-        result = tool.fn(**args)
-        context_data[tool_name] = result
-        function_calls.append({"name": tool_name, "args": args})
+        submitted = time.perf_counter()
+        futures = [_tool_pool.submit(self._run_tool, tool, args) for tool, args in planned]
+        wait(futures, timeout=TOOL_TIMEOUT_SECONDS)
+        tool_timings = timings.setdefault("tool_ms", {}) if timings is not None else {}
+        for (tool, args), future in zip(planned, futures):
+            if not future.done():
+                self._abandon_tool(tool, future, submitted)
+                tool_timings[tool.name] = None
+                reasoning_trace.append({
+                    "stage": "tool",
+                    "text": f"{tool.name} timed out after {TOOL_TIMEOUT_SECONDS:g}s and was skipped.",
+                })
+                continue
+            try:
+                result, cache_status, elapsed_ms = future.result()
+            except Exception:
+                logger.exception("Chatbot tool %s failed", tool.name)
+                reasoning_trace.append({"stage": "tool", "text": f"{tool.name} failed and was skipped."})
+                continue
+            tool_timings[tool.name] = round(elapsed_ms, 1)
+            context_data[tool.name] = result
+            call = {"name": tool.name, "args": args}
+            if cache_status:
+                call["cache"] = cache_status
+            function_calls.append(call)
+            cached = " (cached)" if cache_status == CACHE_HIT else ""
+            reasoning_trace.append({
+                "stage": "tool",
+                "text": f"{tool.name} returned in {elapsed_ms:.0f} ms{cached}.",
+                "duration_ms": round(elapsed_ms, 1),
+            })
+
+    def _tool_args(self, tool_name: str, query: str, user_context: Dict) -> Dict:
+        user_id = int(user_context.get("user_id"))
+        if tool_name == "get_top_courses_by_rating":
+            return {"limit": 8, "min_reviews": 1}
+        if tool_name == "get_courses_by_filters":
+            filters = self._extract_course_filters(query)
+            args = {k: v for k, v in filters.items() if v is not None}
+            args.setdefault("limit", 8)
+            return args
+        if tool_name == "get_courses_by_goal":
+            return {
+                "goal": self._extract_goal(query) or query[:80],
+                "skill_level": user_context.get("skill_level"),
+                "budget": None,
+                "limit": 6,
+            }
+        if tool_name == "search_course_material":
+            return {"user_id": user_id, "query": query[:300], "limit": 5}
+        if tool_name == "get_student_progress_summary":
+            return {"user_id": user_id}
+        if tool_name == "get_teacher_course_performance":
+            return {"teacher_id": user_id}
+        if tool_name == "get_admin_progress_leaderboard":
+            return {"limit": 10}
+        if tool_name == "get_admin_course_risk_report":
+            return {"limit": 10, "min_enrollments": 2}
+        return {}
+
+    @staticmethod
+    def _is_empty_result(result) -> bool:
+        if not result:
+            return True
+        if isinstance(result, dict):
+            containers = [value for value in result.values() if isinstance(value, (list, dict))]
+            return bool(containers) and len(containers) == len(result) and not any(containers)
+        return False
 
     def _route_tools(
         self,
         query: str,
         role: str,
         user_context: Dict,
+        timings: Optional[Dict] = None,
+        route: Optional[RouteDecision] = None,
     ) -> Tuple[Dict, List[Dict], List[Dict]]:
-        q = query.lower()
         context_data: Dict = {}
         function_calls: List[Dict] = []
         reasoning_trace: List[Dict] = []
         available_tools = self._available_tools(role)
+        planned: List[Tuple[ChatTool, Dict]] = []
 
-        reasoning_trace.append({"stage": "intent", "text": "Parsed request intent and selected relevant tools."})
-
-        if any(token in q for token in ["best", "top", "rating", "highest rated"]):
-            self._call_tool(
-                available_tools,
-                "get_top_courses_by_rating",
-                {"limit": 8, "min_reviews": 1},
-                context_data,
-                function_calls,
-            )
-
-        if any(token in q for token in ["course", "recommend", "suggest", "catalog", "find", "search"]):
-            filters = self._extract_course_filters(query)
-            args = {k: v for k, v in filters.items() if v is not None}
-            args.setdefault("limit", 8)
-            self._call_tool(
-                available_tools,
-                "get_courses_by_filters",
-                args,
-                context_data,
-                function_calls,
-            )
-
-        if any(token in q for token in ["goal", "roadmap", "learn", "master"]):
-            goal = self._extract_goal(query) or query[:80]
-            self._call_tool(
-                available_tools,
-                "get_courses_by_goal",
-                {
-                    "goal": goal,
-                    "skill_level": user_context.get("skill_level"),
-                    "budget": None,
-                    "limit": 6,
-                },
-                context_data,
-                function_calls,
-            )
+        route = route or self.router.route(query, role)
+        reasoning_trace.append({"stage": "intent", "text": route.summary()})
+        for tool_name in route.selected_tools:
+            if tool_name in available_tools:
+                self._plan_tool(available_tools, tool_name, self._tool_args(tool_name, query, user_context), planned)
 
-        user_id = int(user_context.get("user_id"))
-        if role == "student" and any(
-            token in q for token in ["my progress", "my course", "my enroll", "completion"]
-        ):
-            self._call_tool(
-                available_tools,
-                "get_student_progress_summary",
-                {"user_id": user_id},
-                context_data,
-                function_calls,
-            )
-        elif role == "teacher" and any(
-            token in q for token in ["my course", "my class", "my students", "performance", "enrollment"]
-        ):
-            self._call_tool(
-                available_tools,
-                "get_teacher_course_performance",
-                {"teacher_id": user_id},
-                context_data,
-                function_calls,
-            )
-        elif role == "admin":
-            if any(token in q for token in [
-                "platform", "overview", "dashboard", "snapshot", "stats",
-                "total", "how many", "count", "number of",
-                "students", "teachers", "users", "enrollments",
-                "courses",
-            ]):
-                self._call_tool(
-                    available_tools,
-                    "get_platform_snapshot",
-                    {},
-                    context_data,
-                    function_calls,
-                )
-            if any(token in q for token in ["top students", "leaderboard", "progressive"]):
-                self._call_tool(
-                    available_tools,
-                    "get_admin_progress_leaderboard",
-                    {"limit": 10},
-                    context_data,
-                    function_calls,
-                )
-            if any(token in q for token in ["risk", "drop", "low completion", "underperforming"]):
-                self._call_tool(
-                    available_tools,
-                    "get_admin_course_risk_report",
-                    {"limit": 10, "min_enrollments": 2},
-                    context_data,
-                    function_calls,
-                )
+        self._run_tools(planned, context_data, function_calls, reasoning_trace, timings)
+        for call in function_calls:
+            call["confidence"] = route.tool_confidence(call["name"])
+        log_misroute(route, empty_tools=[
+            call["name"] for call in function_calls if self._is_empty_result(context_data.get(call["name"]))
+        ])
 
         if function_calls:
             reasoning_trace.append(
@@ -275,10 +368,9 @@ class CerebrasChatbotService:
         self,
         role: str,
         user_context: Dict,
-        memory_messages: List[Dict],
+        memory_context: str,
     ) -> str:
         capability_manifest = self._capability_manifest(role)
-        memory_context = self._compact_memory(memory_messages, limit=10)
         return self.prompt_builder.build_system_prompt(
             role=role,
             user_context=user_context,
@@ -292,11 +384,16 @@ class CerebrasChatbotService:
         role: str,
         user_context: Dict,
         memory_messages: List[Dict],
+        timings: Optional[Dict] = None,
     ) -> Tuple[str, Dict, List[Dict], List[Dict], str]:
+        started = time.perf_counter()
+        timings = timings if timings is not None else {}
+        route = self.router.route(query, role)
         context_data, function_calls, reasoning_trace = self._route_tools(
-            query=query, role=role, user_context=user_context
+            query=query, role=role, user_context=user_context, timings=timings, route=route
         )
-        if any(token in query.lower() for token in ["roadmap", "master", "workflow", "how to learn"]):
+        timings["tools_ms"] = _elapsed_ms(started)
+        if "get_learning_roadmap" in route.selected_tools:
             topic = self._extract_goal(query) or query[:80]
             roadmap = self._learning_roadmap(
                 topic=topic,
@@ -312,27 +409,170 @@ class CerebrasChatbotService:
                         "level": str(user_context.get("skill_level") or "beginner"),
                         "duration_weeks": 8,
                     },
+                    "confidence": route.tool_confidence("get_learning_roadmap"),
                 }
             )
 
-        system_prompt = self._build_system_prompt(
-            role=role,
-            user_context=user_context,
-            memory_messages=memory_messages,
-        )
+        # Measure the fixed part of the system prompt first; any overflow is
+        # taken out of the memory and tool data budgets.
+        budget = ContextBudget.from_env()
+        system_prompt = self._build_system_prompt(role=role, user_context=user_context, memory_context="")
+        system_tokens = count_tokens(system_prompt)
+        memory_budget, tool_budget = budget.allocate(system_tokens)
+        memory_context = self._compact_memory(memory_messages, limit=10, max_tokens=memory_budget)
+        if memory_context:
+            system_prompt = self._build_system_prompt(
+                role=role, user_context=user_context, memory_context=memory_context
+            )
+        tool_text = fit_json(context_data, tool_budget)
+        query_text = truncate_tokens(query, budget.query)
+        reasoning_trace.append({
+            "stage": "budget",
+            "text": (
+                f"Prompt budget: system {system_tokens}, "
+                f"memory {count_tokens(memory_context)}/{memory_budget}, "
+                f"tools {count_tokens(tool_text)}/{tool_budget}, "
+                f"query {count_tokens(query_text)}/{budget.query} tokens."
+            ),
+        })
         payload = (
-            f"User query:\n{query}\n\n"
-            f"Tool/context data:\n{json.dumps(context_data, ensure_ascii=True)}\n\n"
+            f"User query:\n{query_text}\n\n"
+            f"Tool/context data:\n{tool_text}\n\n"
             "If asked who you are or what you can do, explain capabilities from capability manifest naturally. "
             "Provide concise, accurate, role-aware guidance. "
             "IMPORTANT: When mentioning a specific course or listing courses in a table, ALWAYS format the course title as a markdown link using its ID: `[Course Title](/app/courses/<id>)`."
         )
         reasoning_trace.append({"stage": "synthesis", "text": "Synthesizing final answer from context and role policy."})
+        timings["prompt_build_ms"] = round(_elapsed_ms(started) - timings["tools_ms"], 1)
         return system_prompt, context_data, function_calls, reasoning_trace + [
             {"stage": "prompt", "text": "Final prompt prepared for model generation."}
         ], payload
 
+    def _completion_kwargs(
+        self, backend: Backend, system_prompt: str, payload: str, show_reasoning: bool, stream: bool
+    ) -> Dict:
+        extra_body = {}
+        if backend.model == "zai-glm-4.7":
+            extra_body["disable_reasoning"] = not show_reasoning
+            extra_body["clear_thinking"] = False
+        elif backend.model == "gpt-oss-120b":
+            if not show_reasoning:
+                extra_body["reasoning_format"] = "hidden"
+        return {
+            "model": backend.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": payload},
+            ],
+            "stream": stream,
+            "max_completion_tokens": self.max_completion_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "extra_body": extra_body if extra_body else None,
+        }
 
+    @staticmethod
+    def _delta_parts(chunk) -> Tuple[Optional[str], Optional[str]]:
+        """Return (reasoning_text, content_text) carried by one stream chunk."""
+        choices = getattr(chunk, "choices", None) or []
+        if not choices:
+            return None, None
+        delta = getattr(choices[0], "delta", None)
+        if delta is None:
+            return None, None
+        return getattr(delta, "reasoning", None), getattr(delta, "content", None)
+
+    @staticmethod
+    def _stream_error(exc: Exception) -> RuntimeError:
+        msg = str(exc)
+        if "quota" in msg.lower() or "rate" in msg.lower() or "429" in msg:
+            return RuntimeError("Cerebras quota exceeded. Please try again later.")
+        return RuntimeError(f"Cerebras stream failed: {exc}")
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+    def _response_cache_key(
+        self,
+        query: str,
+        role: str,
+        user_context: Dict,
+        context_data: Dict,
+        memory_messages: List[Dict],
+    ) -> Optional[str]:
+        """Key for a reusable answer, or None when the turn must not be cached.
+
+        Turns with conversation memory depend on earlier messages, so only
+        first turns are cached. The tool context is hashed into the key, so a
+        change in the underlying data produces a different entry.
+        """
+        if RESPONSE_CACHE_TTL <= 0 or memory_messages:
+            return None
+        profile = [user_context.get(k) for k in ("preferred_category", "skill_level", "learning_goal")]
+        question = json.dumps([self._normalize_query(query), profile], default=str)
+        context = json.dumps(context_data, sort_keys=True, default=str)
+        return ":".join([
+            RESPONSE_CACHE_PREFIX,
+            self.model_name,
+            role,
+            hashlib.sha1(question.encode("utf-8")).hexdigest(),
+            hashlib.sha1(context.encode("utf-8")).hexdigest(),
+        ])
+
+    @staticmethod
+    def _is_shareable(text: str, user_context: Dict) -> bool:
+        # Never hand one user's personalised greeting to another.
+        lowered = text.lower()
+        for key in ("name", "username", "email"):
+            value = str(user_context.get(key) or "").strip().lower()
+            if len(value) > 2 and value in lowered:
+                return False
+        return True
+
+    def _cache_hit_events(
+        self,
+        cached_text: str,
+        function_calls: List[Dict],
+        reasoning_trace: List[Dict],
+        show_reasoning: bool,
+        timings: Dict,
+    ) -> Generator[Dict, None, None]:
+        """Replay a cached answer through the same token/done events as a live stream."""
+        for piece in self._chunk_text(cached_text):
+            yield {"event": "token", "data": {"text": piece}}
+        yield self._done_event(
+            function_calls, reasoning_trace, cached_text, "", show_reasoning,
+            {"token_count_input": 0, "token_count_output": 0}, source="cache", timings=timings,
+        )
+
+    def _done_event(
+        self,
+        function_calls: List[Dict],
+        reasoning_trace: List[Dict],
+        full_text: str,
+        full_reasoning: str,
+        show_reasoning: bool,
+        token_counts: Dict,
+        source: str = "cerebras",
+        model_name: Optional[str] = None,
+        timings: Optional[Dict] = None,
+    ) -> Dict:
+        if full_reasoning and show_reasoning:
+            reasoning_trace.append({"stage": "thinking", "text": full_reasoning})
+        return {
+            "event": "done",
+            "data": {
+                "function_calls": function_calls,
+                "source": source,
+                "warning": None,
+                "response": full_text.strip(),
+                "reasoning_trace": reasoning_trace if show_reasoning else [],
+                "model_name": model_name or self.model_name,
+                "timings": timings or {},
+                **token_counts,
+            },
+        }
 
     def chat(
         self,
@@ -343,6 +583,7 @@ class CerebrasChatbotService:
         show_reasoning: bool = True,
     ) -> Dict:
         memory_messages = memory_messages or []
+        timings: Dict = {}
         (
             system_prompt,
             context_data,
@@ -354,27 +595,27 @@ class CerebrasChatbotService:
             role=role,
             user_context=user_context,
             memory_messages=memory_messages,
+            timings=timings,
         )
-        extra_body = {}
-        if self.model_name == "zai-glm-4.7":
-            extra_body["disable_reasoning"] = not show_reasoning
-            extra_body["clear_thinking"] = False
-        elif self.model_name == "gpt-oss-120b":
-            if not show_reasoning:
-                extra_body["reasoning_format"] = "hidden"
-
+        cache_key = self._response_cache_key(query, role, user_context, context_data, memory_messages)
+        cached_text = cache.get(cache_key) if cache_key else None
+        if cached_text:
+            reasoning_trace.append({"stage": "cache", "text": "Answered from the response cache for an identical question."})
+            return {
+                "response": cached_text,
+                "function_calls": function_calls,
+                "reasoning_trace": reasoning_trace if show_reasoning else [],
+                "source": "cache",
+                "warning": None,
+                "model_name": self.model_name,
+                "timings": timings,
+                "token_count_input": 0,
+                "token_count_output": 0,
+            }
+        requested = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": payload},
-                ],
-                stream=False,
-                max_completion_tokens=self.max_completion_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                extra_body=extra_body if extra_body else None,
+            response, backend = self.pool.complete(
+                lambda backend: self._completion_kwargs(backend, system_prompt, payload, show_reasoning, stream=False)
             )
             text = ((response.choices[0].message.content if response.choices else None) or "").strip()
             if show_reasoning and response.choices:
@@ -385,6 +626,8 @@ class CerebrasChatbotService:
                 raise RuntimeError("Model returned empty content.")
             source = "cerebras"
             warning = None
+        except ProviderUnavailable:
+            raise
         except Exception as exc:
             msg = str(exc)
             if "quota" in msg.lower() or "rate" in msg.lower() or "429" in msg:
@@ -392,15 +635,27 @@ class CerebrasChatbotService:
             else:
                 raise RuntimeError(f"Cerebras request failed: {exc}") from exc
 
+        # Without streaming the whole answer arrives at once, so time to first
+        # token is the full upstream time.
+        upstream_ms = _elapsed_ms(requested)
+        token_counts = self._token_counts(getattr(response, "usage", None), system_prompt, payload, text)
+        output_tokens = token_counts.get("token_count_output")
+        timings.update({
+            "ttft_ms": upstream_ms,
+            "generation_ms": upstream_ms,
+            "tokens_per_second": round(output_tokens * 1000 / upstream_ms, 1) if output_tokens and upstream_ms else None,
+        })
+        if cache_key and self._is_shareable(text, user_context):
+            cache.set(cache_key, text, timeout=RESPONSE_CACHE_TTL)
         return {
             "response": text,
             "function_calls": function_calls,
             "reasoning_trace": reasoning_trace if show_reasoning else [],
             "source": source,
             "warning": warning,
-            "model_name": self.model_name,
-            "token_count_input": self._token_estimate(payload),
-            "token_count_output": self._token_estimate(text),
+            "model_name": backend.model,
+            "timings": timings,
+            **token_counts,
         }
 
     def chat_stream(
@@ -410,8 +665,15 @@ class CerebrasChatbotService:
         user_context: Dict,
         memory_messages: Optional[List[Dict]] = None,
         show_reasoning: bool = True,
+        on_stream: Optional[Callable[[CompletionStream], None]] = None,
     ) -> Generator[Dict, None, None]:
+        """Stream one answer as SSE-shaped events.
+
+        ``on_stream`` receives the upstream ``CompletionStream`` before it is
+        read, so a caller can ``close()`` it from another thread to abort.
+        """
         memory_messages = memory_messages or []
+        timings: Dict = {}
         (
             system_prompt,
             context_data,
@@ -423,83 +685,150 @@ class CerebrasChatbotService:
             role=role,
             user_context=user_context,
             memory_messages=memory_messages,
+            timings=timings,
         )
+        cache_key = self._response_cache_key(query, role, user_context, context_data, memory_messages)
+        cached_text = cache.get(cache_key) if cache_key else None
+        if cached_text:
+            reasoning_trace.append({"stage": "cache", "text": "Answered from the response cache for an identical question."})
         if show_reasoning:
             for step in reasoning_trace:
                 yield {"event": "reasoning", "data": step}
         for call in function_calls:
             yield {"event": "tool_call", "data": call}
+        if cached_text:
+            yield from self._cache_hit_events(cached_text, function_calls, reasoning_trace, show_reasoning, timings)
+            return
 
         full_text = ""
         full_reasoning = ""
-        source = "cerebras"
-        warning = None
-        
-        extra_body = {}
-        if self.model_name == "zai-glm-4.7":
-            extra_body["disable_reasoning"] = not show_reasoning
-            extra_body["clear_thinking"] = False
-        elif self.model_name == "gpt-oss-120b":
-            if not show_reasoning:
-                extra_body["reasoning_format"] = "hidden"
-
+        usage = None
+        first_token_at = None
+        requested = time.perf_counter()
+        stream = self.pool.stream(
+            lambda backend: self._completion_kwargs(backend, system_prompt, payload, show_reasoning, stream=True)
+        )
+        if on_stream is not None:
+            on_stream(stream)
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": payload},
-                ],
-                stream=True,
-                max_completion_tokens=self.max_completion_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                extra_body=extra_body if extra_body else None,
-            )
             for chunk in stream:
-                choices = getattr(chunk, "choices", None) or []
-                if not choices:
-                    continue
-                delta = getattr(choices[0], "delta", None)
-                if delta is None:
-                    continue
-                
+                usage = getattr(chunk, "usage", None) or usage
+                reasoning_text, chunk_text = self._delta_parts(chunk)
+                if first_token_at is None and (reasoning_text or chunk_text):
+                    first_token_at = time.perf_counter()
                 # Check for reasoning tokens
-                reasoning_text = getattr(delta, "reasoning", None)
                 if reasoning_text and show_reasoning:
                     full_reasoning += reasoning_text
                     yield {"event": "reasoning_token", "data": {"text": reasoning_text}}
-                
                 # Check for content tokens
-                chunk_text = getattr(delta, "content", None)
                 if chunk_text:
                     full_text += chunk_text
                     yield {"event": "token", "data": {"text": chunk_text}}
             if not full_text.strip():
                 raise RuntimeError("Model returned empty content.")
+        except ProviderUnavailable:
+            raise
         except Exception as exc:
-            msg = str(exc)
-            if "quota" in msg.lower() or "rate" in msg.lower() or "429" in msg:
-                raise RuntimeError("Cerebras quota exceeded. Please try again later.") from exc
-            else:
-                raise RuntimeError(f"Cerebras stream failed: {exc}") from exc
+            raise self._stream_error(exc) from exc
+        finally:
+            stream.close()
+
+        if cache_key and self._is_shareable(full_text, user_context):
+            cache.set(cache_key, full_text.strip(), timeout=RESPONSE_CACHE_TTL)
+        token_counts = self._token_counts(usage, system_prompt, payload, full_reasoning + full_text)
+        timings.update(_generation_timings(
+            requested, first_token_at, time.perf_counter(), token_counts.get("token_count_output")
+        ))
+        yield self._done_event(
+            function_calls, reasoning_trace, full_text, full_reasoning, show_reasoning,
+            token_counts, model_name=stream.backend.model, timings=timings,
+        )
 
-        if full_reasoning and show_reasoning:
-            reasoning_trace.append({"stage": "thinking", "text": full_reasoning})
+    async def achat_stream(
+        self,
+        query: str,
+        role: str,
+        user_context: Dict,
+        memory_messages: Optional[List[Dict]] = None,
+        show_reasoning: bool = True,
+    ) -> AsyncGenerator[Dict, None]:
+        """Async twin of ``chat_stream`` for ASGI deployments.
 
-        yield {
-            "event": "done",
-            "data": {
-                "function_calls": function_calls,
-                "source": source,
-                "warning": warning,
-                "response": full_text.strip(),
-                "reasoning_trace": reasoning_trace if show_reasoning else [],
-                "model_name": self.model_name,
-                "token_count_input": self._token_estimate(payload),
-                "token_count_output": self._token_estimate(full_text),
-            },
-        }
+        Tool routing runs in a worker thread (it uses the sync ORM); the model
+        call streams through the provider pool's async clients. If the consumer cancels the
+        generator (client disconnect), the upstream HTTP stream is closed.
+        """
+        memory_messages = memory_messages or []
+        timings: Dict = {}
+        (
+            system_prompt,
+            context_data,
+            function_calls,
+            reasoning_trace,
+            payload,
+        ) = await sync_to_async(self._build_prompt_payload)(
+            query=query,
+            role=role,
+            user_context=user_context,
+            memory_messages=memory_messages,
+            timings=timings,
+        )
+        cache_key = self._response_cache_key(query, role, user_context, context_data, memory_messages)
+        cached_text = await cache.aget(cache_key) if cache_key else None
+        if cached_text:
+            reasoning_trace.append({"stage": "cache", "text": "Answered from the response cache for an identical question."})
+        if show_reasoning:
+            for step in reasoning_trace:
+                yield {"event": "reasoning", "data": step}
+        for call in function_calls:
+            yield {"event": "tool_call", "data": call}
+        if cached_text:
+            for event in self._cache_hit_events(cached_text, function_calls, reasoning_trace, show_reasoning, timings):
+                yield event
+            return
+
+        full_text = ""
+        full_reasoning = ""
+        usage = None
+        first_token_at = None
+        requested = time.perf_counter()
+        stream = self.pool.astream(
+            lambda backend: self._completion_kwargs(backend, system_prompt, payload, show_reasoning, stream=True)
+        )
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                reasoning_text, chunk_text = self._delta_parts(chunk)
+                if first_token_at is None and (reasoning_text or chunk_text):
+                    first_token_at = time.perf_counter()
+                if reasoning_text and show_reasoning:
+                    full_reasoning += reasoning_text
+                    yield {"event": "reasoning_token", "data": {"text": reasoning_text}}
+                if chunk_text:
+                    full_text += chunk_text
+                    yield {"event": "token", "data": {"text": chunk_text}}
+            if not full_text.strip():
+                raise RuntimeError("Model returned empty content.")
+        except ProviderUnavailable:
+            raise
+        except Exception as exc:
+            raise self._stream_error(exc) from exc
+        finally:
+            # Runs on normal exit, errors and cancellation (GeneratorExit /
+            # CancelledError) alike, so an abandoned stream never keeps
+            # consuming upstream tokens.
+            await stream.close()
+
+        if cache_key and self._is_shareable(full_text, user_context):
+            await cache.aset(cache_key, full_text.strip(), timeout=RESPONSE_CACHE_TTL)
+        token_counts = self._token_counts(usage, system_prompt, payload, full_reasoning + full_text)
+        timings.update(_generation_timings(
+            requested, first_token_at, time.perf_counter(), token_counts.get("token_count_output")
+        ))
+        yield self._done_event(
+            function_calls, reasoning_trace, full_text, full_reasoning, show_reasoning,
+            token_counts, model_name=stream.backend.model, timings=timings,
+        )
 
     @staticmethod
     def _chunk_text(text: str, chunk_size: int = 40) -> List[str]:
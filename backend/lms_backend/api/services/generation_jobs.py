@@ -0,0 +1,413 @@
+"""Background generation of AI lessons and assignment questions.
+
+A generate request only validates its input and creates a ``GenerationJob``;
+the completion (up to 8192 tokens, often well over 30 seconds) runs on a
+process-wide thread pool (``LLM_GENERATION_WORKERS``) and streams through
+the shared provider pool, so failover and rate limits apply. At most
+``LLM_GENERATION_PER_BACKEND`` generations per configured backend are in
+flight at once; further jobs wait as ``queued`` and cannot crowd out
+chatbot traffic.
+
+Text is checkpointed on the job row while it streams. ``progress_stream``
+follows those checkpoints as SSE, so progress can be read from any process,
+and the finished result stays on the row as a draft to reopen later.
+
+Jobs run in the process that accepted them. That process touches the rows
+of all its queued and running jobs every ``HEARTBEAT_SECONDS``, so a queued
+or running job whose row has not been touched for ``STALE_SECONDS`` lost its
+process and is marked failed when it is next read. A job only moves from
+``queued`` to ``running`` and from there to a final status, so a job that
+was already reported failed is never picked up again.
+"""
+
+import json
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.db import close_old_connections
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from myapp.models import GenerationJob
+
+from .llm_client import ChatbotConfigurationError, _env_int
+from .provider_pool import ProviderPool, get_provider_pool
+from .sse_coalescer import sse_frame
+from .usage_quota import QuotaLease, acquire_quota, record_token_usage
+
+
+logger = logging.getLogger(__name__)
+
+LESSON = "lesson"
+ASSIGNMENT = "assignment"
+ACTIVE_STATUSES = ("queued", "running")
+
+GENERATION_MODEL = "llama3.1-8b"
+MAX_COMPLETION_TOKENS = 8192
+WORKERS = max(1, _env_int("LLM_GENERATION_WORKERS", 4))
+PER_BACKEND = max(1, _env_int("LLM_GENERATION_PER_BACKEND", 2))
+CHECKPOINT_CHARS = 800
+CHECKPOINT_SECONDS = 1.0
+STALE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+# How long a worker waits for the row of a job submitted inside a
+# transaction to become visible; the transaction rolled back if it never does.
+JOB_VISIBLE_SECONDS = 30
+PROGRESS_POLL_SECONDS = 0.5
+KEEPALIVE_SECONDS = 15
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="generation-job")
+_slots: "weakref.WeakKeyDictionary[ProviderPool, threading.BoundedSemaphore]" = weakref.WeakKeyDictionary()
+_slots_lock = threading.Lock()
+# Jobs submitted in this process that have not finished, for the heartbeat.
+_owned: Set = set()
+_owned_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+
+
+# ---- prompts ---------------------------------------------------------------
+
+LESSON_SYSTEM_PROMPT = (
+    "You are an expert educational content writer. "
+    "Generate high-quality, well-structured lesson content in Markdown format. "
+    "Include clear headings, subheadings, explanations, examples, and key takeaways. "
+    "Make the content engaging and educational. "
+    "Use proper Markdown formatting with headers (#, ##, ###), bullet points, "
+    "numbered lists, bold text, code blocks where appropriate, and other Markdown features. "
+    "Do NOT wrap the entire response in a code block — output raw Markdown directly."
+)
+
+MCQ_SYSTEM_PROMPT = (
+    "You are an expert educational assessment designer. "
+    "Generate multiple-choice questions in valid JSON format. "
+    "Return ONLY a JSON array — no markdown, no code fences, no explanation. "
+    "Each element must have: "
+    '"question" (string), "options" (array of {"text": string, "is_correct": boolean}), "points" (number). '
+    "Each question MUST have exactly 4 options with exactly 1 correct answer. "
+    "Ensure questions test understanding, not just memorization."
+)
+
+QA_SYSTEM_PROMPT = (
+    "You are an expert educational assessment designer. "
+    "Generate short-answer / Q&A questions in valid JSON format. "
+    "Return ONLY a JSON array — no markdown, no code fences, no explanation. "
+    "Each element must have: "
+    '"question" (string), "keywords" (array of relevant keywords for auto-grading), '
+    '"acceptable_answers" (array of acceptable exact answers), "points" (number). '
+    "Ensure questions require critical thinking and clear understanding."
+)
+
+
+def build_params(kind: str, data) -> Dict:
+    """Validated job parameters from request data; raises ``ValueError`` with a user-facing message."""
+    topic = (data.get('topic') or '').strip()
+    if not topic:
+        raise ValueError("Topic is required.")
+    if kind == LESSON:
+        return {
+            "topic": topic,
+            "audience": (data.get('audience') or 'Beginner').strip(),
+            "tone": (data.get('tone') or 'Professional').strip(),
+        }
+    try:
+        num_questions = int(data.get('num_questions', 5))
+    except (TypeError, ValueError):
+        raise ValueError("num_questions must be a number.")
+    return {
+        "topic": topic,
+        "assignment_type": (data.get('assignment_type') or 'mcq').strip(),
+        "num_questions": max(1, min(num_questions, 20)),
+        "difficulty": (data.get('difficulty') or 'Intermediate').strip(),
+    }
+
+
+def build_prompts(kind: str, params: Dict) -> Tuple[str, str]:
+    topic = params["topic"]
+    if kind == LESSON:
+        return LESSON_SYSTEM_PROMPT, (
+            f"Create a comprehensive lesson on the topic: **{topic}**\n\n"
+            f"Target Audience: {params['audience']}\n"
+            f"Tone: {params['tone']}\n\n"
+            "Structure the lesson with:\n"
+            "1. An engaging introduction\n"
+            "2. Learning objectives\n"
+            "3. Main content with clear sections and examples\n"
+            "4. Key takeaways / summary\n"
+            "5. Practice questions or exercises (if appropriate)\n\n"
+            "Make it thorough, informative and engaging for the specified audience."
+        )
+    num_questions, difficulty = params["num_questions"], params["difficulty"]
+    if params["assignment_type"] == 'mcq':
+        return MCQ_SYSTEM_PROMPT, (
+            f"Create {num_questions} multiple-choice questions on: {topic}\n"
+            f"Difficulty: {difficulty}\n\n"
+            "Return ONLY valid JSON array. Example:\n"
+            '[{"question": "What is X?", "options": [{"text": "A", "is_correct": false}, '
+            '{"text": "B", "is_correct": true}, {"text": "C", "is_correct": false}, '
+            '{"text": "D", "is_correct": false}], "points": 2}]'
+        )
+    return QA_SYSTEM_PROMPT, (
+        f"Create {num_questions} short-answer / Q&A questions on: {topic}\n"
+        f"Difficulty: {difficulty}\n\n"
+        "Return ONLY valid JSON array. Example:\n"
+        '[{"question": "Explain the concept of X.", '
+        '"keywords": ["key1", "key2", "key3"], '
+        '"acceptable_answers": ["X is..."], "points": 5}]'
+    )
+
+
+def parse_questions(raw: str) -> List:
+    raw = raw.strip()
+    # Strip markdown code fences if present
+    if raw.startswith('```'):
+        lines = raw.split('\n')[1:]
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        raw = '\n'.join(lines).strip()
+    return json.loads(raw)
+
+
+def build_result(kind: str, params: Dict, text: str) -> Dict:
+    """The same payload the synchronous endpoints used to return."""
+    if kind == LESSON:
+        return {"content": text}
+    return {"questions": parse_questions(text), "assignment_type": params["assignment_type"]}
+
+
+# ---- running jobs ----------------------------------------------------------
+
+def submit_job(user, kind: str, params: Dict) -> GenerationJob:
+    """Create a queued job and hand it to the worker pool; raises ``QuotaExceeded``.
+
+    The quota lease is held until the job finishes, so queued jobs count
+    against the user's concurrent-request limit. The job is handed over
+    right away rather than on commit: ``run_job`` always releases the lease,
+    including when the surrounding transaction rolls back and the row never
+    appears.
+    """
+    lease = acquire_quota(user)
+    try:
+        job = GenerationJob.objects.create(user=user, kind=kind, title=params["topic"][:200], params=params)
+        with _owned_lock:
+            _owned.add(job.pk)
+        _start_heartbeat()
+        _executor.submit(run_job, job.pk, lease)
+    except Exception:
+        lease.release()
+        raise
+    return job
+
+
+def _start_heartbeat() -> None:
+    global _heartbeat
+    with _owned_lock:
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_heartbeat_loop, daemon=True, name="generation-job-heartbeat")
+            _heartbeat.start()
+
+
+def _heartbeat_loop() -> None:
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        try:
+            touch_owned_jobs()
+        except Exception:
+            logger.warning("Generation job heartbeat failed", exc_info=True)
+
+
+def touch_owned_jobs() -> int:
+    """Mark this process's unfinished jobs as alive; returns the rows touched."""
+    with _owned_lock:
+        job_ids = list(_owned)
+    if not job_ids:
+        return 0
+    close_old_connections()
+    try:
+        return GenerationJob.objects.filter(pk__in=job_ids, status__in=ACTIVE_STATUSES).update(
+            updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def _provider_slot(pool: ProviderPool) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        slot = _slots.get(pool)
+        if slot is None:
+            slot = threading.BoundedSemaphore(PER_BACKEND * max(1, len(pool.backends)))
+            _slots[pool] = slot
+        return slot
+
+
+def _finish(job_id, **fields) -> None:
+    GenerationJob.objects.filter(pk=job_id, status__in=ACTIVE_STATUSES).update(
+        finished_at=timezone.now(), updated_at=timezone.now(), **fields
+    )
+
+
+class _JobAbandoned(Exception):
+    """The job row left ``running`` (reported failed, or deleted) while it ran."""
+
+
+def _wait_until_visible(job_id) -> bool:
+    deadline = time.monotonic() + JOB_VISIBLE_SECONDS
+    while not GenerationJob.objects.filter(pk=job_id).exists():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.2)
+    return True
+
+
+def run_job(job_id, lease: QuotaLease) -> None:
+    close_old_connections()
+    try:
+        if not _wait_until_visible(job_id):
+            logger.warning("Generation job %s was never committed; dropping it", job_id)
+            return
+        _run(job_id)
+    except _JobAbandoned:
+        logger.info("Generation job %s stopped: it is no longer running", job_id)
+    except Exception as exc:
+        logger.error("AI generation job %s failed: %s", job_id, exc)
+        what = "questions" if GenerationJob.objects.filter(pk=job_id, kind=ASSIGNMENT).exists() else "content"
+        _finish(job_id, status="failed", error_message=f"Failed to generate {what}: {exc}")
+    finally:
+        lease.release()
+        with _owned_lock:
+            _owned.discard(job_id)
+        close_old_connections()
+
+
+def _run(job_id) -> None:
+    job = GenerationJob.objects.get(pk=job_id)
+    system_prompt, user_prompt = build_prompts(job.kind, job.params)
+    try:
+        pool = get_provider_pool(GENERATION_MODEL)
+    except ChatbotConfigurationError:
+        _finish(job.pk, status="failed", error_message="AI service is not configured. Please set CEREBRAS_API_KEY.")
+        return
+
+    slot = _provider_slot(pool)
+    slot.acquire()
+    try:
+        claimed = GenerationJob.objects.filter(pk=job.pk, status="queued").update(
+            status="running", started_at=timezone.now(), updated_at=timezone.now()
+        )
+        if not claimed:
+            # Already reported failed (e.g. expired while queued); leave it so.
+            raise _JobAbandoned()
+        text, usage, model_name = _generate(pool, job.pk, system_prompt, user_prompt)
+    finally:
+        slot.release()
+
+    tokens = getattr(usage, "total_tokens", None)
+    record_token_usage(job.user_id, tokens)
+    try:
+        result = build_result(job.kind, job.params, text)
+    except json.JSONDecodeError as exc:
+        logger.error("AI assignment generation returned invalid JSON: %s", exc)
+        _finish(job.pk, status="failed", output=text, model_name=model_name, token_count=tokens,
+                error_message="AI returned invalid format. Please try again.")
+        return
+    _finish(job.pk, status="completed", output=text, result=result, model_name=model_name, token_count=tokens)
+
+
+def _generate(pool: ProviderPool, job_id, system_prompt: str, user_prompt: str):
+    used = []
+
+    def build_kwargs(backend):
+        used.append(backend.model)
+        return {
+            "model": backend.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "stream": True,
+            "temperature": 0.7,
+            "max_completion_tokens": MAX_COMPLETION_TOKENS,
+        }
+
+    chunks: List[str] = []
+    pending = 0
+    last_save = time.monotonic()
+    usage = None
+    stream = pool.stream(build_kwargs)
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            choices = getattr(chunk, "choices", None) or []
+            delta = getattr(choices[0], "delta", None) if choices else None
+            text = getattr(delta, "content", None) if delta is not None else None
+            if not text:
+                continue
+            chunks.append(text)
+            pending += len(text)
+            if pending >= CHECKPOINT_CHARS or time.monotonic() - last_save >= CHECKPOINT_SECONDS:
+                saved = GenerationJob.objects.filter(pk=job_id, status="running").update(
+                    output="".join(chunks), updated_at=timezone.now()
+                )
+                if not saved:
+                    raise _JobAbandoned()
+                pending = 0
+                last_save = time.monotonic()
+    finally:
+        stream.close()
+    return "".join(chunks), usage, (used[-1] if used else None)
+
+
+def expire_if_stale(job: GenerationJob) -> GenerationJob:
+    """Fail a queued/running job whose process stopped updating it."""
+    if job.status in ACTIVE_STATUSES and job.updated_at < timezone.now() - timedelta(seconds=STALE_SECONDS):
+        _finish(job.pk, status="failed", error_message="Generation was interrupted. Please try again.")
+        job.refresh_from_db()
+    return job
+
+
+# ---- progress stream -------------------------------------------------------
+
+def progress_stream(job_id, offset: int = 0) -> Iterator[str]:
+    """SSE for one job: ``status`` changes, ``progress`` text deltas, then ``done`` or ``error``.
+
+    Each ``progress`` event's id is the number of characters sent so far, so
+    a client reconnecting with ``Last-Event-ID`` continues from there.
+    """
+    last_status: Optional[str] = None
+    last_write = time.monotonic()
+    close_old_connections()
+    try:
+        while True:
+            job = GenerationJob.objects.filter(pk=job_id).annotate(
+                tail=Substr("output", offset + 1)
+            ).defer("output").first()
+            if job is None:
+                yield sse_frame("error", {"detail": "Not found."})
+                return
+            job = expire_if_stale(job)
+            frames = []
+            if job.status != last_status:
+                last_status = job.status
+                frames.append(sse_frame("status", {"status": job.status}))
+            if job.tail:
+                offset += len(job.tail)
+                frames.append(sse_frame("progress", {"text": job.tail, "chars": offset}, event_id=offset))
+            if job.status == "completed":
+                frames.append(sse_frame("done", {"result": job.result, "token_count": job.token_count}))
+            elif job.status == "failed":
+                frames.append(sse_frame("error", {"detail": job.error_message}))
+            if frames:
+                last_write = time.monotonic()
+                yield "".join(frames)
+            elif time.monotonic() - last_write >= KEEPALIVE_SECONDS:
+                last_write = time.monotonic()
+                yield ": keepalive\n\n"
+            if job.status not in ACTIVE_STATUSES:
+                return
+            time.sleep(PROGRESS_POLL_SECONDS)
+    finally:
+        close_old_connections()
@@ -0,0 +1,326 @@
+"""Intent routing for chatbot tool selection.
+
+Queries are tokenized once and scanned with a token-level keyword automaton
+(a trie over word sequences, compiled at import), so ``top`` no longer fires
+on "topic" and multi-word cues such as "how many" or "top students" are
+matched as phrases. Every intent has a bias and weighted cues, negative ones
+included ("how many" pulls away from the course catalog), which sum to a
+logit. An optional linear model trained offline on unigram/bigram features
+(``manage.py train_intent_model``) adds a learned correction to that logit.
+Intents whose confidence reaches ``CHATBOT_INTENT_THRESHOLD`` are selected,
+at most ``CHATBOT_INTENT_MAX_TOOLS`` of them, most confident first.
+
+Routes that look wrong -- a selected tool returned nothing, an intent was
+dropped by the tool cap, or a score landed next to the threshold -- are
+logged to the ``api.services.intent_router.misroutes`` logger and, when
+``CHATBOT_INTENT_MISROUTE_LOG`` names a file, appended to it as JSON lines.
+Adding an ``intents`` list to such a line turns it into a training example.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+misroute_logger = logging.getLogger(__name__ + ".misroutes")
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent / "intent_data" / "intent_model.json"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+THRESHOLD = _env_float("CHATBOT_INTENT_THRESHOLD", 0.5)
+MAX_TOOLS = max(1, int(_env_float("CHATBOT_INTENT_MAX_TOOLS", 3)))
+# Scores this close to the threshold are logged as possible misroutes.
+AMBIGUITY_MARGIN = _env_float("CHATBOT_INTENT_AMBIGUITY_MARGIN", 0.08)
+MISROUTE_LOG_PATH = os.getenv("CHATBOT_INTENT_MISROUTE_LOG", "").strip()
+MODEL_ENABLED = os.getenv("CHATBOT_INTENT_MODEL_ENABLED", "true").strip().lower() not in {"0", "false", "off", "no"}
+
+ALL_ROLES = frozenset({"student", "teacher", "admin"})
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+COURSE_TOPICS = (
+    "python", "javascript", "web", "data science", "ai", "machine learning",
+    "design", "marketing", "devops", "english", "business",
+)
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    tool: str
+    roles: FrozenSet[str]
+    bias: float
+    cues: Dict[str, float]
+
+
+INTENTS: Tuple[Intent, ...] = (
+    Intent("top_rated", "get_top_courses_by_rating", ALL_ROLES, -2.0, {
+        "best": 3.0, "top": 3.0, "rating": 2.5, "rated": 2.5, "highest rated": 1.0,
+        "popular": 2.5, "course": 0.5,
+        "top student": -4.0, "best student": -4.0, "top learner": -4.0,
+        "best way": -3.0, "best practice": -4.0,
+    }),
+    Intent("course_search", "get_courses_by_filters", ALL_ROLES, -2.0, {
+        "course": 1.5, "recommend": 2.0, "suggest": 2.0, "catalog": 3.0, "find": 1.0, "search": 1.0,
+        "what course": 1.0, "which course": 1.5, "any course": 1.0, "show me": 1.0, "available": 1.0,
+        "beginner": 1.0, "intermediate": 1.0, "advanced": 1.0, "cheap": 1.5, "free": 1.0, "price": 1.5,
+        **{topic: 1.0 for topic in COURSE_TOPICS},
+        "best": -1.0, "top": -1.0, "rating": -1.0, "rated": -1.0, "popular": -1.0, "risk": -2.0,
+        "how many": -3.0, "total": -2.0, "my course": -2.5, "lesson": -1.0, "assignment": -1.0,
+    }),
+    Intent("course_goal", "get_courses_by_goal", ALL_ROLES, -2.5, {
+        "learn": 2.0, "want to learn": 1.5, "master": 2.0, "goal": 3.0, "roadmap": 2.0,
+        "career": 2.0, "become": 2.0, "get into": 1.5, "course": 0.5,
+        **{topic: 1.0 for topic in COURSE_TOPICS},
+        "my course": -2.0, "did i learn": -3.0,
+    }),
+    Intent("course_material", "search_course_material", frozenset({"student", "teacher"}), -2.5, {
+        "lesson": 3.0, "module": 3.0, "reading": 2.5, "material": 3.0, "chapter": 3.0, "lecture": 3.0,
+        "assignment": 2.5, "quiz": 2.0, "explain": 3.0, "define": 2.5, "difference between": 2.5,
+        "what is": 3.0, "what are": 3.0, "what does": 3.0, "according to": 3.0, "in my course": 3.0,
+        "course": -1.0, "best": -2.0, "top": -2.0, "good": -1.0, "how many": -3.0, "recommend": -2.0,
+        "my progress": -3.0, "how am i doing": -3.0, "how far": -3.0, "completion": -2.0,
+    }),
+    Intent("student_progress", "get_student_progress_summary", frozenset({"student"}), -2.5, {
+        "my progress": 5.0, "progress": 2.5, "my course": 3.0, "my enrollment": 4.0, "enrolled": 2.0,
+        "completion": 3.0, "completed": 1.5, "how far": 2.0, "how am i doing": 4.0, "my grade": 3.0,
+        "certificate": 1.5,
+    }),
+    Intent("teacher_performance", "get_teacher_course_performance", frozenset({"teacher"}), -2.5, {
+        "my course": 3.0, "my class": 3.5, "my student": 4.0, "my learner": 4.0, "performance": 3.0,
+        "enrollment": 2.5, "enrolled": 2.0, "completion": 2.0, "review": 1.5, "rating": 1.0,
+    }),
+    Intent("platform_snapshot", "get_platform_snapshot", frozenset({"admin"}), -2.5, {
+        "platform": 3.0, "overview": 3.0, "dashboard": 3.0, "snapshot": 3.5, "stats": 3.0,
+        "statistic": 3.0, "total": 2.5, "how many": 3.0, "count": 2.0, "number of": 3.0,
+        "student": 1.0, "teacher": 1.5, "user": 1.5, "enrollment": 1.5, "course": 0.5,
+        "revenue": 2.0, "growth": 2.0,
+        "top student": -2.5, "leaderboard": -2.5, "risk": -2.5,
+    }),
+    Intent("admin_leaderboard", "get_admin_progress_leaderboard", frozenset({"admin"}), -2.5, {
+        "top student": 5.0, "best student": 5.0, "top learner": 5.0, "leaderboard": 5.0,
+        "progressive": 4.0, "most active": 3.5, "ranking": 3.0, "rank": 2.5,
+    }),
+    Intent("admin_risk", "get_admin_course_risk_report", frozenset({"admin"}), -2.5, {
+        "risk": 4.0, "drop": 3.0, "dropping": 3.0, "dropout": 4.0, "low completion": 5.0, "underperforming": 5.0,
+        "struggling": 3.5, "failing": 3.0, "low engagement": 4.0, "need attention": 3.0,
+    }),
+    # Built in the chatbot service itself rather than by a registry tool.
+    Intent("learning_roadmap", "get_learning_roadmap", ALL_ROLES, -2.5, {
+        "roadmap": 4.0, "master": 3.0, "workflow": 3.0, "how to learn": 4.0, "study plan": 4.0,
+        "learning path": 4.0, "plan": 1.0, "schedule": 1.5,
+    }),
+)
+
+
+def fold(token: str) -> str:
+    # Light plural folding so "courses" matches "course".
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [fold(token) for token in TOKEN_RE.findall((text or "").lower())]
+
+
+def features(tokens: List[str]) -> List[str]:
+    """Unigram and bigram features for the linear model."""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+_OUTPUT = object()
+
+
+class KeywordAutomaton:
+    """Trie over token sequences; ``scan`` finds every cue phrase in one pass."""
+
+    def __init__(self, intents: Iterable[Intent]):
+        self.root: Dict = {}
+        for intent in intents:
+            for phrase, weight in intent.cues.items():
+                node = self.root
+                for token in tokenize(phrase):
+                    node = node.setdefault(token, {})
+                node.setdefault(_OUTPUT, []).append((intent.name, phrase, weight))
+
+    def scan(self, tokens: List[str]) -> Dict[Tuple[str, str], float]:
+        """Matched ``(intent, phrase) -> weight``; a phrase counts once however often it occurs."""
+        matches: Dict[Tuple[str, str], float] = {}
+        for start in range(len(tokens)):
+            node = self.root
+            for token in tokens[start:]:
+                node = node.get(token)
+                if node is None:
+                    break
+                for intent, phrase, weight in node.get(_OUTPUT, ()):
+                    matches[(intent, phrase)] = weight
+        return matches
+
+
+def _sigmoid(value: float) -> float:
+    if value < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+@dataclass
+class RouteDecision:
+    query: str
+    role: str
+    # Confidence per intent available to the role, and the cues behind it.
+    scores: Dict[str, float]
+    cues: Dict[str, List[str]]
+    selected: List[str]
+    capped: List[str] = field(default_factory=list)
+    tools: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def selected_tools(self) -> List[str]:
+        return [self.tools[name] for name in self.selected]
+
+    def tool_confidence(self, tool: str) -> Optional[float]:
+        for name in self.selected:
+            if self.tools[name] == tool:
+                return self.scores[name]
+        return None
+
+    def summary(self) -> str:
+        if not self.selected:
+            return "No tool intent reached the confidence threshold."
+        picked = ", ".join(f"{name} ({self.scores[name]:.2f})" for name in self.selected)
+        return f"Routed to {picked}."
+
+
+class IntentRouter:
+    def __init__(
+        self,
+        intents: Iterable[Intent] = INTENTS,
+        model: Optional[Dict[str, Dict[str, float]]] = None,
+        threshold: float = THRESHOLD,
+        max_tools: int = MAX_TOOLS,
+    ):
+        self.intents = {intent.name: intent for intent in intents}
+        self.automaton = KeywordAutomaton(self.intents.values())
+        self.model = model or {}
+        self.threshold = threshold
+        self.max_tools = max_tools
+
+    def keyword_logits(self, tokens: List[str], role: str) -> Tuple[Dict[str, float], Dict[str, List[str]]]:
+        logits = {name: intent.bias for name, intent in self.intents.items() if role in intent.roles}
+        cues: Dict[str, List[str]] = {name: [] for name in logits}
+        for (name, phrase), weight in self.automaton.scan(tokens).items():
+            if name in logits:
+                logits[name] += weight
+                cues[name].append(phrase)
+        return logits, cues
+
+    def model_logits(self, tokens: List[str], names: Iterable[str]) -> Dict[str, float]:
+        feats = features(tokens)
+        logits = {}
+        for name in names:
+            weights = self.model.get(name)
+            if weights:
+                logits[name] = sum(weights.get(feat, 0.0) for feat in feats)
+        return logits
+
+    def route(self, query: str, role: str) -> RouteDecision:
+        tokens = tokenize(query)
+        logits, cues = self.keyword_logits(tokens, role)
+        for name, correction in self.model_logits(tokens, logits).items():
+            logits[name] += correction
+        scores = {name: round(_sigmoid(value), 3) for name, value in logits.items()}
+        passing = sorted(
+            (name for name, score in scores.items() if score >= self.threshold),
+            key=lambda name: scores[name],
+            reverse=True,
+        )
+        return RouteDecision(
+            query=query,
+            role=role,
+            scores=scores,
+            cues={name: phrases for name, phrases in cues.items() if phrases},
+            selected=passing[:self.max_tools],
+            capped=passing[self.max_tools:],
+            tools={name: self.intents[name].tool for name in scores},
+        )
+
+
+def misroute_reasons(decision: RouteDecision, empty_tools: Iterable[str] = ()) -> List[str]:
+    reasons = []
+    empty = sorted(set(empty_tools))
+    if empty:
+        reasons.append("empty_result:" + ",".join(empty))
+    if decision.capped:
+        reasons.append("capped:" + ",".join(decision.capped))
+    near = sorted(
+        name for name, score in decision.scores.items()
+        if abs(score - THRESHOLD) < AMBIGUITY_MARGIN
+    )
+    if near:
+        reasons.append("ambiguous:" + ",".join(near))
+    return reasons
+
+
+_log_lock = threading.Lock()
+
+
+def log_misroute(decision: RouteDecision, empty_tools: Iterable[str] = ()) -> bool:
+    """Record the route when it looks wrong; returns whether anything was logged."""
+    reasons = misroute_reasons(decision, empty_tools)
+    if not reasons:
+        return False
+    record = {
+        "ts": timezone.now().isoformat(),
+        "query": decision.query[:300],
+        "role": decision.role,
+        "selected": decision.selected,
+        "scores": decision.scores,
+        "cues": decision.cues,
+        "reasons": reasons,
+    }
+    line = json.dumps(record, ensure_ascii=True)
+    misroute_logger.info(line)
+    if MISROUTE_LOG_PATH:
+        try:
+            with _log_lock, open(MISROUTE_LOG_PATH, "a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+        except OSError:
+            logger.warning("Could not append to intent misroute log %s", MISROUTE_LOG_PATH, exc_info=True)
+    return True
+
+
+def load_model(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    model_path = Path(path or os.getenv("CHATBOT_INTENT_MODEL", "") or DEFAULT_MODEL_PATH)
+    if not model_path.exists():
+        return {}
+    try:
+        with open(model_path, encoding="utf-8") as handle:
+            data = json.load(handle)
+        return {name: dict(weights) for name, weights in data.get("weights", {}).items()}
+    except (OSError, ValueError, AttributeError, TypeError):
+        logger.warning("Ignoring unreadable intent model %s", model_path, exc_info=True)
+        return {}
+
+
+@lru_cache(maxsize=1)
+def get_intent_router() -> IntentRouter:
+    """Process-wide router; the automaton and model are built once."""
+    return IntentRouter(model=load_model() if MODEL_ENABLED else {})
@@ -0,0 +1,149 @@
+"""Process-wide LLM clients with pooled keep-alive HTTP connections.
+
+Building an ``OpenAI`` client per request opens a fresh connection pool (and
+TLS handshake) every time. The helpers here create one sync client per
+process and one async client per event loop, each backed by an ``httpx``
+client with bounded pool limits, explicit timeouts and SDK-level retries.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+API_KEY_ENV_VARS = (
+    "CEREBRAS_API_KEY",
+    "CEREBRAS_ROUTER_API_KEY",
+    "CEREBRAS_ROUTER_KEY",
+    "CEREBRAS_KEY",
+)
+DEFAULT_BASE_URL = "https://api.cerebras.ai/v1"
+
+
+class ChatbotConfigurationError(RuntimeError):
+    pass
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def llm_api_key() -> str:
+    for name in API_KEY_ENV_VARS:
+        value = os.getenv(name, "").strip()
+        if value:
+            return value
+    return ""
+
+
+def llm_base_url() -> str:
+    return os.getenv("CEREBRAS_BASE_URL", DEFAULT_BASE_URL).strip()
+
+
+def llm_model_name(default: str) -> str:
+    return os.getenv("CEREBRAS_MODEL", default)
+
+
+def _credentials() -> Tuple[str, str]:
+    api_key = llm_api_key()
+    if not api_key:
+        raise ChatbotConfigurationError(
+            "Cerebras API key is not configured. Set one of: " + ", ".join(API_KEY_ENV_VARS) + "."
+        )
+    return api_key, llm_base_url()
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_env_int("LLM_HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("LLM_HTTP_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("LLM_HTTP_KEEPALIVE_EXPIRY", 60.0),
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=_env_float("LLM_CONNECT_TIMEOUT", 5.0),
+        read=_env_float("LLM_READ_TIMEOUT", 120.0),
+        write=_env_float("LLM_WRITE_TIMEOUT", 30.0),
+        pool=_env_float("LLM_POOL_TIMEOUT", 10.0),
+    )
+
+
+_lock = threading.Lock()
+_sync_clients: Dict[Tuple, OpenAI] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def client_for(api_key: str, base_url: str, max_retries: Optional[int] = None) -> OpenAI:
+    """Shared sync client for one set of credentials.
+
+    ``max_retries`` overrides ``LLM_MAX_RETRIES``; the provider pool passes 0
+    so a failing backend is left to its own failover instead of SDK retries.
+    """
+    if max_retries is None:
+        max_retries = _env_int("LLM_MAX_RETRIES", 2)
+    key = (api_key, base_url, max_retries)
+    client = _sync_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    max_retries=max_retries,
+                    http_client=httpx.Client(limits=_http_limits(), timeout=_http_timeout()),
+                )
+                _sync_clients[key] = client
+    return client
+
+
+def async_client_for(api_key: str, base_url: str, max_retries: Optional[int] = None) -> AsyncOpenAI:
+    """Shared async client for one set of credentials on the running event loop.
+
+    httpx async connections are bound to the loop that opened them, so each
+    loop (one per process under ASGI) gets its own pooled client.
+    """
+    if max_retries is None:
+        max_retries = _env_int("LLM_MAX_RETRIES", 2)
+    key = (api_key, base_url, max_retries)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=max_retries,
+                http_client=httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout()),
+            )
+            per_loop[key] = client
+    return client
+
+
+def get_llm_client() -> OpenAI:
+    """Shared sync client for the primary key, re-read so key rotation takes effect."""
+    return client_for(*_credentials())
+
+
+def get_async_llm_client() -> AsyncOpenAI:
+    return async_client_for(*_credentials())
@@ -0,0 +1,348 @@
+"""BM25 retrieval over course material for chatbot grounding.
+
+Reading text (``Content.text``), module titles/descriptions and assignment
+descriptions are split into overlapping passages (``MaterialPassage``). The
+inverted index lives in ``MaterialPosting``: one row per (term, course)
+holding a packed uint32 array of ``(passage_id, tf, passage_length)``
+records. A query reads only the rows for its own terms in the courses it
+searches and scores candidates in memory before fetching the few winning
+passages; re-indexing a source locks and rewrites only its own course's
+rows. BM25 document frequencies are summed across courses from the small
+``doc_freq`` column, so scores do not depend on which courses are searched.
+
+The index is built offline with ``manage.py build_material_index`` and kept
+current incrementally: saving or deleting a content item, module or
+assignment re-indexes just that source after the transaction commits.
+"""
+
+import heapq
+import logging
+import math
+import re
+import sys
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from myapp.models import Assignment, Content, CourseModule, MaterialPassage, MaterialPosting
+
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+CHUNK_WORDS = 160
+CHUNK_OVERLAP = 40
+MAX_TERM_LENGTH = 64
+SNIPPET_CHARS = 700
+RECORD_SIZE = 3
+STATS_CACHE_KEY = "material_index:stats"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TAG_RE = re.compile(r"<[^>]+>")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my of on or our so than that the their them then there these this to was we were "
+    "what when where which who why will with you your".split()
+)
+
+SOURCE_CONTENT = "content"
+SOURCE_MODULE = "module"
+SOURCE_ASSIGNMENT = "assignment"
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    terms = []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        if token in STOPWORDS or len(token) < 2 or len(token) > MAX_TERM_LENGTH:
+            continue
+        # Light plural folding so "functions" matches "function".
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def chunk_text(text: Optional[str]) -> List[str]:
+    words = TAG_RE.sub(" ", text or "").split()
+    if not words:
+        return []
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + CHUNK_WORDS]))
+        if start + CHUNK_WORDS >= len(words):
+            break
+    return chunks
+
+
+def pack_postings(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack_postings(blob) -> array:
+    values = array("I")
+    values.frombytes(bytes(blob or b""))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def source_passages(source_type: str, obj) -> Tuple[Optional[int], List[Tuple[str, str]]]:
+    """Return (course_id, [(title, text), ...]) for an indexable object."""
+    if source_type == SOURCE_CONTENT:
+        return obj.module.course_id, [(obj.title, chunk) for chunk in chunk_text(obj.text)]
+    if source_type == SOURCE_MODULE:
+        text = f"{obj.title}\n{obj.description or ''}"
+        return obj.course_id, [(obj.title, chunk) for chunk in chunk_text(text)]
+    if source_type == SOURCE_ASSIGNMENT:
+        text = f"{obj.title}\n{obj.description or ''}"
+        return obj.course_id, [(obj.title, chunk) for chunk in chunk_text(text)]
+    raise ValueError(f"Unknown material source: {source_type}")
+
+
+def _passage_terms(passage: MaterialPassage) -> Counter:
+    return Counter(tokenize(f"{passage.title} {passage.text}"))
+
+
+def build_passages(source_type: str, source_id: int, course_id: int, passages) -> List[MaterialPassage]:
+    built = []
+    for position, (title, text) in enumerate(passages):
+        passage = MaterialPassage(
+            course_id=course_id,
+            source_type=source_type,
+            source_id=source_id,
+            position=position,
+            title=title[:200],
+            text=text,
+        )
+        passage.length = sum(_passage_terms(passage).values())
+        built.append(passage)
+    return built
+
+
+PostingKey = Tuple[str, int]
+
+
+def postings_for(passages: Iterable[MaterialPassage]) -> Dict[PostingKey, List[int]]:
+    """Flattened posting records per (term, course_id) for already-saved passages."""
+    records: Dict[PostingKey, List[int]] = defaultdict(list)
+    for passage in passages:
+        for term, tf in _passage_terms(passage).items():
+            records[(term, passage.course_id)].extend((passage.id, tf, passage.length))
+    return records
+
+
+def _chunks(items: Sequence, size: int = 500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert_postings(rows: List[MaterialPosting]) -> Set[PostingKey]:
+    """Insert posting rows that do not exist yet; returns the keys actually written."""
+    table = connection.ops.quote_name(MaterialPosting._meta.db_table)
+    inserted: Set[PostingKey] = set()
+    with connection.cursor() as cursor:
+        for batch in _chunks(rows):
+            params = []
+            for row in batch:
+                params.extend([row.term, row.course_id, row.doc_freq, row.postings])
+            values = ", ".join(["(%s, %s, %s, %s)"] * len(batch))
+            # Supported by PostgreSQL and SQLite >= 3.35.
+            cursor.execute(
+                f"INSERT INTO {table} (term, course_id, doc_freq, postings) VALUES {values} "
+                "ON CONFLICT (term, course_id) DO NOTHING RETURNING term, course_id",
+                params,
+            )
+            inserted.update((term, course_id) for term, course_id in cursor.fetchall())
+    return inserted
+
+
+def _merge_postings(
+    keys: Set[PostingKey], remove_ids: Set[int], add: Dict[PostingKey, List[int]], attempts: int = 3
+) -> None:
+    terms_by_course: Dict[int, List[str]] = defaultdict(list)
+    for term, course_id in sorted(keys):
+        terms_by_course[course_id].append(term)
+
+    to_update: List[MaterialPosting] = []
+    to_create: List[MaterialPosting] = []
+    to_delete: List[int] = []
+    for course_id, course_terms in sorted(terms_by_course.items()):
+        for batch in _chunks(course_terms):
+            existing = {
+                row.term: row
+                for row in MaterialPosting.objects.select_for_update().filter(course_id=course_id, term__in=batch)
+            }
+            for term in batch:
+                row = existing.get(term)
+                merged = array("I")
+                if row is not None:
+                    old = unpack_postings(row.postings)
+                    for i in range(0, len(old), RECORD_SIZE):
+                        if old[i] not in remove_ids:
+                            merged.extend(old[i:i + RECORD_SIZE])
+                merged.extend(add.get((term, course_id), ()))
+                doc_freq = len(merged) // RECORD_SIZE
+                if row is None:
+                    if doc_freq:
+                        to_create.append(MaterialPosting(
+                            term=term, course_id=course_id, doc_freq=doc_freq, postings=pack_postings(merged)
+                        ))
+                elif doc_freq:
+                    row.doc_freq = doc_freq
+                    row.postings = pack_postings(merged)
+                    to_update.append(row)
+                else:
+                    to_delete.append(row.pk)
+    MaterialPosting.objects.bulk_update(to_update, ["doc_freq", "postings"], batch_size=500)
+    for batch in _chunks(to_delete):
+        MaterialPosting.objects.filter(pk__in=batch).delete()
+    if not to_create:
+        return
+    # A concurrent re-index in the same course may have created some of the
+    # same new rows since they were read; merge into those instead of
+    # dropping ours.
+    conflicts = {(row.term, row.course_id) for row in to_create} - _insert_postings(to_create)
+    if conflicts:
+        if attempts <= 1:
+            raise RuntimeError(f"Could not merge postings for {len(conflicts)} contended terms")
+        _merge_postings(conflicts, remove_ids, {key: add.get(key, []) for key in conflicts}, attempts - 1)
+
+
+def invalidate_index_caches() -> None:
+    from .tool_registry import invalidate_tool_cache
+
+    cache.delete(STATS_CACHE_KEY)
+    invalidate_tool_cache("material")
+
+
+def reindex_source(source_type: str, source_id: int, obj=None) -> int:
+    """Replace the passages of one source; ``obj=None`` removes them. Returns passage count."""
+    with transaction.atomic():
+        old = list(MaterialPassage.objects.filter(source_type=source_type, source_id=source_id))
+        old_ids = {passage.id for passage in old}
+        keys: Set[PostingKey] = set()
+        for passage in old:
+            keys.update((term, passage.course_id) for term in _passage_terms(passage))
+        if old_ids:
+            MaterialPassage.objects.filter(id__in=old_ids).delete()
+
+        new: List[MaterialPassage] = []
+        if obj is not None:
+            course_id, passages = source_passages(source_type, obj)
+            new = MaterialPassage.objects.bulk_create(
+                build_passages(source_type, source_id, course_id, passages)
+            )
+        added = postings_for(new)
+        keys.update(added)
+        if keys:
+            _merge_postings(keys, old_ids, added)
+    invalidate_index_caches()
+    return len(new)
+
+
+def _stats() -> Tuple[int, float]:
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        row = MaterialPassage.objects.aggregate(n=Count("id"), avg=Avg("length"))
+        stats = (row["n"] or 0, float(row["avg"] or 0.0))
+        cache.set(STATS_CACHE_KEY, stats, timeout=300)
+    return stats
+
+
+def _snippet(text: str, terms: Set[str]) -> str:
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    lowered = text.lower()
+    hits = [lowered.find(term) for term in terms]
+    first = min((pos for pos in hits if pos >= 0), default=0)
+    start = max(0, first - SNIPPET_CHARS // 4)
+    snippet = text[start:start + SNIPPET_CHARS]
+    return ("…" if start else "") + snippet + "…"
+
+
+def search(query: str, course_ids: Iterable[int], limit: int = 5) -> List[Dict]:
+    """Top BM25 passages for ``query`` within ``course_ids``."""
+    allowed = set(course_ids)
+    terms = set(tokenize(query))
+    if not allowed or not terms:
+        return []
+    total, avg_length = _stats()
+    if not total:
+        return []
+    avg_length = avg_length or 1.0
+
+    doc_freqs = dict(
+        MaterialPosting.objects.filter(term__in=terms)
+        .values("term")
+        .annotate(doc_freq=Sum("doc_freq"))
+        .values_list("term", "doc_freq")
+    )
+    scores: Dict[int, float] = defaultdict(float)
+    for row in MaterialPosting.objects.filter(term__in=terms, course_id__in=allowed).only("term", "postings"):
+        doc_freq = doc_freqs.get(row.term, 0)
+        idf = math.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+        records = unpack_postings(row.postings)
+        for i in range(0, len(records), RECORD_SIZE):
+            tf = records[i + 1]
+            norm = K1 * (1 - B + B * records[i + 2] / avg_length)
+            scores[records[i]] += idf * tf * (K1 + 1) / (tf + norm)
+
+    top = heapq.nlargest(max(1, min(int(limit), 20)), scores.items(), key=lambda item: item[1])
+    passages = MaterialPassage.objects.select_related("course").in_bulk([pid for pid, _ in top])
+    results = []
+    for pid, score in top:
+        passage = passages.get(pid)
+        if passage is None:
+            continue
+        results.append({
+            "course_id": passage.course_id,
+            "course_title": passage.course.title,
+            "source_type": passage.source_type,
+            "source_id": passage.source_id,
+            "title": passage.title,
+            "passage": _snippet(passage.text, terms),
+            "score": round(score, 3),
+        })
+    return results
+
+
+def _schedule(source_type: str, model, pk: int) -> None:
+    def run():
+        try:
+            obj = model.objects.filter(pk=pk).first()
+            reindex_source(source_type, pk, obj)
+        except Exception:
+            # Search must never break saving course material; the offline
+            # rebuild repairs anything missed here.
+            logger.exception("Failed to index %s %s", source_type, pk)
+
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def _content_changed(sender, instance, **kwargs):
+    _schedule(SOURCE_CONTENT, Content, instance.pk)
+
+
+@receiver(post_save, sender=CourseModule)
+@receiver(post_delete, sender=CourseModule)
+def _module_changed(sender, instance, **kwargs):
+    _schedule(SOURCE_MODULE, CourseModule, instance.pk)
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def _assignment_changed(sender, instance, **kwargs):
+    _schedule(SOURCE_ASSIGNMENT, Assignment, instance.pk)
@@ -4,6 +4,8 @@ from django.db.models import Avg, Count, Q
 
 from myapp.models import Course, Enrollment, User
 
+from . import material_index
+
 
 class PostgreSQLFunctions:
     """Database tools used by the chatbot agent."""
@@ -188,6 +190,15 @@ class PostgreSQLFunctions:
             "needs_attention": needs_attention,
         }
 
+    @staticmethod
+    def search_course_material(user_id: int, query: str, limit: int = 5) -> List[Dict]:
+        """BM25 passages from courses the user is enrolled in or teaches."""
+        course_ids = set(
+            Enrollment.objects.filter(student_id=user_id).values_list("course_id", flat=True)
+        )
+        course_ids.update(Course.objects.filter(teacher_id=user_id).values_list("id", flat=True))
+        return material_index.search(query, course_ids, limit=max(1, min(int(limit), 10)))
+
     @staticmethod
     def get_teacher_courses(teacher_id: int) -> List[Dict]:
         courses = (
@@ -1,23 +1,48 @@
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 
 PROMPTS_DIR = Path(__file__).resolve().parent / "prompts"
 
+# name -> (mtime_ns, text); a prompt file is re-read only after it changes on disk.
+_prompt_cache: Dict[str, Tuple[int, str]] = {}
+_prompt_lock = threading.Lock()
+
 
 def _read_prompt(name: str) -> str:
     path = PROMPTS_DIR / name
-    return path.read_text(encoding="utf-8").strip()
+    mtime = path.stat().st_mtime_ns
+    cached = _prompt_cache.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    text = path.read_text(encoding="utf-8").strip()
+    with _prompt_lock:
+        _prompt_cache[name] = (mtime, text)
+    return text
 
 
 class PromptBuilder:
-    def __init__(self):
-        self.base_identity = _read_prompt("base_identity.md")
-        self.student_prompt = _read_prompt("student_system.md")
-        self.teacher_prompt = _read_prompt("teacher_system.md")
-        self.admin_prompt = _read_prompt("admin_system.md")
-        self.guardrails = _read_prompt("policy_guardrails.md")
+    @property
+    def base_identity(self) -> str:
+        return _read_prompt("base_identity.md")
+
+    @property
+    def student_prompt(self) -> str:
+        return _read_prompt("student_system.md")
+
+    @property
+    def teacher_prompt(self) -> str:
+        return _read_prompt("teacher_system.md")
+
+    @property
+    def admin_prompt(self) -> str:
+        return _read_prompt("admin_system.md")
+
+    @property
+    def guardrails(self) -> str:
+        return _read_prompt("policy_guardrails.md")
 
     def _role_prompt(self, role: str) -> str:
         if role == "admin":
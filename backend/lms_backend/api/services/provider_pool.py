@@ -0,0 +1,600 @@
+"""Pool of LLM backends with health tracking, rate limiting and failover.
+
+Backends are read from ``LLM_PROVIDERS``, a JSON list such as::
+
+    [{"name": "primary", "api_key_env": "CEREBRAS_API_KEY", "model": "zai-glm-4.7", "rpm": 30},
+     {"name": "backup", "api_key_env": "CEREBRAS_ROUTER_KEY", "base_url": "https://...", "rpm": 30}]
+
+Without it, every distinct key in ``API_KEY_ENV_VARS`` becomes a backend on
+the default base URL and model. Each backend has a token bucket (``rpm``),
+a circuit breaker (opened by a 429 for its ``Retry-After``, or by repeated
+failures with exponential cooldown, then half-open for a single probe) and
+an EWMA of time to first token. Requests go to the available backend with
+the best score; a stream that fails before its first token fails over to
+the next one, and a stream whose first token is slower than
+``LLM_HEDGE_AFTER_SECONDS`` is hedged on a second backend, the first to
+produce a token wins and the other is closed. When a hedge fires, the time
+the slow backend has already spent is folded into its TTFT estimate, so a
+backend that keeps losing hedges stops being picked first.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from openai import APIStatusError, BadRequestError, RateLimitError, UnprocessableEntityError
+
+from .llm_client import (
+    API_KEY_ENV_VARS,
+    ChatbotConfigurationError,
+    _env_float,
+    _env_int,
+    async_client_for,
+    client_for,
+    llm_base_url,
+    llm_model_name,
+)
+
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = _env_int("LLM_CIRCUIT_FAILURES", 3)
+COOLDOWN_SECONDS = _env_float("LLM_CIRCUIT_COOLDOWN_SECONDS", 30.0)
+MAX_COOLDOWN_SECONDS = _env_float("LLM_CIRCUIT_MAX_COOLDOWN_SECONDS", 300.0)
+RATE_LIMIT_COOLDOWN_SECONDS = _env_float("LLM_RATE_LIMIT_COOLDOWN_SECONDS", 20.0)
+HEDGE_AFTER_SECONDS = _env_float("LLM_HEDGE_AFTER_SECONDS", 4.0)
+MAX_ATTEMPTS = _env_int("LLM_MAX_ATTEMPTS", 3)
+EWMA_ALPHA = 0.3
+INFLIGHT_PENALTY = 0.25
+
+# Errors caused by the request itself; another backend would reject it too.
+_REQUEST_ERRORS = (BadRequestError, UnprocessableEntityError)
+
+
+class ProviderUnavailable(RuntimeError):
+    """No backend can take the request right now (rate limited or circuit open)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; ``rpm <= 0`` means unlimited."""
+
+    def __init__(self, rpm: int):
+        self.capacity = float(max(rpm, 0))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        if not self.capacity:
+            return True
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float) -> bool:
+        if not self.available(now):
+            return False
+        if self.capacity:
+            self.tokens -= 1
+        return True
+
+    def wait_time(self, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+@dataclass
+class Backend:
+    name: str
+    api_key: str
+    base_url: str
+    model: str
+    rpm: int = 0
+    bucket: TokenBucket = field(init=False)
+    failures: int = 0
+    open_until: float = 0.0
+    probing: bool = False
+    ttft_ewma: float = 0.0
+    in_flight: int = 0
+    successes: int = 0
+    errors: int = 0
+
+    def __post_init__(self):
+        self.bucket = TokenBucket(self.rpm)
+
+    @property
+    def score(self) -> float:
+        return self.ttft_ewma * (1 + self.failures) + INFLIGHT_PENALTY * self.in_flight
+
+    def state(self, now: float) -> str:
+        if self.open_until > now:
+            return "open"
+        if self.open_until:
+            return "half_open"
+        return "closed"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        if state == "open" or (state == "half_open" and self.probing):
+            return False
+        return self.bucket.available(now)
+
+    def retry_after(self, now: float) -> float:
+        return max(self.open_until - now, self.bucket.wait_time(now), 0.0)
+
+    def snapshot(self, now: float) -> Dict:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "base_url": self.base_url,
+            "state": self.state(now),
+            "failures": self.failures,
+            "ttft_ms": round(self.ttft_ewma * 1000, 1),
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "errors": self.errors,
+        }
+
+
+def _retry_after_header(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _is_request_error(exc: Exception) -> bool:
+    return isinstance(exc, _REQUEST_ERRORS)
+
+
+def _is_rate_limit(exc: Exception) -> bool:
+    return isinstance(exc, RateLimitError) or (isinstance(exc, APIStatusError) and exc.status_code == 429)
+
+
+class ProviderPool:
+    """Routes completions across backends; safe to share between threads."""
+
+    def __init__(self, backends: List[Backend]):
+        if not backends:
+            raise ChatbotConfigurationError(
+                "Cerebras API key is not configured. Set LLM_PROVIDERS or one of: "
+                + ", ".join(API_KEY_ENV_VARS) + "."
+            )
+        self.backends = backends
+        self._lock = threading.Lock()
+        # A lone backend keeps the SDK's own retries; with several, a failure
+        # is better spent on another backend than on backing off this one.
+        self.max_retries = None if len(backends) == 1 else 0
+
+    # -- health bookkeeping -------------------------------------------------
+
+    def _acquire(self, exclude: Tuple[str, ...] = ()) -> Optional[Backend]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b.name not in exclude and b.available(now)]
+            for backend in sorted(candidates, key=lambda b: b.score):
+                if backend.bucket.take(now):
+                    if backend.state(now) == "half_open":
+                        backend.probing = True
+                    backend.in_flight += 1
+                    return backend
+        return None
+
+    def _unavailable(self) -> ProviderUnavailable:
+        now = time.monotonic()
+        with self._lock:
+            wait = min(b.retry_after(now) for b in self.backends)
+        return ProviderUnavailable(
+            # Worded like the single-key quota error so callers treat it the same.
+            "Cerebras quota exceeded on every configured backend. Please try again later.",
+            retry_after=max(1.0, wait),
+        )
+
+    def _release(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+            backend.probing = False
+
+    def _record_success(self, backend: Backend, ttft: float) -> None:
+        with self._lock:
+            backend.failures = 0
+            backend.open_until = 0.0
+            backend.probing = False
+            backend.successes += 1
+            self._observe_ttft(backend, ttft)
+
+    def _record_slow(self, backend: Backend, elapsed: float) -> None:
+        """A hedge fired while ``backend`` had no first token after ``elapsed`` seconds."""
+        with self._lock:
+            # A lower bound on its TTFT: it may raise the estimate, never lower it.
+            self._observe_ttft(backend, max(min(elapsed, HEDGE_AFTER_SECONDS), backend.ttft_ewma))
+
+    @staticmethod
+    def _observe_ttft(backend: Backend, ttft: float) -> None:
+        backend.ttft_ewma = ttft if not backend.ttft_ewma else (
+            EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * backend.ttft_ewma
+        )
+
+    def _record_failure(self, backend: Backend, exc: Exception) -> None:
+        if _is_request_error(exc):
+            return
+        now = time.monotonic()
+        with self._lock:
+            backend.errors += 1
+            backend.failures += 1
+            backend.probing = False
+            if _is_rate_limit(exc):
+                cooldown = _retry_after_header(exc) or RATE_LIMIT_COOLDOWN_SECONDS
+            elif backend.failures >= FAILURE_THRESHOLD or backend.open_until:
+                steps = max(0, backend.failures - FAILURE_THRESHOLD)
+                cooldown = min(COOLDOWN_SECONDS * (2 ** steps), MAX_COOLDOWN_SECONDS)
+            else:
+                cooldown = 0.0
+            if cooldown:
+                backend.open_until = now + cooldown
+        logger.warning("LLM backend %s failed (%s): %s", backend.name, type(exc).__name__, exc)
+
+    def status(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [backend.snapshot(now) for backend in self.backends]
+
+    # -- non-streaming ------------------------------------------------------
+
+    def complete(self, build_kwargs: Callable[[Backend], Dict]):
+        """Blocking completion with failover. Returns ``(response, backend)``."""
+        tried: Tuple[str, ...] = ()
+        last_exc: Optional[Exception] = None
+        for _ in range(MAX_ATTEMPTS):
+            backend = self._acquire(tried)
+            if backend is None:
+                break
+            tried += (backend.name,)
+            started = time.monotonic()
+            try:
+                client = client_for(backend.api_key, backend.base_url, self.max_retries)
+                response = client.chat.completions.create(**build_kwargs(backend))
+            except Exception as exc:
+                self._record_failure(backend, exc)
+                if _is_request_error(exc):
+                    raise
+                last_exc = exc
+                continue
+            finally:
+                self._release(backend)
+            self._record_success(backend, time.monotonic() - started)
+            return response, backend
+        if last_exc is not None and not _is_rate_limit(last_exc):
+            raise last_exc
+        raise self._unavailable() from last_exc
+
+    # -- streaming ----------------------------------------------------------
+
+    def _open_sync(self, backend: Backend, kwargs: Dict):
+        """Open a stream and read its first chunk. Returns (stream, iterator, first, ttft)."""
+        started = time.monotonic()
+        stream = client_for(backend.api_key, backend.base_url, self.max_retries).chat.completions.create(**kwargs)
+        try:
+            iterator = iter(stream)
+            first = next(iterator, None)
+        except BaseException:
+            stream.close()
+            raise
+        return stream, iterator, first, time.monotonic() - started
+
+    def stream(self, build_kwargs: Callable[[Backend], Dict]) -> "CompletionStream":
+        return CompletionStream(self, build_kwargs)
+
+    def astream(self, build_kwargs: Callable[[Backend], Dict]) -> "AsyncCompletionStream":
+        return AsyncCompletionStream(self, build_kwargs)
+
+    async def _open_async(self, backend: Backend, kwargs: Dict):
+        started = time.monotonic()
+        client = async_client_for(backend.api_key, backend.base_url, self.max_retries)
+        stream = await client.chat.completions.create(**kwargs)
+        try:
+            iterator = stream.__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = None
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, iterator, first, time.monotonic() - started
+
+
+class CompletionStream:
+    """Iterator over chunks from whichever backend answered first.
+
+    Opening attempts run on short-lived threads only until their first chunk;
+    the winning stream is then read on the caller's thread and losers are
+    closed. ``backend`` is set once a backend has produced its first chunk.
+    """
+
+    def __init__(self, pool: ProviderPool, build_kwargs: Callable[[Backend], Dict]):
+        self.pool = pool
+        self.build_kwargs = build_kwargs
+        self.backend: Optional[Backend] = None
+        self.hedged = False
+        self._stream = None
+        self._iterator: Optional[Iterator] = None
+        self._first = None
+        self._close_lock = threading.Lock()
+
+    def _attempt(self, backend: Backend, results: "queue.Queue", settled: List[bool], lock: threading.Lock) -> None:
+        try:
+            opened = self.pool._open_sync(backend, self.build_kwargs(backend))
+        except Exception as exc:
+            self.pool._record_failure(backend, exc)
+            self.pool._release(backend)
+            results.put((backend, None, exc))
+            return
+        with lock:
+            if not settled[0]:
+                results.put((backend, opened, None))
+                return
+        # Another backend already won; drop this one.
+        opened[0].close()
+        self.pool._release(backend)
+
+    def _settle(self, results: "queue.Queue", settled: List[bool], lock: threading.Lock) -> None:
+        with lock:
+            settled[0] = True
+            leftovers = []
+            while True:
+                try:
+                    leftovers.append(results.get_nowait())
+                except queue.Empty:
+                    break
+        for backend, opened, _ in leftovers:
+            if opened is not None:
+                opened[0].close()
+                self.pool._release(backend)
+
+    def _start(self) -> None:
+        results: "queue.Queue" = queue.Queue()
+        settled = [False]
+        lock = threading.Lock()
+        tried: Tuple[str, ...] = ()
+        pending = 0
+        # Backends still opening, with their launch times.
+        opening: Dict[str, Tuple[Backend, float]] = {}
+        last_exc: Optional[Exception] = None
+
+        def launch() -> bool:
+            nonlocal tried, pending
+            backend = self.pool._acquire(tried)
+            if backend is None:
+                return False
+            tried += (backend.name,)
+            pending += 1
+            opening[backend.name] = (backend, time.monotonic())
+            threading.Thread(
+                target=self._attempt, args=(backend, results, settled, lock), daemon=True,
+                name=f"llm-open-{backend.name}",
+            ).start()
+            return True
+
+        if not launch():
+            raise self.pool._unavailable()
+        hedge_at = time.monotonic() + HEDGE_AFTER_SECONDS if HEDGE_AFTER_SECONDS > 0 else None
+        while pending:
+            timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+            try:
+                backend, opened, exc = results.get(timeout=timeout)
+            except queue.Empty:
+                hedge_at = None
+                now = time.monotonic()
+                for slow, started in list(opening.values()):
+                    self.pool._record_slow(slow, now - started)
+                if len(tried) < MAX_ATTEMPTS and launch():
+                    self.hedged = True
+                    logger.info("Hedging slow LLM stream on a second backend")
+                continue
+            pending -= 1
+            opening.pop(backend.name, None)
+            if exc is None:
+                self._settle(results, settled, lock)
+                self.backend = backend
+                self._stream, self._iterator, self._first, ttft = opened
+                self.pool._record_success(backend, ttft)
+                return
+            if _is_request_error(exc):
+                self._settle(results, settled, lock)
+                raise exc
+            last_exc = exc
+            if not pending and len(tried) < MAX_ATTEMPTS and launch():
+                continue
+        if last_exc is not None and not _is_rate_limit(last_exc):
+            raise last_exc
+        raise self.pool._unavailable() from last_exc
+
+    def __iter__(self):
+        self._start()
+        try:
+            if self._first is not None:
+                yield self._first
+            for chunk in self._iterator:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Close the upstream stream; safe to call from another thread to abort a read."""
+        with self._close_lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.close()
+            self.pool._release(self.backend)
+
+
+class AsyncCompletionStream:
+    """Async twin of ``CompletionStream`` built on tasks instead of threads."""
+
+    def __init__(self, pool: ProviderPool, build_kwargs: Callable[[Backend], Dict]):
+        self.pool = pool
+        self.build_kwargs = build_kwargs
+        self.backend: Optional[Backend] = None
+        self.hedged = False
+        self._stream = None
+        self._iterator: Optional[AsyncIterator] = None
+        self._first = None
+
+    async def _start(self) -> None:
+        tasks: Dict[asyncio.Task, Backend] = {}
+        launched_at: Dict[asyncio.Task, float] = {}
+        tried: Tuple[str, ...] = ()
+        last_exc: Optional[Exception] = None
+
+        def launch() -> bool:
+            nonlocal tried
+            backend = self.pool._acquire(tried)
+            if backend is None:
+                return False
+            tried += (backend.name,)
+            task = asyncio.ensure_future(self.pool._open_async(backend, self.build_kwargs(backend)))
+            tasks[task] = backend
+            launched_at[task] = time.monotonic()
+            return True
+
+        if not launch():
+            raise self.pool._unavailable()
+        hedge_at = time.monotonic() + HEDGE_AFTER_SECONDS if HEDGE_AFTER_SECONDS > 0 else None
+        try:
+            while tasks:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    now = time.monotonic()
+                    for task, slow in list(tasks.items()):
+                        self.pool._record_slow(slow, now - launched_at[task])
+                    if len(tried) < MAX_ATTEMPTS and launch():
+                        self.hedged = True
+                        logger.info("Hedging slow LLM stream on a second backend")
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        if self.backend is None:
+                            self.backend = backend
+                            self._stream, self._iterator, self._first, ttft = task.result()
+                            self.pool._record_success(backend, ttft)
+                        else:
+                            await task.result()[0].close()
+                            self.pool._release(backend)
+                        continue
+                    self.pool._record_failure(backend, exc)
+                    self.pool._release(backend)
+                    if _is_request_error(exc):
+                        raise exc
+                    last_exc = exc
+                if self.backend is not None:
+                    return
+                if not tasks and len(tried) < MAX_ATTEMPTS:
+                    launch()
+        finally:
+            # Losers (and everything, on cancellation) are cancelled here;
+            # ``_open_async`` closes a stream it already opened.
+            for task, backend in tasks.items():
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    await task.result()[0].close()
+                else:
+                    task.cancel()
+                self.pool._release(backend)
+        if last_exc is not None and not _is_rate_limit(last_exc):
+            raise last_exc
+        raise self.pool._unavailable() from last_exc
+
+    async def __aiter__(self):
+        await self._start()
+        try:
+            if self._first is not None:
+                yield self._first
+            async for chunk in self._iterator:
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._stream is not None:
+            stream, self._stream = self._stream, None
+            await stream.close()
+            self.pool._release(self.backend)
+
+
+def _configured_backends(default_model: str) -> List[Backend]:
+    raw = os.getenv("LLM_PROVIDERS", "").strip()
+    default_rpm = _env_int("LLM_BACKEND_RPM", 0)
+    if raw:
+        try:
+            entries = json.loads(raw)
+        except ValueError as exc:
+            raise ChatbotConfigurationError(f"LLM_PROVIDERS is not valid JSON: {exc}") from exc
+        backends = []
+        for index, entry in enumerate(entries):
+            api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""), "").strip()
+            if not api_key:
+                continue
+            backends.append(Backend(
+                name=str(entry.get("name") or f"backend-{index + 1}"),
+                api_key=api_key,
+                base_url=entry.get("base_url") or llm_base_url(),
+                model=entry.get("model") or llm_model_name(default_model),
+                rpm=int(entry.get("rpm", default_rpm)),
+            ))
+        return backends
+
+    backends = []
+    seen = set()
+    for name in API_KEY_ENV_VARS:
+        api_key = os.getenv(name, "").strip()
+        if api_key and api_key not in seen:
+            seen.add(api_key)
+            backends.append(Backend(
+                name=name.lower(),
+                api_key=api_key,
+                base_url=llm_base_url(),
+                model=llm_model_name(default_model),
+                rpm=default_rpm,
+            ))
+    return backends
+
+
+_pools: Dict[str, Tuple[Tuple, ProviderPool]] = {}
+_pools_lock = threading.Lock()
+
+
+def get_provider_pool(default_model: str) -> ProviderPool:
+    """Process-wide pool; rebuilt (losing health state) only when config changes."""
+    signature = (
+        os.getenv("LLM_PROVIDERS", ""),
+        os.getenv("LLM_BACKEND_RPM", ""),
+        llm_base_url(),
+        llm_model_name(default_model),
+    ) + tuple(os.getenv(name, "") for name in API_KEY_ENV_VARS)
+    with _pools_lock:
+        cached = _pools.get(default_model)
+        if cached is None or cached[0] != signature:
+            cached = (signature, ProviderPool(_configured_backends(default_model)))
+            _pools[default_model] = cached
+    return cached[1]
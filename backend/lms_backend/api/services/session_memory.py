@@ -0,0 +1,170 @@
+"""Bounded conversation memory for chat sessions.
+
+Prompt memory is a rolling per-session summary plus the last few turns.
+Recent turns are loaded as DB-side truncated previews (``Left``), so long
+responses are never transferred in full. After each turn, the turns that
+fell out of the recent window are folded into ``ChatSession.summary`` on a
+background thread; the summary itself is capped in tokens, so memory stays
+the same size however long the session grows. Summaries go through the
+shared provider pool and their tokens count against the session owner's
+daily quota.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.db import close_old_connections
+from django.db.models.functions import Left
+
+from myapp.chatbot_models import ChatMessage, ChatSession
+
+from .llm_client import ChatbotConfigurationError
+from .provider_pool import get_provider_pool
+from .token_budget import count_tokens, truncate_tokens
+from .usage_quota import record_token_usage
+
+
+logger = logging.getLogger(__name__)
+
+RECENT_TURNS = int(os.getenv("CHATBOT_MEMORY_TURNS", "4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CHATBOT_SUMMARY_MAX_TOKENS", "300"))
+SUMMARY_MODEL = os.getenv("CHATBOT_SUMMARY_MODEL", "llama3.1-8b")
+QUERY_PREVIEW_CHARS = 500
+RESPONSE_PREVIEW_CHARS = 800
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+def _preview_queryset(session_id):
+    return (
+        ChatMessage.objects.filter(session_id=session_id)
+        .annotate(
+            query_preview=Left("query", QUERY_PREVIEW_CHARS),
+            response_preview=Left("response", RESPONSE_PREVIEW_CHARS),
+        )
+        .values("id", "query_preview", "response_preview")
+    )
+
+
+def _memory_rows(session: ChatSession, turns: List[Dict]) -> List[Dict]:
+    rows = []
+    if session.summary:
+        rows.append({"summary": session.summary})
+    for turn in reversed(turns):
+        rows.append({"query": turn["query_preview"], "response": turn["response_preview"]})
+    return rows
+
+
+def load_session_memory(session: ChatSession, turns: int = RECENT_TURNS) -> List[Dict]:
+    recent = list(_preview_queryset(session.id).order_by("-id")[: max(1, turns)])
+    return _memory_rows(session, recent)
+
+
+async def aload_session_memory(session: ChatSession, turns: int = RECENT_TURNS) -> List[Dict]:
+    recent = [row async for row in _preview_queryset(session.id).order_by("-id")[: max(1, turns)]]
+    return _memory_rows(session, recent)
+
+
+def _extractive_summary(summary: str, turns: List[Dict]) -> str:
+    lines = [summary] if summary else []
+    for turn in turns:
+        lines.append(f"User asked: {truncate_tokens(turn['query_preview'], 40)}")
+        if turn["response_preview"]:
+            lines.append(f"Assistant covered: {truncate_tokens(turn['response_preview'], 50)}")
+    return "\n".join(lines)
+
+
+def _model_summary(summary: str, turns: List[Dict]) -> Tuple[str, Optional[int]]:
+    """Merged summary text and the total tokens the call used."""
+    transcript = "\n".join(
+        f"User: {turn['query_preview']}\nAssistant: {turn['response_preview']}" for turn in turns
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a tutoring conversation. Merge the new turns "
+                "into the existing summary. Keep the learner's goals, courses, facts they shared "
+                f"and open questions. Plain text, at most {SUMMARY_MAX_TOKENS // 2} words."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}",
+        },
+    ]
+    # The summary model is pinned: backends resolve their model from
+    # CEREBRAS_MODEL / LLM_PROVIDERS, which name the main chat model.
+    completion, _ = get_provider_pool(SUMMARY_MODEL).complete(
+        lambda backend: {
+            "model": SUMMARY_MODEL,
+            "messages": messages,
+            "max_completion_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0.2,
+        }
+    )
+    text = ((completion.choices[0].message.content if completion.choices else None) or "").strip()
+    return text, getattr(getattr(completion, "usage", None), "total_tokens", None)
+
+
+def _keep_newest(text: str, max_tokens: int) -> str:
+    """Trim from the start so the most recent part of the summary survives."""
+    lines = text.splitlines()
+    while lines and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines) or truncate_tokens(text, max_tokens)
+
+
+def update_session_summary(session_id) -> bool:
+    """Fold turns older than the recent window into the session summary."""
+    session = ChatSession.objects.filter(pk=session_id).only(
+        "id", "user_id", "summary", "summary_message_id"
+    ).first()
+    if session is None:
+        return False
+    recent_ids = list(
+        ChatMessage.objects.filter(session_id=session_id).order_by("-id").values_list("id", flat=True)[:RECENT_TURNS]
+    )
+    if len(recent_ids) < RECENT_TURNS:
+        return False
+    pending = _preview_queryset(session_id).filter(id__lt=recent_ids[-1]).order_by("id")
+    if session.summary_message_id:
+        pending = pending.filter(id__gt=session.summary_message_id)
+    turns = list(pending[:20])
+    if not turns:
+        return False
+
+    try:
+        summary, tokens = _model_summary(session.summary, turns)
+        record_token_usage(session.user_id, tokens)
+    except ChatbotConfigurationError:
+        summary = ""
+    except Exception:
+        logger.warning("Chat summary model call failed; using extractive summary", exc_info=True)
+        summary = ""
+    if not summary:
+        summary = _extractive_summary(session.summary, turns)
+    summary = _keep_newest(summary, SUMMARY_MAX_TOKENS)
+
+    # Optimistic write: if another worker folded these turns first, skip.
+    updated = ChatSession.objects.filter(
+        pk=session_id, summary_message_id=session.summary_message_id
+    ).update(summary=summary, summary_message_id=turns[-1]["id"])
+    return bool(updated)
+
+
+def _run_summary_update(session_id) -> None:
+    close_old_connections()
+    try:
+        update_session_summary(session_id)
+    except Exception:
+        logger.exception("Failed to update summary for chat session %s", session_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_summary_update(session_id) -> None:
+    """Update the session summary off the request path."""
+    _summary_pool.submit(_run_summary_update, session_id)
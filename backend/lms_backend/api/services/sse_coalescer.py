@@ -0,0 +1,125 @@
+"""Coalescing of streamed chat deltas into fewer, larger SSE writes.
+
+Upstream models emit one delta per token. Writing each as its own SSE frame
+means thousands of tiny writes (each flushed through the proxy, see
+``X-Accel-Buffering: no``) per answer. ``SSECoalescer`` merges consecutive
+``token`` / ``reasoning_token`` deltas and flushes them when
+``CHATBOT_SSE_FLUSH_MS`` have passed since the last write or
+``CHATBOT_SSE_FLUSH_CHARS`` characters are buffered, whichever comes first.
+The first text delta of a response is always written at once, so time to
+first token is unchanged, and a slow stream (gaps longer than the window)
+degrades to one write per delta. Every other event (``meta``,
+``tool_call``, ``done``, ``error``, ...) drains the buffer and is written
+immediately, in order. ``CHATBOT_SSE_FLUSH_MS=0`` turns coalescing off.
+
+When events carry ids (see ``chat_stream_log``), a merged frame takes the
+id of the last delta it contains, so ``Last-Event-ID`` resumes exactly
+after the text the client has seen. Callers flush on their own timer using
+``seconds_until_flush``.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+
+COALESCED_EVENTS = frozenset({"token", "reasoning_token"})
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def sse_frame(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    payload = json.dumps(data, ensure_ascii=True, separators=(",", ":"))
+    if event_id is not None:
+        return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class SSECoalescer:
+    """Buffers text deltas; ``push`` returns what should be written now ("" for nothing)."""
+
+    def __init__(
+        self,
+        flush_ms: Optional[int] = None,
+        flush_chars: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if flush_ms is None:
+            flush_ms = _env_int("CHATBOT_SSE_FLUSH_MS", 50)
+        if flush_chars is None:
+            flush_chars = _env_int("CHATBOT_SSE_FLUSH_CHARS", 512)
+        self.flush_seconds = flush_ms / 1000
+        self.flush_chars = flush_chars
+        self.clock = clock
+        self._runs: List[List] = []  # [event, [text, ...], last id] in arrival order
+        self._buffered_chars = 0
+        self._last_write: Optional[float] = None
+        self._text_started = False
+        self.deltas = 0
+        self.frames = 0
+        self.writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_seconds > 0
+
+    def push(self, event: str, data: Dict, event_id: Optional[int] = None) -> str:
+        text = data.get("text") if isinstance(data, dict) else None
+        if (
+            not self.enabled
+            or event not in COALESCED_EVENTS
+            or not isinstance(text, str)
+            or len(data) != 1
+        ):
+            return self._write(self._drain() + [sse_frame(event, data, event_id)])
+
+        self.deltas += 1
+        if self._runs and self._runs[-1][0] == event:
+            self._runs[-1][1].append(text)
+            self._runs[-1][2] = event_id
+        else:
+            self._runs.append([event, [text], event_id])
+        self._buffered_chars += len(text)
+
+        if (
+            not self._text_started
+            or self.clock() - self._last_write >= self.flush_seconds
+            or (self.flush_chars and self._buffered_chars >= self.flush_chars)
+        ):
+            self._text_started = True
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        """Write out whatever is buffered."""
+        return self._write(self._drain())
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """Time left before buffered text is due, or ``None`` when nothing is buffered."""
+        if not self._runs:
+            return None
+        return max(0.0, self._last_write + self.flush_seconds - self.clock())
+
+    def stats(self) -> Dict[str, int]:
+        return {"deltas": self.deltas, "frames": self.frames, "writes": self.writes}
+
+    def _drain(self) -> List[str]:
+        frames = [sse_frame(event, {"text": "".join(parts)}, event_id) for event, parts, event_id in self._runs]
+        self._runs = []
+        self._buffered_chars = 0
+        return frames
+
+    def _write(self, frames: List[str]) -> str:
+        if not frames:
+            return ""
+        self.frames += len(frames)
+        self.writes += 1
+        self._last_write = self.clock()
+        return "".join(frames)
+
@@ -1,9 +1,43 @@
+"""Chatbot tool registry with a TTL result cache.
+
+Tool results are cached in the Django cache under the tool name and its
+normalized arguments. Each cached tool declares the data it depends on as
+tags (``"courses"``, ``"progress:{user_id}"``, ...); a tag's version number
+is part of every key, so bumping it from a model signal invalidates all
+dependent entries at once. Personal tools use per-user tags built from
+their own arguments, so they are both keyed and invalidated per user.
+"""
+
+import functools
+import hashlib
+import json
+import os
 from dataclasses import dataclass
-from typing import Callable, Dict, List
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from myapp.models import Course, CourseRating, Enrollment, User
 
 from .postgres_functions import PostgreSQLFunctions
 
 
+TOOL_CACHE_PREFIX = "chat_tool"
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+
+# Read from the environment once at import. The wrapper checks this module
+# attribute on every call, so load tests can flip it to compare cached and
+# uncached tool paths.
+TOOL_CACHE_ENABLED = os.getenv("CHATBOT_TOOL_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "off", "no"}
+
+_MISSING = object()
+
+
 @dataclass
 class ChatTool:
     name: str
@@ -12,55 +46,194 @@ class ChatTool:
     fn: Callable[..., object]
 
 
+def _normalize_arg(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _normalized_args(kwargs: Dict) -> str:
+    args = {key: _normalize_arg(value) for key, value in kwargs.items() if value is not None}
+    return json.dumps(args, sort_keys=True, default=str)
+
+
+def _tag_key(tag: str) -> str:
+    return f"{TOOL_CACHE_PREFIX}:tag:{tag}"
+
+
+def _tag_versions(tags: Iterable[str]) -> str:
+    keys = [_tag_key(tag) for tag in tags]
+    if not keys:
+        return ""
+    versions = cache.get_many(keys)
+    return ".".join(str(versions.get(key, 1)) for key in keys)
+
+
+def invalidate_tool_cache(*tags: str) -> None:
+    """Bump the given tags so every cached tool result depending on them expires."""
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+
+
+def cached_tool(ttl: int, tags: Tuple[str, ...] = ()):
+    """Cache a tool function's result for ``ttl`` seconds.
+
+    ``tags`` may reference the call's arguments (``"progress:{user_id}"``).
+    The wrapped function keeps its signature; ``wrapper.call_with_status``
+    additionally reports whether the result was a cache hit or miss.
+    """
+
+    def decorator(fn):
+        name = fn.__name__
+
+        def call_with_status(**kwargs) -> Tuple[object, Optional[str]]:
+            if not TOOL_CACHE_ENABLED:
+                return fn(**kwargs), None
+            resolved_tags = [tag.format(**kwargs) for tag in tags]
+            digest = hashlib.sha1(_normalized_args(kwargs).encode("utf-8")).hexdigest()
+            key = f"{TOOL_CACHE_PREFIX}:{name}:{_tag_versions(resolved_tags)}:{digest}"
+            result = cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result, CACHE_HIT
+            result = fn(**kwargs)
+            cache.set(key, result, timeout=ttl)
+            return result, CACHE_MISS
+
+        @functools.wraps(fn)
+        def wrapper(**kwargs):
+            return call_with_status(**kwargs)[0]
+
+        wrapper.call_with_status = call_with_status
+        wrapper.cache_ttl = ttl
+        wrapper.cache_tags = tags
+        return wrapper
+
+    return decorator
+
+
+def call_tool(tool: ChatTool, args: Dict) -> Tuple[object, Optional[str]]:
+    """Run a tool, returning its result and cache status (None if uncached)."""
+    call_with_status = getattr(tool.fn, "call_with_status", None)
+    if call_with_status is None:
+        return tool.fn(**args), None
+    return call_with_status(**args)
+
+
+CATALOG_TAGS = ("courses", "ratings", "enrollments")
+
+
 def build_tool_registry(db: PostgreSQLFunctions) -> Dict[str, ChatTool]:
     return {
         "get_courses_by_filters": ChatTool(
             name="get_courses_by_filters",
             description="Filter published courses by category, difficulty, rating, and budget.",
             roles=["student", "teacher", "admin"],
-            fn=db.get_courses_by_filters,
+            fn=cached_tool(ttl=300, tags=CATALOG_TAGS)(db.get_courses_by_filters),
         ),
         "get_top_courses_by_rating": ChatTool(
             name="get_top_courses_by_rating",
             description="Fetch top-rated courses with a minimum reviews threshold.",
             roles=["student", "teacher", "admin"],
-            fn=db.get_top_courses_by_rating,
+            fn=cached_tool(ttl=300, tags=CATALOG_TAGS)(db.get_top_courses_by_rating),
         ),
         "get_courses_by_goal": ChatTool(
             name="get_courses_by_goal",
             description="Recommend courses based on learning goal, level, and budget.",
             roles=["student", "teacher", "admin"],
-            fn=db.get_courses_by_goal,
+            fn=cached_tool(ttl=300, tags=CATALOG_TAGS)(db.get_courses_by_goal),
         ),
         "get_student_progress_summary": ChatTool(
             name="get_student_progress_summary",
             description="Summarize a student's course progress and completion status.",
             roles=["student"],
-            fn=db.get_student_progress_summary,
+            fn=cached_tool(ttl=120, tags=("courses", "progress:{user_id}"))(
+                db.get_student_progress_summary
+            ),
         ),
         "get_teacher_course_performance": ChatTool(
             name="get_teacher_course_performance",
             description="Summarize teacher-owned course performance and engagement metrics.",
             roles=["teacher"],
-            fn=db.get_teacher_course_performance,
+            fn=cached_tool(ttl=120, tags=("courses", "teacher:{teacher_id}"))(
+                db.get_teacher_course_performance
+            ),
+        ),
+        "search_course_material": ChatTool(
+            name="search_course_material",
+            description="Search lesson text, modules and assignments of the user's own courses.",
+            roles=["student", "teacher"],
+            fn=cached_tool(ttl=300, tags=("material", "progress:{user_id}", "teacher:{user_id}"))(
+                db.search_course_material
+            ),
         ),
         "get_admin_progress_leaderboard": ChatTool(
             name="get_admin_progress_leaderboard",
             description="Fetch student progress leaderboard for admin analytics.",
             roles=["admin"],
-            fn=db.get_admin_progress_leaderboard,
+            fn=cached_tool(ttl=120)(db.get_admin_progress_leaderboard),
         ),
         "get_admin_course_risk_report": ChatTool(
             name="get_admin_course_risk_report",
             description="Report high-risk courses based on low completion/ratings.",
             roles=["admin"],
-            fn=db.get_admin_course_risk_report,
+            fn=cached_tool(ttl=300, tags=CATALOG_TAGS)(db.get_admin_course_risk_report),
         ),
         "get_platform_snapshot": ChatTool(
             name="get_platform_snapshot",
             description="Get top-level platform usage totals for admins.",
             roles=["admin"],
-            fn=db.get_platform_snapshot,
+            fn=cached_tool(ttl=60, tags=("courses", "enrollments", "users"))(db.get_platform_snapshot),
         ),
     }
 
+
+@lru_cache(maxsize=1)
+def get_tool_registry() -> Dict[str, ChatTool]:
+    """Process-wide registry; the tools are stateless so one copy is enough."""
+    return build_tool_registry(PostgreSQLFunctions())
+
+
+def _teacher_tag(instance) -> str:
+    # Avoid a query when the course is already loaded on the instance.
+    if instance._meta.get_field("course").is_cached(instance):
+        teacher_id = instance.course.teacher_id
+    else:
+        teacher_id = Course.objects.filter(pk=instance.course_id).values_list("teacher_id", flat=True).first()
+    return f"teacher:{teacher_id}"
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def _course_changed(sender, instance, **kwargs):
+    # Covers publishing/unpublishing as well as catalog edits.
+    invalidate_tool_cache("courses", f"teacher:{instance.teacher_id}")
+
+
+@receiver(post_save, sender=CourseRating)
+@receiver(post_delete, sender=CourseRating)
+def _rating_changed(sender, instance, **kwargs):
+    invalidate_tool_cache("ratings", _teacher_tag(instance))
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def _enrollment_changed(sender, instance, created=True, **kwargs):
+    tags = [f"progress:{instance.student_id}", _teacher_tag(instance)]
+    # Progress updates save the enrollment constantly; only a new or removed
+    # enrollment changes the catalog-wide enrollment counts.
+    if created:
+        tags.append("enrollments")
+    invalidate_tool_cache(*tags)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, created=True, **kwargs):
+    if created:
+        invalidate_tool_cache("users")
@@ -0,0 +1,235 @@
+"""Per-user LLM quotas: concurrent requests, requests per minute, tokens per day.
+
+Limits are configured per role (``CHATBOT_QUOTA_<ROLE>_CONCURRENT``,
+``..._RPM``, ``..._DAILY_TOKENS``; ``0`` disables a limit) and enforced per
+user before any upstream call. Counters live in the Django cache and are
+updated with ``add``/``incr``, which are atomic on Redis. Set ``REDIS_URL``
+in production: with the per-process LocMem fallback every worker keeps its
+own counters, so each user effectively gets the limits once per worker. The
+system check ``api.W001`` flags that setup.
+
+Daily token usage is accounted from ``ChatMessage`` token counts: a cold
+counter is seeded from the day's messages and then incremented as turns
+complete. Lesson and assignment generation do not create chat messages, so
+their usage only reaches the cached counter.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from myapp.chatbot_models import ChatMessage
+
+
+QUOTA_CACHE_PREFIX = "llm_quota"
+LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+SHARED_CACHE_WARNING = (
+    "The default cache is process-local, so LLM quotas and chat cancel flags "
+    "are per worker process. Set REDIS_URL to share them."
+)
+# Safety net for slots whose release never ran (killed worker).
+LEASE_TTL_SECONDS = int(os.getenv("CHATBOT_QUOTA_LEASE_SECONDS", "600"))
+
+CONCURRENT = "concurrent_requests"
+REQUESTS_PER_MINUTE = "requests_per_minute"
+TOKENS_PER_DAY = "tokens_per_day"
+
+DEFAULT_LIMITS = {
+    "student": {CONCURRENT: 2, REQUESTS_PER_MINUTE: 10, TOKENS_PER_DAY: 150_000},
+    "teacher": {CONCURRENT: 3, REQUESTS_PER_MINUTE: 20, TOKENS_PER_DAY: 400_000},
+    "admin": {CONCURRENT: 5, REQUESTS_PER_MINUTE: 60, TOKENS_PER_DAY: 0},
+}
+_ENV_SUFFIXES = {CONCURRENT: "CONCURRENT", REQUESTS_PER_MINUTE: "RPM", TOKENS_PER_DAY: "DAILY_TOKENS"}
+
+
+def role_limits(role: str) -> Dict[str, int]:
+    defaults = DEFAULT_LIMITS.get(role, DEFAULT_LIMITS["student"])
+    limits = {}
+    for quota, default in defaults.items():
+        raw = os.getenv(f"CHATBOT_QUOTA_{str(role).upper()}_{_ENV_SUFFIXES[quota]}", "")
+        try:
+            limits[quota] = max(0, int(raw)) if raw.strip() else default
+        except ValueError:
+            limits[quota] = default
+    return limits
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, quota: str, limit: int, retry_after: int):
+        super().__init__(f"{quota} limit of {limit} reached")
+        self.quota = quota
+        self.limit = limit
+        self.retry_after = max(1, int(retry_after))
+
+    def as_dict(self) -> Dict:
+        messages = {
+            CONCURRENT: "You already have the maximum number of AI requests running. Wait for one to finish.",
+            REQUESTS_PER_MINUTE: "You are sending AI requests too quickly. Please slow down.",
+            TOKENS_PER_DAY: "You have used your AI allowance for today.",
+        }
+        return {
+            "detail": messages.get(self.quota, "AI usage limit reached."),
+            "code": "quota_exceeded",
+            "quota": self.quota,
+            "limit": self.limit,
+            "retry_after": self.retry_after,
+        }
+
+
+def _key(*parts) -> str:
+    return ":".join([QUOTA_CACHE_PREFIX, *map(str, parts)])
+
+
+def _incr(key: str, timeout: int) -> int:
+    cache.add(key, 0, timeout=timeout)
+    try:
+        value = cache.incr(key)
+    except ValueError:
+        # Expired between add and incr.
+        cache.set(key, 1, timeout=timeout)
+        return 1
+    # ``add`` only sets the TTL when it creates the key; push it out again so
+    # a counter that is in use never expires under its holders.
+    cache.touch(key, timeout)
+    return value
+
+
+def _decr(key: str, timeout: Optional[int] = None) -> None:
+    try:
+        cache.decr(key)
+    except ValueError:
+        return
+    if timeout:
+        cache.touch(key, timeout)
+
+
+def _day_start(day) -> datetime:
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def _seconds_until_tomorrow() -> int:
+    now = timezone.localtime()
+    tomorrow = _day_start(now.date() + timedelta(days=1))
+    return int((tomorrow - now).total_seconds()) + 1
+
+
+def _message_tokens():
+    return Coalesce(F("token_count_input"), 0) + Coalesce(F("token_count_output"), 0)
+
+
+def tokens_used_today(user_id) -> int:
+    day = timezone.localdate()
+    key = _key("tokens", user_id, day.isoformat())
+    used = cache.get(key)
+    if used is None:
+        used = ChatMessage.objects.filter(
+            user_id=user_id, created_at__gte=_day_start(day)
+        ).aggregate(total=Coalesce(Sum(_message_tokens()), 0))["total"]
+        # ``add`` so a concurrent ``record_token_usage`` increment is not overwritten.
+        cache.add(key, used, timeout=2 * 24 * 3600)
+        used = cache.get(key, used)
+    return used
+
+
+def record_token_usage(user_id, tokens: Optional[int]) -> None:
+    """Add a finished turn's tokens to today's counter (if it is warm)."""
+    if not tokens:
+        return
+    try:
+        cache.incr(_key("tokens", user_id, timezone.localdate().isoformat()), int(tokens))
+    except ValueError:
+        # Cold counter: the next check seeds it from ChatMessage, which
+        # already includes this turn.
+        pass
+
+
+@dataclass
+class QuotaLease:
+    """A held concurrency slot; ``release`` is idempotent."""
+
+    key: Optional[str]
+    released: bool = False
+
+    def release(self) -> None:
+        if not self.released and self.key:
+            _decr(self.key, timeout=LEASE_TTL_SECONDS)
+        self.released = True
+
+
+def acquire_quota(user) -> QuotaLease:
+    """Check the user's quotas and take a concurrency slot, or raise ``QuotaExceeded``."""
+    limits = role_limits(user.role)
+
+    token_limit = limits[TOKENS_PER_DAY]
+    if token_limit and tokens_used_today(user.id) >= token_limit:
+        raise QuotaExceeded(TOKENS_PER_DAY, token_limit, _seconds_until_tomorrow())
+
+    rpm_limit = limits[REQUESTS_PER_MINUTE]
+    if rpm_limit:
+        now = timezone.now()
+        window = int(now.timestamp() // 60)
+        if _incr(_key("rpm", user.id, window), timeout=120) > rpm_limit:
+            raise QuotaExceeded(REQUESTS_PER_MINUTE, rpm_limit, 60 - now.second)
+
+    concurrent_limit = limits[CONCURRENT]
+    if not concurrent_limit:
+        return QuotaLease(key=None)
+    key = _key("active", user.id)
+    if _incr(key, timeout=LEASE_TTL_SECONDS) > concurrent_limit:
+        _decr(key, timeout=LEASE_TTL_SECONDS)
+        raise QuotaExceeded(CONCURRENT, concurrent_limit, 5)
+    return QuotaLease(key=key)
+
+
+def active_requests(user_id) -> int:
+    return max(0, int(cache.get(_key("active", user_id)) or 0))
+
+
+def usage_report(day=None, limit: int = 50) -> Dict:
+    """Per-role totals and top users by tokens for one day, from ``ChatMessage``."""
+    day = day or timezone.localdate()
+    start = _day_start(day)
+    messages = ChatMessage.objects.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+    aggregates = {
+        "requests": Count("id"),
+        "errors": Count("id", filter=Q(status="error")),
+        "tokens_input": Coalesce(Sum("token_count_input"), 0),
+        "tokens_output": Coalesce(Sum("token_count_output"), 0),
+        "tokens": Coalesce(Sum(_message_tokens()), 0),
+    }
+    roles = list(messages.values("role").annotate(users=Count("user_id", distinct=True), **aggregates).order_by("role"))
+    for row in roles:
+        row["limits"] = role_limits(row["role"])
+
+    users = list(
+        messages.values("user_id", "user__username", "user__role")
+        .annotate(**aggregates)
+        .order_by("-tokens")[: max(1, min(int(limit), 500))]
+    )
+    for row in users:
+        token_limit = role_limits(row["user__role"])[TOKENS_PER_DAY]
+        row["tokens_limit"] = token_limit
+        row["tokens_remaining"] = max(0, token_limit - row["tokens"]) if token_limit else None
+        row["active_requests"] = active_requests(row["user_id"])
+    return {"date": day.isoformat(), "roles": roles, "users": users}
+
+
+def uses_process_local_cache() -> bool:
+    return settings.CACHES.get("default", {}).get("BACKEND") in LOCAL_CACHE_BACKENDS
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    if settings.DEBUG or not uses_process_local_cache():
+        return []
+    return [checks.Warning(SHARED_CACHE_WARNING, hint="Configure REDIS_URL.", id="api.W001")]
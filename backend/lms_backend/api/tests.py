@@ -1,3 +1,614 @@
-from django.test import TestCase
+import hashlib
+import json
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import types
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from unittest import skipIf
+
+from api.services import chat_search, chat_stream_log, provider_pool, session_memory, token_budget, usage_quota
+from api.services.badge_engine import badge_engine
+from api.services.gamification import GamificationEvent, apply_gamification_events
+from api.services.intent_router import IntentRouter
+from api.services.llm_client import API_KEY_ENV_VARS
+from api.services.provider_pool import Backend, ProviderPool
+from api.services.sse_coalescer import SSECoalescer
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+from llm_stub_server import StubConfig, start_stub_server  # noqa: E402
+from myapp.management.commands import recompute_streaks, train_intent_model  # noqa: E402
+from myapp.models import (  # noqa: E402
+    Badge, ChatMessage, ChatSession, DailyActivity, User, UserBadge, UserStats, XPTransaction,
+)
+
+
+class ProviderPoolStubTests(SimpleTestCase):
+    """Failover and hedging against local OpenAI-compatible stub servers."""
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def _backend(self, name, **config):
+        config.setdefault('jitter_ms', 0)
+        config.setdefault('ttft_ms', 10)
+        config.setdefault('tokens_per_second', 0)
+        config.setdefault('response_tokens', 3)
+        server, stats = start_stub_server(StubConfig(**config))
+        self.servers.append(server)
+        backend = Backend(
+            name=name,
+            api_key='stub',
+            base_url=f'http://127.0.0.1:{server.server_address[1]}/v1',
+            model='stub-model',
+        )
+        return backend, stats
+
+    @staticmethod
+    def _kwargs(stream):
+        return lambda backend: {
+            'model': backend.model,
+            'messages': [{'role': 'user', 'content': 'hi'}],
+            'stream': stream,
+        }
+
+    @staticmethod
+    def _read(stream):
+        text = ''
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+        return text
+
+    def test_stream_fails_over_on_429(self):
+        limited, limited_stats = self._backend('limited', rate_limit_rate=1.0, retry_after=30)
+        healthy, healthy_stats = self._backend('healthy')
+        pool = ProviderPool([limited, healthy])
+
+        stream = pool.stream(self._kwargs(True))
+        self.assertEqual(len(self._read(stream).split()), 3)
+        self.assertIs(stream.backend, healthy)
+        self.assertEqual(limited_stats.snapshot()['rate_limited'], 1)
+        status = {row['name']: row for row in pool.status()}
+        self.assertEqual(status['limited']['state'], 'open')
+        self.assertEqual(status['healthy']['successes'], 1)
+
+        # The open circuit keeps the next request off the rate-limited backend.
+        self.assertEqual(len(self._read(pool.stream(self._kwargs(True))).split()), 3)
+        self.assertEqual(limited_stats.snapshot()['requests'], 1)
+
+    def test_complete_fails_over_on_429(self):
+        limited, _ = self._backend('limited', rate_limit_rate=1.0)
+        healthy, _ = self._backend('healthy')
+        response, backend = ProviderPool([limited, healthy]).complete(self._kwargs(False))
+        self.assertIs(backend, healthy)
+        self.assertEqual(response.usage.completion_tokens, 3)
+
+    def test_slow_backend_is_hedged_and_demoted(self):
+        slow, slow_stats = self._backend('slow', ttft_ms=1500)
+        fast, _ = self._backend('fast')
+        pool = ProviderPool([slow, fast])
+
+        with mock.patch.object(provider_pool, 'HEDGE_AFTER_SECONDS', 0.2):
+            stream = pool.stream(self._kwargs(True))
+            self._read(stream)
+        self.assertTrue(stream.hedged)
+        self.assertIs(stream.backend, fast)
+        # The loser's wait counts as a TTFT observation even though it never won.
+        self.assertGreaterEqual(slow.ttft_ewma, 0.2)
+        self.assertGreater(slow.score, fast.score)
+
+        # So the next request goes to the fast backend without waiting for a hedge.
+        stream = pool.stream(self._kwargs(True))
+        self._read(stream)
+        self.assertIs(stream.backend, fast)
+        self.assertFalse(stream.hedged)
+        self.assertEqual(slow_stats.snapshot()['requests'], 1)
+
+
+class SessionSummaryModelTests(SimpleTestCase):
+    """Session summaries use CHATBOT_SUMMARY_MODEL whatever the chat model is."""
+
+    def test_summary_ignores_chat_model(self):
+        server, _ = start_stub_server(StubConfig(jitter_ms=0, ttft_ms=0, tokens_per_second=0, response_tokens=3))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        env = {name: '' for name in API_KEY_ENV_VARS}
+        env.update({
+            'CEREBRAS_API_KEY': 'stub',
+            'CEREBRAS_BASE_URL': f'http://127.0.0.1:{server.server_address[1]}/v1',
+            'CEREBRAS_MODEL': 'zai-glm-4.7',
+            'LLM_PROVIDERS': '',
+        })
+        models = []
+        complete = ProviderPool.complete
+
+        def spy(pool, build_kwargs, *args, **kwargs):
+            response, backend = complete(pool, build_kwargs, *args, **kwargs)
+            models.append((backend.model, response.model))
+            return response, backend
+
+        turns = [{'query_preview': 'What is a loop?', 'response_preview': 'A loop repeats code.'}]
+        with mock.patch.dict('os.environ', env), mock.patch.object(ProviderPool, 'complete', spy):
+            text, tokens = session_memory._model_summary('', turns)
+        self.assertTrue(text)
+        self.assertIsNotNone(tokens)
+        self.assertEqual(models, [('zai-glm-4.7', session_memory.SUMMARY_MODEL)])
+
+
+class StreamLivenessTests(TestCase):
+    """Resumes judge liveness by the heartbeat; final saves keep an interrupted verdict."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('streamer', 'streamer@example.com', 'pw')
+        self.message = ChatMessage.objects.create(user=self.user, role='student', query='q', status='partial')
+
+    def _resume(self):
+        return ''.join(chat_stream_log.checkpoint_stream(self.message.id, {}))
+
+    def test_heartbeat_keeps_quiet_generation_alive(self):
+        # Registered directly so the heartbeat thread does not start under the test.
+        log = chat_stream_log._logs[self.message.id] = chat_stream_log.StreamLog(self.message.id)
+        self.addCleanup(chat_stream_log._logs.pop, self.message.id, None)
+        self.assertEqual(chat_stream_log.touch_live_messages(), 1)
+        first = ChatMessage.objects.get(pk=self.message.id).heartbeat_at
+        self.assertIsNotNone(first)
+
+        # No text for longer than the stale window, but the heartbeat moves.
+        beats = iter(range(3))
+        real_sleep = chat_stream_log.time.sleep
+
+        def sleep(_):
+            real_sleep(0.1)
+            if next(beats, None) is None:
+                log.finish()
+                ChatMessage.objects.filter(pk=self.message.id).update(status='completed', response='done')
+            else:
+                chat_stream_log.touch_live_messages()
+
+        with mock.patch.object(chat_stream_log, 'RESUME_STALE_SECONDS', 0.05), \
+                mock.patch.object(chat_stream_log.time, 'sleep', sleep):
+            body = self._resume()
+        self.assertIn('event: done', body)
+        self.assertNotIn('stream_unavailable', body)
+
+    def test_silent_row_is_interrupted_and_final_save_keeps_it(self):
+        with mock.patch.object(chat_stream_log, 'RESUME_STALE_SECONDS', 0.0):
+            self.assertIn('stream_unavailable', self._resume())
+        self.message.status = 'completed'
+        self.message.response = 'late answer'
+        self.assertFalse(chat_stream_log.save_final(self.message, ['status', 'response']))
+        row = ChatMessage.objects.get(pk=self.message.id)
+        self.assertEqual((row.status, row.error_code, row.response), ('error', 'stream_interrupted', ''))
+
+    async def test_async_cancel_poll_does_not_block_the_loop(self):
+        log = chat_stream_log.StreamLog(self.message.id)
+        await chat_stream_log.cache.aset(chat_stream_log._cancel_key(self.message.id), True)
+        loop_thread = threading.current_thread()
+        read_threads = []
+        get = chat_stream_log.cache.get
+
+        def spy(*args, **kwargs):
+            read_threads.append(threading.current_thread())
+            return get(*args, **kwargs)
+
+        with mock.patch.object(chat_stream_log, 'CANCEL_POLL_SECONDS', 0.0), \
+                mock.patch.object(chat_stream_log.cache, 'get', spy):
+            self.assertTrue(await log.acancelled())
+        self.assertTrue(read_threads)
+        self.assertNotIn(loop_thread, read_threads)
+
+    def test_final_save_wins_over_late_interrupt(self):
+        self.message.status = 'completed'
+        self.assertTrue(chat_stream_log.save_final(self.message, ['status']))
+        chat_stream_log._mark_interrupted(self.message.id)
+        self.assertEqual(ChatMessage.objects.get(pk=self.message.id).status, 'completed')
+
+
+class TokenCountTests(SimpleTestCase):
+    """Token counts against fixed cl100k_base BPE counts."""
+
+    # (text, BPE token count under cl100k_base)
+    SAMPLES = [
+        (
+            "A closure is a function that remembers the variables from the scope in which it was created, "
+            "even after that scope has finished executing. Decorators build on closures: they take a function, "
+            "wrap it in another function that adds behaviour such as logging or caching, and return the wrapper. "
+            "In this lesson you will write your own decorators, learn why functools.wraps matters, and see how "
+            "generators yield values lazily instead of building whole lists in memory.",
+            89,
+        ),
+        (
+            '[{"course_id":12,"title":"Introduction to Python","progress":42.5,"modules":["Basics","Functions",'
+            '"Closures"],"enrolled_at":"2026-03-14T09:30:00Z"},{"course_id":31,"title":"Data Structures",'
+            '"progress":87.0,"modules":["Lists","Trees","Graphs"],"enrolled_at":"2026-05-02T16:05:00Z"}]',
+            91,
+        ),
+        (
+            "Hi! Can you explain what a for-loop does in Python, and how it differs from a while loop? "
+            "I'm stuck on assignment 3, question 2.",
+            34,
+        ),
+    ]
+
+    def test_vendored_encoding_matches_tiktoken_hash(self):
+        with mock.patch.dict('os.environ', {'TIKTOKEN_CACHE_DIR': ''}):
+            path = token_budget._cached_encoding_file()
+        self.assertIsNotNone(path)
+        with open(path, 'rb') as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+        self.assertEqual(digest, '223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7')
+
+    def test_approximation_tracks_bpe(self):
+        for text, expected in self.SAMPLES:
+            with self.subTest(text=text[:30]):
+                self.assertLessEqual(abs(token_budget._approx_tokens(text) - expected), expected * 0.1)
+        approx = sum(token_budget._approx_tokens(text) for text, _ in self.SAMPLES)
+        bpe = sum(expected for _, expected in self.SAMPLES)
+        self.assertLessEqual(abs(approx - bpe), bpe * 0.05)
+
+    @skipIf(token_budget.tiktoken is None, 'tiktoken is not installed')
+    def test_bpe_counts_load_from_vendored_file(self):
+        env = {key: value for key, value in os.environ.items() if key != 'TIKTOKEN_CACHE_DIR'}
+        with mock.patch.dict('os.environ', env, clear=True), \
+                mock.patch.object(token_budget, '_encoding', None), \
+                mock.patch.object(token_budget, '_encoding_loaded', False), \
+                mock.patch('tiktoken.load.read_file', side_effect=AssertionError('download attempted')):
+            self.assertIsNotNone(token_budget.load_encoding())
+            self.assertEqual([token_budget.count_tokens(text) for text, _ in self.SAMPLES],
+                             [expected for _, expected in self.SAMPLES])
+
+
+class QuotaLeaseTTLTests(SimpleTestCase):
+    """The concurrency counter's TTL follows its latest use, not its creation."""
+
+    LIMITS = {
+        'CHATBOT_QUOTA_STUDENT_CONCURRENT': '2',
+        'CHATBOT_QUOTA_STUDENT_RPM': '0',
+        'CHATBOT_QUOTA_STUDENT_DAILY_TOKENS': '0',
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = mock.Mock(id=7, role='student')
+        self.key = usage_quota._key('active', self.user.id)
+
+    def test_every_incr_and_decr_refreshes_the_lease_ttl(self):
+        with mock.patch.dict('os.environ', self.LIMITS), mock.patch.object(cache, 'touch', wraps=cache.touch) as touch:
+            first = usage_quota.acquire_quota(self.user)
+            second = usage_quota.acquire_quota(self.user)
+            with self.assertRaises(usage_quota.QuotaExceeded):
+                usage_quota.acquire_quota(self.user)
+            first.release()
+            second.release()
+        # Two acquisitions, the rejected one's incr and decr, two releases.
+        self.assertEqual(touch.call_args_list, [mock.call(self.key, usage_quota.LEASE_TTL_SECONDS)] * 6)
+        self.assertEqual(usage_quota.active_requests(self.user.id), 0)
+
+
+class RecomputeStreaksTests(TestCase):
+    """The nightly streak job must not undo activity recorded after its snapshot."""
+
+    def setUp(self):
+        self.today = date.today()
+        self.user = User.objects.create_user('streaker', 'streaker@example.com', 'pw')
+        for days_ago in (1, 2):
+            DailyActivity.objects.create(user=self.user, date=self.today - timedelta(days=days_ago))
+        # Drifted: DailyActivity only supports a two-day streak.
+        UserStats.objects.create(
+            user=self.user, current_streak=5, longest_streak=5,
+            last_activity_date=self.today - timedelta(days=1),
+        )
+
+    def _stats(self):
+        stats = UserStats.objects.get(user=self.user)
+        return stats.current_streak, stats.longest_streak, stats.last_activity_date
+
+    def test_activity_after_snapshot_is_kept(self):
+        real_islands = recompute_streaks._streak_islands
+
+        def islands_then_activity(user_ids):
+            islands = real_islands(user_ids)
+            # The user completes content while the job is computing.
+            DailyActivity.objects.create(user=self.user, date=self.today)
+            UserStats.objects.filter(user=self.user).update(**UserStats.streak_expressions(self.today))
+            return islands
+
+        out = StringIO()
+        with mock.patch.object(recompute_streaks, '_streak_islands', side_effect=islands_then_activity):
+            call_command('recompute_streaks', stdout=out)
+        self.assertIn('Skipped 1 with newer activity.', out.getvalue())
+        self.assertEqual(self._stats(), (6, 6, self.today))
+
+        call_command('recompute_streaks', stdout=StringIO())
+        self.assertEqual(self._stats(), (3, 6, self.today))
+
+    def test_drift_is_corrected(self):
+        call_command('recompute_streaks', stdout=StringIO())
+        self.assertEqual(self._stats(), (2, 5, self.today - timedelta(days=1)))
+
+
+class IntentRouterTests(SimpleTestCase):
+    """Keyword routing cases the old substring matcher got wrong."""
+
+    def setUp(self):
+        # Keyword automaton only, so a retrained model cannot mask a regression.
+        self.router = IntentRouter(model={})
+
+    def test_topic_does_not_match_top(self):
+        decision = self.router.route('Tell me about the topic of recursion', 'student')
+        self.assertNotIn('top', decision.cues.get('top_rated', []))
+        self.assertNotIn('top_rated', decision.selected)
+        self.assertEqual(self.router.route('What are the top courses?', 'student').selected, ['top_rated'])
+
+    def test_top_students_is_not_top_courses(self):
+        decision = self.router.route('Who are the top students this month?', 'admin')
+        self.assertEqual(decision.selected, ['admin_leaderboard'])
+        self.assertIn('top_rated', decision.scores)
+        self.assertEqual(self.router.route('Show me the top courses', 'admin').selected, ['top_rated'])
+
+    def test_how_many_is_not_a_catalog_search(self):
+        decision = self.router.route('How many courses are on the platform?', 'admin')
+        self.assertEqual(decision.selected, ['platform_snapshot'])
+        self.assertIn('how many', decision.cues['course_search'])
+        self.assertNotIn('course_search', self.router.route('How many python courses are there?', 'student').selected)
+        self.assertEqual(self.router.route('Find me a python course', 'student').selected, ['course_search'])
+
+
+class TrainIntentModelTests(SimpleTestCase):
+    def test_reported_accuracy_is_cross_validated(self):
+        trained_on = []
+        real_train = train_intent_model.Command._train
+
+        def recording_train(command, router, examples, options):
+            trained_on.append({query for query, _role, _intents in examples})
+            return real_train(command, router, examples, options)
+
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(train_intent_model.Command, '_train', autospec=True, side_effect=recording_train):
+            call_command('train_intent_model', output=os.path.join(directory, 'model.json'), epochs=2, folds=4, stdout=out)
+        self.assertIn('with model (4-fold cross-validation)', out.getvalue())
+        # Four fold models, then the saved model on everything.
+        self.assertEqual(len(trained_on), 5)
+        everything = trained_on[-1]
+        held_out = [everything - fold for fold in trained_on[:4]]
+        self.assertTrue(all(held_out))
+        self.assertEqual(set().union(*held_out), everything)
+        self.assertEqual(sum(len(fold) for fold in held_out), len(everything))
+
+
+class GamificationPipelineTests(TestCase):
+    """XP, levels, streaks and badge awards from ``apply_gamification_events``."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('gamer', 'gamer@example.com', 'pw')
+        self.first_course = Badge.objects.create(
+            code='first_course', name='First Steps', description='Complete your first course',
+            badge_type='completion', xp_reward=100, requirement_value=1,
+        )
+        Badge.objects.create(
+            code='streak_7', name='7-Day Warrior', description='Maintain a 7-day learning streak',
+            badge_type='streak', xp_reward=50, requirement_value=7,
+        )
+
+    @staticmethod
+    def _content(xp=10):
+        return GamificationEvent(source='content', xp=xp, description='Completed content',
+                                 activity=True, content_completed=1)
+
+    def test_level_up_when_crossing_a_threshold(self):
+        UserStats.objects.create(user=self.user, total_xp=95)
+        stats, _ = apply_gamification_events(self.user, [self._content(xp=4)])
+        self.assertEqual((stats.total_xp, stats.level, stats.level_title), (99, 1, 'Beginner'))
+        stats, _ = apply_gamification_events(self.user, [self._content(xp=1)])
+        self.assertEqual((stats.total_xp, stats.level, stats.level_title), (100, 2, 'Learner'))
+        # One event can cross several thresholds.
+        stats, _ = apply_gamification_events(self.user, [self._content(xp=500)])
+        self.assertEqual((stats.total_xp, stats.level, stats.level_title), (600, 4, 'Scholar'))
+
+    def test_repeated_activity_on_one_day_counts_the_streak_once(self):
+        UserStats.objects.create(
+            user=self.user, current_streak=3, longest_streak=3,
+            last_activity_date=date.today() - timedelta(days=1),
+        )
+        for _ in range(3):
+            stats, _ = apply_gamification_events(self.user, [self._content()])
+        self.assertEqual((stats.current_streak, stats.longest_streak, stats.last_activity_date), (4, 4, date.today()))
+        self.assertEqual(stats.total_xp, 30)
+        daily = DailyActivity.objects.get(user=self.user)
+        self.assertEqual((daily.content_completed, daily.xp_earned), (3, 30))
+        self.assertEqual(XPTransaction.objects.filter(user=self.user, source='content').count(), 3)
+
+    def test_badge_is_awarded_once_under_repeated_events(self):
+        course_done = GamificationEvent(source='course', xp=200, description='Completed course', courses_completed=1)
+        stats, earned = apply_gamification_events(self.user, [course_done])
+        self.assertEqual(earned, [self.first_course])
+        self.assertEqual(stats.total_xp, 300)
+        for _ in range(2):
+            stats, earned = apply_gamification_events(self.user, [course_done])
+            self.assertEqual(earned, [])
+        self.assertEqual(stats.total_xp, 700)
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(XPTransaction.objects.filter(user=self.user, source='badge').count(), 1)
+
+    def test_concurrent_evaluation_does_not_double_award(self):
+        stats = UserStats.objects.create(user=self.user, courses_completed=1)
+        self.assertEqual(badge_engine.evaluate(self.user, stats), [self.first_course])
+        self.assertEqual(badge_engine.evaluate(self.user, stats), [])
+        # A racing evaluation that read "not yet earned" loses at the INSERT.
+        with mock.patch.object(UserBadge.objects, 'filter', return_value=UserBadge.objects.none()):
+            self.assertEqual(badge_engine.evaluate(self.user, stats), [])
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 1)
+
+    def test_rules_reload_when_a_badge_changes(self):
+        stats = UserStats.objects.create(user=self.user, current_streak=3, longest_streak=3)
+        self.assertEqual(badge_engine.evaluate(self.user, stats, changed=['streak']), [])
+        streak_3 = Badge.objects.create(
+            code='streak_3', name='3-Day Starter', description='Maintain a 3-day learning streak',
+            badge_type='streak', xp_reward=10, requirement_value=3,
+        )
+        self.assertEqual(badge_engine.evaluate(self.user, stats, changed=['streak']), [streak_3])
+
+
+class ChatSearchTests(TestCase):
+    """Chat history search on SQLite: FTS5 through migration 0044, and the icontains fallback."""
+
+    def setUp(self):
+        # Test databases are built without migrations; create the FTS5 table and triggers here.
+        migration = importlib.import_module('myapp.migrations.0044_chatmessage_search_index')
+        migration.create_search_index(None, types.SimpleNamespace(connection=connection))
+        self.user = User.objects.create_user('searcher', 'searcher@example.com', 'pw')
+        self.other = User.objects.create_user('neighbour', 'neighbour@example.com', 'pw')
+        self.session = ChatSession.objects.create(user=self.user, role='student', title='Python talk')
+        self.hit = self._message(self.user, 'How do Python decorators work?',
+                                 'A decorator wraps a function <b>and</b> returns another.', session=self.session)
+        self.second = self._message(self.user, 'Decorators again', 'Decorated functions keep their name.')
+        self._message(self.user, 'What is a list comprehension?', 'A compact loop that builds a list.')
+        self.foreign = self._message(self.other, 'My decorators question', 'A private answer about decorators.')
+
+    @staticmethod
+    def _message(user, query, response, session=None):
+        return ChatMessage.objects.create(user=user, session=session, role='student', query=query, response=response)
+
+    def _ids(self, user, text):
+        return {hit['message_id'] for hit in chat_search.search_chat_history(user.id, text)}
+
+    def test_fts_hits_are_ranked_and_marked(self):
+        # bm25 only scores a term above zero when it is rare in the corpus.
+        for index in range(10):
+            self._message(self.user, f'Question {index} about loops', 'Loops repeat a block of code.')
+        hits = chat_search.search_chat_history(self.user.id, 'decorator')
+        self.assertEqual({hit['message_id'] for hit in hits}, {self.hit.id, self.second.id})
+        self.assertTrue(all(hit['rank'] > 0 for hit in hits))
+        hit = next(hit for hit in hits if hit['message_id'] == self.hit.id)
+        self.assertEqual((hit['session_id'], hit['session_title']), (str(self.session.id), 'Python talk'))
+        self.assertIn('<mark>', hit['response_snippet'])
+        self.assertIn('&lt;b&gt;', hit['response_snippet'])
+
+    def test_users_only_see_their_own_messages(self):
+        self.assertNotIn(self.foreign.id, self._ids(self.user, 'decorators'))
+        self.assertEqual(self._ids(self.other, 'decorators'), {self.foreign.id})
+        self.assertEqual(self._ids(self.other, 'comprehension'), set())
+
+    def test_edits_and_deletes_reach_the_index(self):
+        self.hit.query = 'How do generators work?'
+        self.hit.response = 'A generator yields values lazily.'
+        self.hit.save()
+        self.second.delete()
+        self.assertEqual(self._ids(self.user, 'decorator'), set())
+        self.assertEqual(self._ids(self.user, 'generators'), {self.hit.id})
+        ChatMessage.objects.filter(pk=self.hit.pk).update(response='Now about closures.')
+        self.assertEqual(self._ids(self.user, 'yields'), set())
+        self.assertEqual(self._ids(self.user, 'closures'), {self.hit.id})
+
+    def test_fts_operators_in_input_are_quoted(self):
+        self.assertEqual(chat_search.search_chat_history(self.user.id, '"OR NEAR('), [])
+        self.assertEqual(self._ids(self.user, 'decorators OR comprehension'), set())
+
+    def test_icontains_fallback_without_fts5(self):
+        with mock.patch.object(chat_search, '_sqlite_hits', return_value=None):
+            hits = chat_search.search_chat_history(self.user.id, 'python decorators')
+            self.assertEqual(self._ids(self.other, 'decorators'), {self.foreign.id})
+        self.assertEqual([hit['message_id'] for hit in hits], [self.hit.id])
+        self.assertEqual(hits[0]['rank'], 0.0)
+        self.assertIn('<mark>Python</mark>', hits[0]['query_snippet'])
+        self.assertIn('&lt;b&gt;', hits[0]['response_snippet'])
+
+
+class SSECoalescerTests(SimpleTestCase):
+    """Frame boundaries and ordering of coalesced SSE writes, on a fake clock."""
+
+    def setUp(self):
+        self.now = 0.0
+
+    def _coalescer(self, flush_ms=50, flush_chars=0):
+        return SSECoalescer(flush_ms=flush_ms, flush_chars=flush_chars, clock=lambda: self.now)
+
+    @staticmethod
+    def _frames(written):
+        """``(id, event, data)`` for every frame in one write."""
+        frames = []
+        for block in filter(None, written.split('\n\n')):
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            event_id = int(fields['id']) if 'id' in fields else None
+            frames.append((event_id, fields['event'], json.loads(fields['data'])))
+        return frames
+
+    def test_first_delta_is_immediate_and_the_rest_wait_for_the_window(self):
+        coalescer = self._coalescer()
+        self.assertEqual(self._frames(coalescer.push('token', {'text': 'He'}, 1)), [(1, 'token', {'text': 'He'})])
+        self.now = 0.01
+        self.assertEqual(coalescer.push('token', {'text': 'll'}, 2), '')
+        self.now = 0.03
+        self.assertEqual(coalescer.push('token', {'text': 'o'}, 3), '')
+        self.assertAlmostEqual(coalescer.seconds_until_flush(), 0.02)
+        self.now = 0.05
+        # The delta that reaches the window goes out with the buffered ones, under the last id.
+        self.assertEqual(self._frames(coalescer.push('token', {'text': '!'}, 4)), [(4, 'token', {'text': 'llo!'})])
+        self.assertIsNone(coalescer.seconds_until_flush())
+        self.assertEqual(coalescer.stats(), {'deltas': 4, 'frames': 2, 'writes': 2})
+
+    def test_char_threshold_flushes_before_the_window(self):
+        coalescer = self._coalescer(flush_ms=1000, flush_chars=8)
+        coalescer.push('token', {'text': 'first'})
+        self.assertEqual(coalescer.push('token', {'text': 'abcd'}), '')
+        self.assertEqual(coalescer.push('token', {'text': 'efg'}), '')
+        self.assertEqual(self._frames(coalescer.push('token', {'text': 'h'})), [(None, 'token', {'text': 'abcdefgh'})])
+        self.assertEqual(coalescer.push('token', {'text': 'ijk'}), '')
+
+    def test_runs_keep_arrival_order_and_control_events_drain_first(self):
+        coalescer = self._coalescer()
+        coalescer.push('reasoning_token', {'text': 'think'}, 1)
+        for event_id, (event, text) in enumerate(
+            [('reasoning_token', 'ing'), ('token', 'An'), ('token', 'swer'), ('reasoning_token', 'more')], start=2,
+        ):
+            self.assertEqual(coalescer.push(event, {'text': text}, event_id), '')
+        written = coalescer.push('tool_call', {'name': 'search'}, 6)
+        self.assertEqual(self._frames(written), [
+            (2, 'reasoning_token', {'text': 'ing'}),
+            (4, 'token', {'text': 'Answer'}),
+            (5, 'reasoning_token', {'text': 'more'}),
+            (6, 'tool_call', {'name': 'search'}),
+        ])
+        self.assertEqual(coalescer.writes, 2)
+        # Control events with nothing buffered are written on their own.
+        self.assertEqual(self._frames(coalescer.push('done', {'status': 'completed'}, 7)),
+                         [(7, 'done', {'status': 'completed'})])
+
+    def test_token_with_extra_fields_is_not_merged(self):
+        coalescer = self._coalescer()
+        coalescer.push('token', {'text': 'a'})
+        coalescer.push('token', {'text': 'b'})
+        written = coalescer.push('token', {'text': 'c', 'final': True})
+        self.assertEqual(self._frames(written), [
+            (None, 'token', {'text': 'b'}),
+            (None, 'token', {'text': 'c', 'final': True}),
+        ])
+
+    def test_zero_window_disables_coalescing(self):
+        coalescer = self._coalescer(flush_ms=0)
+        self.assertFalse(coalescer.enabled)
+        for event_id, text in enumerate(['a', 'b', 'c'], start=1):
+            self.assertEqual(self._frames(coalescer.push('token', {'text': text}, event_id)),
+                             [(event_id, 'token', {'text': text})])
+        self.assertEqual(coalescer.stats(), {'deltas': 0, 'frames': 3, 'writes': 3})
@@ -1,3 +1,5 @@
+import os
+
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
@@ -33,13 +35,29 @@ router.register(r'payments', views.PaymentViewSet, basename='payment')
 # Gamification router
 router.register(r'gamification', views.GamificationViewSet, basename='gamification')
 
+# Under an ASGI server, CHATBOT_ASYNC_STREAMING=true serves /chatbot/stream/
+# from the async view; /chatbot/stream/async/ is always available.
+_async_chat_streaming = os.getenv("CHATBOT_ASYNC_STREAMING", "false").strip().lower() in {"1", "true", "on", "yes"}
+chatbot_stream_view = views.ChatbotAsyncStreamView if _async_chat_streaming else views.ChatbotStreamView
+chatbot_resume_view = views.ChatbotAsyncStreamResumeView if _async_chat_streaming else views.ChatbotStreamResumeView
+
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('chatbot/query/', views.ChatbotQueryView.as_view(), name='chatbot-query'),
-    path('chatbot/stream/', views.ChatbotStreamView.as_view(), name='chatbot-stream'),
+    path('chatbot/stream/', chatbot_stream_view.as_view(), name='chatbot-stream'),
+    path('chatbot/stream/async/', views.ChatbotAsyncStreamView.as_view(), name='chatbot-stream-async'),
+    path('chatbot/stream/<int:message_id>/resume/', chatbot_resume_view.as_view(), name='chatbot-stream-resume'),
+    path('chatbot/stream/async/<int:message_id>/resume/', views.ChatbotAsyncStreamResumeView.as_view(), name='chatbot-stream-resume-async'),
+    path('chatbot/stream/<int:message_id>/cancel/', views.ChatbotStreamCancelView.as_view(), name='chatbot-stream-cancel'),
     path('chatbot/sessions/', views.ChatbotSessionListCreateView.as_view(), name='chatbot-sessions'),
     path('chatbot/sessions/<uuid:session_id>/messages/', views.ChatbotSessionMessagesView.as_view(), name='chatbot-session-messages'),
+    path('chatbot/search/', views.ChatbotHistorySearchView.as_view(), name='chatbot-search'),
+    path('chatbot/usage/', views.ChatbotUsageView.as_view(), name='chatbot-usage'),
+    path('chatbot/latency/', views.ChatbotLatencyView.as_view(), name='chatbot-latency'),
+    path('generation-jobs/', views.GenerationJobListView.as_view(), name='generation-jobs'),
+    path('generation-jobs/<uuid:job_id>/', views.GenerationJobDetailView.as_view(), name='generation-job-detail'),
+    path('generation-jobs/<uuid:job_id>/events/', views.GenerationJobEventsView.as_view(), name='generation-job-events'),
     path('', include(router.urls)),
     path('', include(courses_router.urls)),
     path('', include(modules_router.urls)),
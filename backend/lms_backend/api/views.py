@@ -1,41 +1,49 @@
 from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings as dj_settings
 from django.contrib.auth.password_validation import validate_password
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Q, Max, F, Count, Avg
-from django.db.models.functions import TruncMonth, TruncDate
+from django.db.models import Q, Max, F, Count, Avg, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr, TruncMonth, TruncDate
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 from datetime import datetime, timedelta, timezone as dt_timezone
 from django.core.mail import send_mail
-from django.http import StreamingHttpResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+import asyncio
 import hmac
 import hashlib
 import logging
 import time
 import json
 import os
+from contextlib import aclosing, closing
 from decimal import Decimal, ROUND_HALF_UP
 try:
     import stripe
 except ModuleNotFoundError:
     stripe = None
 
-from openai import OpenAI
 
 from myapp.models import (
     User, Course, CourseModule, Content, Enrollment,
     ContentProgress, Payment, Assignment, AssignmentSubmission, Certificate,
     AssignmentQuestion, Notification, CourseRating, SupportRequest,
     Badge, UserBadge, UserStats, DailyActivity, XPTransaction, ChatSession,
-    Category
+    Category, GenerationJob
 )
 from myapp.chatbot_models import ChatMessage
 
@@ -46,10 +54,33 @@ from .serializers import (
     AssignmentSubmissionSerializer, CertificateSerializer, AssignmentQuestionSerializer,
     CourseRatingSerializer, SupportRequestSerializer,
     BadgeSerializer, UserBadgeSerializer, UserStatsSerializer, XPTransactionSerializer, LeaderboardEntrySerializer,
-    ChatbotQuerySerializer, ChatbotResponseSerializer, ChatSessionSerializer, ChatMessageHistorySerializer,
+    ChatbotQuerySerializer, ChatbotResponseSerializer, ChatSessionSerializer, ChatSessionListSerializer,
+    ChatMessageHistorySerializer, GenerationJobSerializer, GenerationJobListSerializer,
     CategorySerializer
 )
 from .services.gemini_service import CerebrasChatbotService, ChatbotConfigurationError
+from .services.gamification import GamificationEvent, apply_gamification_events
+from .services.session_memory import aload_session_memory, load_session_memory, schedule_summary_update
+from .services.chat_stream_log import (
+    TextCheckpointer,
+    acheckpoint_stream,
+    asave_final,
+    atail_stream_log,
+    checkpoint_stream,
+    get_stream_log,
+    open_stream_log,
+    release_stream_slot,
+    request_cancel,
+    reserve_stream_slot,
+    run_stream_in_background,
+    save_final,
+    start_stream_task,
+    tail_stream_log,
+)
+from .services.chat_latency import latency_percentiles
+from .services.chat_search import MIN_QUERY_CHARS, search_chat_history
+from .services import generation_jobs
+from .services.usage_quota import QuotaExceeded, acquire_quota, record_token_usage, usage_report
 
 from myapp.permissions import IsTeacherOrAdmin, IsStudent, IsTeacher, IsActiveUser
 
@@ -66,11 +97,6 @@ def _chat_reasoning_enabled_by_default() -> bool:
     return value not in {"0", "false", "off", "no"}
 
 
-def _sse_event(event: str, data: dict) -> str:
-    payload = json.dumps(data, ensure_ascii=True)
-    return f"event: {event}\ndata: {payload}\n\n"
-
-
 def _safe_session_title(text: str, fallback: str = "New Chat") -> str:
     value = (text or "").strip()
     if not value:
@@ -91,15 +117,78 @@ def _resolve_chat_session(user, role: str, session_id, query: str) -> ChatSessio
     )
 
 
-def _session_memory(session: ChatSession, limit: int = 10) -> list:
-    messages = (
-        ChatMessage.objects.filter(session=session)
-        .order_by("-created_at")[: max(1, min(int(limit), 20))]
+def _chat_user_context(user) -> dict:
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "name": f"{user.first_name} {user.last_name}".strip() or user.username,
+        "preferred_category": getattr(user, "preferred_category", None),
+        "skill_level": getattr(user, "skill_level", None),
+        "learning_goal": getattr(user, "learning_goal", None),
+    }
+
+
+async def _aresolve_chat_session(user, role: str, session_id, query: str) -> ChatSession:
+    if session_id:
+        session = await ChatSession.objects.filter(id=session_id, user=user, is_archived=False).afirst()
+        if session:
+            return session
+    return await ChatSession.objects.acreate(
+        user=user,
+        role=role,
+        title=_safe_session_title(query),
     )
-    rows = []
-    for message in reversed(list(messages)):
-        rows.append({"query": message.query, "response": message.response})
-    return rows
+
+
+def _mark_cancelled(message: ChatMessage, response_chunks, function_calls, started_at) -> list:
+    """Set a stopped turn's partial answer on ``message``; returns the fields to save."""
+    message.response = "".join(response_chunks).strip()
+    message.function_calls = function_calls
+    message.status = "cancelled"
+    message.response_time_ms = int((time.perf_counter() - started_at) * 1000)
+    return ["response", "function_calls", "status", "response_time_ms"]
+
+
+def _quota_exceeded_response(exc: QuotaExceeded, response_class=Response):
+    response = response_class(exc.as_dict(), status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _stage_timings(timings: dict, persist_started: float, request_started: float) -> dict:
+    timings["persist_ms"] = _elapsed_ms(persist_started)
+    timings["total_ms"] = _elapsed_ms(request_started)
+    return timings
+
+
+def _message_token_total(token_count_input, token_count_output) -> int:
+    return (token_count_input or 0) + (token_count_output or 0)
+
+
+def _authenticate_chat_request(request):
+    """Apply the DRF JWT authentication and IsActiveUser checks to a plain Django request.
+
+    Returns ``(user, None)`` on success or ``(None, JsonResponse)`` on failure.
+    """
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed as exc:
+        return None, JsonResponse({"detail": str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if result is None:
+        return None, JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+    request.user = result[0]
+    permission = IsActiveUser()
+    if not permission.has_permission(request, None):
+        message = getattr(permission, "message", None) or "You do not have permission to perform this action."
+        return None, JsonResponse({"detail": message}, status=status.HTTP_403_FORBIDDEN)
+    return request.user, None
 
 
 class ChatbotQueryView(APIView):
@@ -114,6 +203,11 @@ class ChatbotQueryView(APIView):
         if show_reasoning is None:
             show_reasoning = _chat_reasoning_enabled_by_default()
 
+        try:
+            lease = acquire_quota(request.user)
+        except QuotaExceeded as exc:
+            return _quota_exceeded_response(exc)
+
         start = time.perf_counter()
         try:
             service = CerebrasChatbotService()
@@ -123,15 +217,11 @@ class ChatbotQueryView(APIView):
                 session_id=session_id,
                 query=query,
             )
-            memory_messages = _session_memory(session=session, limit=10)
-            user_context = {
-                "user_id": request.user.id,
-                "username": request.user.username,
-                "name": f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-                "preferred_category": getattr(request.user, "preferred_category", None),
-                "skill_level": getattr(request.user, "skill_level", None),
-                "learning_goal": getattr(request.user, "learning_goal", None),
-            }
+            timings = {"session_resolve_ms": _elapsed_ms(start)}
+            stage_started = time.perf_counter()
+            memory_messages = load_session_memory(session)
+            timings["memory_load_ms"] = _elapsed_ms(stage_started)
+            user_context = _chat_user_context(request.user)
             result = service.chat(
                 query=query,
                 role=request.user.role,
@@ -140,6 +230,8 @@ class ChatbotQueryView(APIView):
                 show_reasoning=show_reasoning,
             )
 
+            timings.update(result.get("timings") or {})
+            persist_started = time.perf_counter()
             response_time_ms = int((time.perf_counter() - start) * 1000)
             message = ChatMessage.objects.create(
                 session=session,
@@ -158,6 +250,14 @@ class ChatbotQueryView(APIView):
             )
             session.updated_at = timezone.now()
             session.save(update_fields=["updated_at"])
+            # Written after the turn so persistence itself is measured.
+            result["timings"] = _stage_timings(timings, persist_started, start)
+            ChatMessage.objects.filter(pk=message.pk).update(timings=timings)
+            schedule_summary_update(session.id)
+            record_token_usage(
+                request.user.id,
+                _message_token_total(message.token_count_input, message.token_count_output),
+            )
             result["session_id"] = session.id
             result["message_id"] = message.id
             out = ChatbotResponseSerializer(result)
@@ -181,6 +281,8 @@ class ChatbotQueryView(APIView):
                 {"detail": "Chatbot request failed. Please try again."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+        finally:
+            lease.release()
 
 
 class ChatbotStreamView(APIView):
@@ -210,32 +312,50 @@ class ChatbotStreamView(APIView):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
 
-        session = _resolve_chat_session(
-            user=request.user, role=request.user.role, session_id=session_id, query=query
-        )
-        memory_messages = _session_memory(session=session, limit=10)
-        user_context = {
-            "user_id": request.user.id,
-            "username": request.user.username,
-            "name": f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-            "preferred_category": getattr(request.user, "preferred_category", None),
-            "skill_level": getattr(request.user, "skill_level", None),
-            "learning_goal": getattr(request.user, "learning_goal", None),
-        }
-        message = ChatMessage.objects.create(
-            session=session,
-            user=request.user,
-            role=request.user.role,
-            query=query,
-            response="",
-            function_calls=[],
-            reasoning_trace=[],
-            source="cerebras",
-            status="partial",
-        )
+        if not reserve_stream_slot():
+            response = Response(
+                {"detail": "The chatbot is busy right now. Please try again in a few seconds."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+            response["Retry-After"] = "5"
+            return response
+
+        try:
+            lease = acquire_quota(request.user)
+        except QuotaExceeded as exc:
+            release_stream_slot()
+            return _quota_exceeded_response(exc)
+
+        try:
+            request_started = time.perf_counter()
+            session = _resolve_chat_session(
+                user=request.user, role=request.user.role, session_id=session_id, query=query
+            )
+            timings = {"session_resolve_ms": _elapsed_ms(request_started)}
+            stage_started = time.perf_counter()
+            memory_messages = load_session_memory(session)
+            timings["memory_load_ms"] = _elapsed_ms(stage_started)
+            user_context = _chat_user_context(request.user)
+            message = ChatMessage.objects.create(
+                session=session,
+                user=request.user,
+                role=request.user.role,
+                query=query,
+                response="",
+                function_calls=[],
+                reasoning_trace=[],
+                source="cerebras",
+                status="partial",
+            )
+        except Exception:
+            lease.release()
+            release_stream_slot()
+            raise
         started_at = time.perf_counter()
 
-        def event_stream():
+        log = open_stream_log(message.id)
+
+        def generate():
             response_chunks = []
             reasoning_trace = []
             source = "cerebras"
@@ -244,8 +364,9 @@ class ChatbotStreamView(APIView):
             model_name = service.model_name
             token_count_input = None
             token_count_output = None
+            checkpointer = TextCheckpointer(message.id, response_chunks)
             try:
-                yield _sse_event(
+                log.append(
                     "meta",
                     {
                         "session_id": str(session.id),
@@ -254,32 +375,47 @@ class ChatbotStreamView(APIView):
                         "source": source,
                     },
                 )
-                for item in service.chat_stream(
+                items = service.chat_stream(
                     query=query,
                     role=request.user.role,
                     user_context=user_context,
                     memory_messages=memory_messages,
                     show_reasoning=show_reasoning,
-                ):
-                    event_name = item.get("event")
-                    data = item.get("data", {})
-                    if event_name == "token":
-                        text = data.get("text") or ""
-                        response_chunks.append(text)
-                    elif event_name == "reasoning":
-                        reasoning_trace.append(data)
-                    elif event_name == "tool_call":
-                        function_calls.append(data)
-                    elif event_name == "done":
-                        source = data.get("source") or source
-                        warning = data.get("warning")
-                        function_calls = data.get("function_calls", function_calls)
-                        reasoning_trace = data.get("reasoning_trace", reasoning_trace)
-                        model_name = data.get("model_name") or model_name
-                        token_count_input = data.get("token_count_input")
-                        token_count_output = data.get("token_count_output")
-                    yield _sse_event(event_name, data)
-
+                    on_stream=lambda stream: log.on_cancel(stream.close),
+                )
+                with closing(items):
+                    for item in items:
+                        if log.cancelled():
+                            break
+                        event_name = item.get("event")
+                        data = item.get("data", {})
+                        if event_name == "token":
+                            text = data.get("text") or ""
+                            response_chunks.append(text)
+                            if checkpointer.due(len(text)):
+                                checkpointer.save()
+                        elif event_name == "reasoning":
+                            reasoning_trace.append(data)
+                        elif event_name == "tool_call":
+                            function_calls.append(data)
+                        elif event_name == "done":
+                            source = data.get("source") or source
+                            warning = data.get("warning")
+                            function_calls = data.get("function_calls", function_calls)
+                            reasoning_trace = data.get("reasoning_trace", reasoning_trace)
+                            model_name = data.get("model_name") or model_name
+                            token_count_input = data.get("token_count_input")
+                            token_count_output = data.get("token_count_output")
+                            timings.update(data.get("timings") or {})
+                        log.append(event_name, data)
+
+                log.cancellable = False
+                if log.cancel_requested:
+                    save_final(message, _mark_cancelled(message, response_chunks, function_calls, started_at))
+                    log.append("cancelled", {"response": message.response})
+                    return
+
+                persist_started = time.perf_counter()
                 response_text = "".join(response_chunks).strip()
                 response_time_ms = int((time.perf_counter() - started_at) * 1000)
                 message.response = response_text
@@ -291,8 +427,9 @@ class ChatbotStreamView(APIView):
                 message.model_name = model_name
                 message.token_count_input = token_count_input
                 message.token_count_output = token_count_output
-                message.save(
-                    update_fields=[
+                save_final(
+                    message,
+                    [
                         "response",
                         "function_calls",
                         "reasoning_trace",
@@ -302,7 +439,7 @@ class ChatbotStreamView(APIView):
                         "model_name",
                         "token_count_input",
                         "token_count_output",
-                    ]
+                    ],
                 )
                 session.updated_at = timezone.now()
                 if not session.title:
@@ -310,7 +447,17 @@ class ChatbotStreamView(APIView):
                     session.save(update_fields=["title", "updated_at"])
                 else:
                     session.save(update_fields=["updated_at"])
+                _stage_timings(timings, persist_started, request_started)
+                ChatMessage.objects.filter(pk=message.pk).update(timings=timings)
+                log.append("timing", timings)
+                schedule_summary_update(session.id)
+                record_token_usage(request.user.id, _message_token_total(token_count_input, token_count_output))
             except Exception as exc:
+                if log.cancel_requested:
+                    # Closing the upstream stream to cancel surfaces as a read error.
+                    save_final(message, _mark_cancelled(message, response_chunks, function_calls, started_at))
+                    log.append("cancelled", {"response": message.response})
+                    return
                 msg = str(exc)
                 logger.error(f"!!! CHATBOT PROVIDER ERROR DETAILS !!!: {msg}")
                 is_quota = "quota exceeded" in msg.lower() or "resource_exhausted" in msg.lower() or "429" in msg
@@ -320,33 +467,364 @@ class ChatbotStreamView(APIView):
                 message.error_code = "quota_exceeded" if is_quota else "upstream_error"
                 message.error_message = msg
                 message.response_time_ms = int((time.perf_counter() - started_at) * 1000)
-                message.save(
-                    update_fields=[
+                save_final(
+                    message,
+                    [
                         "status",
                         "source",
                         "error_code",
                         "error_message",
                         "response_time_ms",
-                    ]
+                    ],
                 )
                 error_response_msg = "Our AI service is currently experiencing high demand. Please try again in a few moments." if is_quota else f"Chatbot stream failed: {msg}"
-                yield _sse_event(
+                log.append(
                     "error",
                     {"code": "upstream_error", "message": error_response_msg},
                 )
+            finally:
+                lease.release()
+
+        run_stream_in_background(log, generate)
 
-        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response = StreamingHttpResponse(tail_stream_log(log), content_type="text/event-stream")
         response["Cache-Control"] = "no-cache"
         response["X-Accel-Buffering"] = "no"
         return response
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatbotAsyncStreamView(View):
+    """ASGI-native twin of ChatbotStreamView.
+
+    Generation runs as an event-loop task fed by ``AsyncOpenAI``, so an
+    open chat does not pin a worker thread while the model generates. The
+    response only tails the task's stream log. When the client disconnects,
+    generation continues and the client can pick it up again through the
+    resume endpoint.
+    """
+
+    http_method_names = ["post"]
+
+    async def post(self, request):
+        if not _chat_streaming_enabled():
+            return JsonResponse(
+                {"detail": "Streaming is disabled by server configuration."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        user, error_response = await sync_to_async(_authenticate_chat_request)(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "Invalid JSON body."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ChatbotQuerySerializer(data=body)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data["query"]
+        session_id = serializer.validated_data.get("session_id")
+        show_reasoning = serializer.validated_data.get("show_reasoning")
+        if show_reasoning is None:
+            show_reasoning = _chat_reasoning_enabled_by_default()
+
+        try:
+            service = CerebrasChatbotService()
+        except ChatbotConfigurationError as exc:
+            logger.warning("Chatbot configuration error: %s", exc)
+            return JsonResponse(
+                {"detail": "Chatbot is not configured on this environment."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        try:
+            lease = await sync_to_async(acquire_quota)(user)
+        except QuotaExceeded as exc:
+            return _quota_exceeded_response(exc, JsonResponse)
+
+        try:
+            request_started = time.perf_counter()
+            session = await _aresolve_chat_session(
+                user=user, role=user.role, session_id=session_id, query=query
+            )
+            timings = {"session_resolve_ms": _elapsed_ms(request_started)}
+            stage_started = time.perf_counter()
+            memory_messages = await aload_session_memory(session)
+            timings["memory_load_ms"] = _elapsed_ms(stage_started)
+            user_context = _chat_user_context(user)
+            message = await ChatMessage.objects.acreate(
+                session=session,
+                user=user,
+                role=user.role,
+                query=query,
+                response="",
+                function_calls=[],
+                reasoning_trace=[],
+                source="cerebras",
+                status="partial",
+            )
+        except Exception:
+            await sync_to_async(lease.release)()
+            raise
+        started_at = time.perf_counter()
+
+        log = open_stream_log(message.id)
+
+        async def generate():
+            response_chunks = []
+            reasoning_trace = []
+            source = "cerebras"
+            function_calls = []
+            model_name = service.model_name
+            token_count_input = None
+            token_count_output = None
+            checkpointer = TextCheckpointer(message.id, response_chunks)
+            try:
+                log.append(
+                    "meta",
+                    {
+                        "session_id": str(session.id),
+                        "message_id": str(message.id),
+                        "role": user.role,
+                        "source": source,
+                    },
+                )
+                items = service.achat_stream(
+                    query=query,
+                    role=user.role,
+                    user_context=user_context,
+                    memory_messages=memory_messages,
+                    show_reasoning=show_reasoning,
+                )
+                async with aclosing(items):
+                    async for item in items:
+                        if await log.acancelled():
+                            break
+                        event_name = item.get("event")
+                        data = item.get("data", {})
+                        if event_name == "token":
+                            text = data.get("text") or ""
+                            response_chunks.append(text)
+                            if checkpointer.due(len(text)):
+                                await checkpointer.asave()
+                        elif event_name == "reasoning":
+                            reasoning_trace.append(data)
+                        elif event_name == "tool_call":
+                            function_calls.append(data)
+                        elif event_name == "done":
+                            source = data.get("source") or source
+                            function_calls = data.get("function_calls", function_calls)
+                            reasoning_trace = data.get("reasoning_trace", reasoning_trace)
+                            model_name = data.get("model_name") or model_name
+                            token_count_input = data.get("token_count_input")
+                            token_count_output = data.get("token_count_output")
+                            timings.update(data.get("timings") or {})
+                        log.append(event_name, data)
+
+                log.cancellable = False
+                if log.cancel_requested:
+                    await asave_final(message, _mark_cancelled(message, response_chunks, function_calls, started_at))
+                    log.append("cancelled", {"response": message.response})
+                    return
+
+                persist_started = time.perf_counter()
+                message.response = "".join(response_chunks).strip()
+                message.function_calls = function_calls
+                message.reasoning_trace = reasoning_trace
+                message.source = source
+                message.status = "completed"
+                message.response_time_ms = int((time.perf_counter() - started_at) * 1000)
+                message.model_name = model_name
+                message.token_count_input = token_count_input
+                message.token_count_output = token_count_output
+                await asave_final(
+                    message,
+                    [
+                        "response",
+                        "function_calls",
+                        "reasoning_trace",
+                        "source",
+                        "status",
+                        "response_time_ms",
+                        "model_name",
+                        "token_count_input",
+                        "token_count_output",
+                    ],
+                )
+                session.updated_at = timezone.now()
+                await session.asave(update_fields=["updated_at"])
+                _stage_timings(timings, persist_started, request_started)
+                await ChatMessage.objects.filter(pk=message.pk).aupdate(timings=timings)
+                log.append("timing", timings)
+                schedule_summary_update(session.id)
+                await sync_to_async(record_token_usage)(
+                    user.id, _message_token_total(token_count_input, token_count_output)
+                )
+            except asyncio.CancelledError:
+                # Task cancelled: by request_cancel, or on server shutdown.
+                # achat_stream has already closed the upstream stream.
+                if log.cancel_requested:
+                    await asave_final(message, _mark_cancelled(message, response_chunks, function_calls, started_at))
+                    log.append("cancelled", {"response": message.response})
+                    return
+                # Shutdown: keep what was generated so far.
+                message.response = "".join(response_chunks).strip()
+                message.function_calls = function_calls
+                message.status = "partial"
+                message.response_time_ms = int((time.perf_counter() - started_at) * 1000)
+                await asave_final(message, ["response", "function_calls", "status", "response_time_ms"])
+                raise
+            except Exception as exc:
+                msg = str(exc)
+                logger.error(f"!!! CHATBOT PROVIDER ERROR DETAILS !!!: {msg}")
+                is_quota = "quota exceeded" in msg.lower() or "resource_exhausted" in msg.lower() or "429" in msg
+                message.status = "error"
+                message.source = "cerebras"
+                message.error_code = "quota_exceeded" if is_quota else "upstream_error"
+                message.error_message = msg
+                message.response_time_ms = int((time.perf_counter() - started_at) * 1000)
+                await asave_final(message, ["status", "source", "error_code", "error_message", "response_time_ms"])
+                error_response_msg = "Our AI service is currently experiencing high demand. Please try again in a few moments." if is_quota else f"Chatbot stream failed: {msg}"
+                log.append(
+                    "error",
+                    {"code": "upstream_error", "message": error_response_msg},
+                )
+            finally:
+                await sync_to_async(lease.release)()
+
+        start_stream_task(log, generate)
+
+        response = StreamingHttpResponse(atail_stream_log(log), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+def _last_event_id(request) -> int:
+    raw = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id") or "0"
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def _resume_meta(message: ChatMessage) -> dict:
+    return {
+        "session_id": str(message.session_id) if message.session_id else None,
+        "message_id": str(message.id),
+        "role": message.role,
+        "source": message.source,
+        "resumed": True,
+    }
+
+
+class ChatbotStreamResumeView(APIView):
+    """Resume a dropped chat stream after ``Last-Event-ID`` without generating again.
+
+    While the turn's stream log is held by this process, the events after
+    that id are replayed and the live generation is followed. Otherwise the
+    answer is replayed from the checkpoints on the message row.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
+
+    def get(self, request, message_id=None):
+        message = get_object_or_404(ChatMessage, pk=message_id, user=request.user)
+        log = get_stream_log(message.pk)
+        if log is not None:
+            body = tail_stream_log(log, _last_event_id(request))
+        else:
+            body = checkpoint_stream(message.pk, _resume_meta(message))
+        response = StreamingHttpResponse(body, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatbotAsyncStreamResumeView(View):
+    """ASGI-native twin of ChatbotStreamResumeView."""
+
+    http_method_names = ["get"]
+
+    async def get(self, request, message_id=None):
+        user, error_response = await sync_to_async(_authenticate_chat_request)(request)
+        if error_response is not None:
+            return error_response
+        message = await ChatMessage.objects.filter(pk=message_id, user=user).afirst()
+        if message is None:
+            return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        log = get_stream_log(message.pk)
+        if log is not None:
+            body = atail_stream_log(log, _last_event_id(request))
+        else:
+            body = acheckpoint_stream(message.pk, _resume_meta(message))
+        response = StreamingHttpResponse(body, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class ChatbotStreamCancelView(APIView):
+    """Stop a running chat generation; the partial answer is kept as ``cancelled``."""
+
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
+
+    def post(self, request, message_id=None):
+        message = get_object_or_404(ChatMessage, pk=message_id, user=request.user)
+        if message.status != "partial":
+            return Response(
+                {"detail": "This answer is no longer being generated.", "status": message.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        request_cancel(message.pk)
+        return Response(
+            {"message_id": message.pk, "status": "cancelling"},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+SESSION_PREVIEW_CHARS = 120
+
+
+class ChatSessionCursorPagination(CursorPagination):
+    # ``updated_at`` is bumped on every turn, so this is most recent activity first.
+    ordering = "-updated_at"
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 50
+
+
+def _session_list_queryset(user):
+    """Sessions with message count, last query preview and last activity in one query.
+
+    Each annotation is a correlated subquery on ``(session, -created_at)``, so
+    it reads only that session's index range instead of joining and grouping
+    every message.
+    """
+    messages = ChatMessage.objects.filter(session=OuterRef("pk"))
+    latest = messages.order_by("-created_at")
+    counts = messages.order_by().values("session").annotate(n=Count("id")).values("n")
+    return ChatSession.objects.filter(user=user, is_archived=False).defer("summary").annotate(
+        message_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0),
+        last_query_preview=Subquery(
+            latest.annotate(preview=Substr("query", 1, SESSION_PREVIEW_CHARS)).values("preview")[:1]
+        ),
+        last_activity_at=Subquery(latest.values("created_at")[:1]),
+    )
+
+
 class ChatbotSessionListCreateView(APIView):
+    """Sessions newest first with previews, cursor-paginated (``?cursor=``, ``?limit=`` up to 50)."""
+
     permission_classes = [permissions.IsAuthenticated, IsActiveUser]
 
     def get(self, request):
-        qs = ChatSession.objects.filter(user=request.user, is_archived=False).order_by("-updated_at")[:50]
-        return Response(ChatSessionSerializer(qs, many=True).data, status=status.HTTP_200_OK)
+        paginator = ChatSessionCursorPagination()
+        page = paginator.paginate_queryset(_session_list_queryset(request.user), request, view=self)
+        return paginator.get_paginated_response(ChatSessionListSerializer(page, many=True).data)
 
     def post(self, request):
         title = _safe_session_title(request.data.get("title", ""), fallback="New Chat")
@@ -371,6 +849,66 @@ class ChatbotSessionMessagesView(APIView):
             status=status.HTTP_200_OK,
         )
 
+
+class ChatbotHistorySearchView(APIView):
+    """Search the caller's own chat history: ``?q=`` plus optional ``limit`` (max 50) and ``offset``."""
+
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
+
+    def get(self, request):
+        text = (request.query_params.get("q") or "").strip()
+        if len(text) < MIN_QUERY_CHARS:
+            return Response(
+                {"detail": f"q must be at least {MIN_QUERY_CHARS} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get("limit", "20"))
+            offset = int(request.query_params.get("offset", "0"))
+        except ValueError:
+            return Response({"detail": "limit and offset must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        results = search_chat_history(request.user.id, text, limit=limit, offset=offset)
+        return Response({"query": text, "offset": max(0, offset), "results": results}, status=status.HTTP_200_OK)
+
+
+class ChatbotUsageView(APIView):
+    """Admin-only: LLM consumption per role and top users for one day (``?date=YYYY-MM-DD``)."""
+
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
+
+    def get(self, request):
+        if request.user.role != 'admin':
+            return Response({"detail": "Only admin can view AI usage."}, status=status.HTTP_403_FORBIDDEN)
+        day = None
+        date_raw = request.query_params.get("date")
+        if date_raw:
+            try:
+                day = datetime.strptime(date_raw, "%Y-%m-%d").date()
+            except ValueError:
+                return Response({"detail": "date must be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get("limit", "50"))
+        except ValueError:
+            limit = 50
+        return Response(usage_report(day=day, limit=limit), status=status.HTTP_200_OK)
+
+
+class ChatbotLatencyView(APIView):
+    """Admin-only: p50/p95/p99 per chatbot stage over the last ``?hours=`` (default 24)."""
+
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
+
+    def get(self, request):
+        if request.user.role != 'admin':
+            return Response({"detail": "Only admin can view chatbot latency."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            hours = max(1, min(int(request.query_params.get("hours", "24")), 24 * 90))
+        except ValueError:
+            return Response({"detail": "hours must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        until = timezone.now()
+        return Response(latency_percentiles(until - timedelta(hours=hours), until), status=status.HTTP_200_OK)
+
+
 # Custom JWT Token View to allow login with either username or email
 class CustomTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
@@ -1018,11 +1556,12 @@ class CourseViewSet(viewsets.ModelViewSet):
 
         # Award XP for first-time review with text
         if created and review_text:
-            award_xp(user, XP_CONFIG['review_written'], 'review', f'Reviewed: {course.title}')
-            stats = get_or_create_user_stats(user)
-            stats.reviews_written += 1
-            stats.save()
-            check_and_award_badges(user)
+            apply_gamification_events(user, [GamificationEvent(
+                source='review',
+                xp=XP_CONFIG['review_written'],
+                description=f'Reviewed: {course.title}',
+                reviews_written=1,
+            )])
 
         # Update course derived difficulty from average feedback (1..3)
         try:
@@ -1455,186 +1994,66 @@ class CourseViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'], url_path='generate-lesson',
             permission_classes=[permissions.IsAuthenticated, IsTeacherOrAdmin])
     def generate_lesson(self, request):
-        """Generate educational lesson content using Cerebras AI."""
-        topic = (request.data.get('topic') or '').strip()
-        audience = (request.data.get('audience') or 'Beginner').strip()
-        tone = (request.data.get('tone') or 'Professional').strip()
+        """Queue AI lesson generation; poll or stream ``/generation-jobs/<id>/`` for the result."""
+        return _submit_generation_job(request, generation_jobs.LESSON)
 
-        if not topic:
-            return Response(
-                {"detail": "Topic is required."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Build a detailed prompt for lesson generation
-        system_prompt = (
-            "You are an expert educational content writer. "
-            "Generate high-quality, well-structured lesson content in Markdown format. "
-            "Include clear headings, subheadings, explanations, examples, and key takeaways. "
-            "Make the content engaging and educational. "
-            "Use proper Markdown formatting with headers (#, ##, ###), bullet points, "
-            "numbered lists, bold text, code blocks where appropriate, and other Markdown features. "
-            "Do NOT wrap the entire response in a code block — output raw Markdown directly."
-        )
-
-        user_prompt = (
-            f"Create a comprehensive lesson on the topic: **{topic}**\n\n"
-            f"Target Audience: {audience}\n"
-            f"Tone: {tone}\n\n"
-            "Structure the lesson with:\n"
-            "1. An engaging introduction\n"
-            "2. Learning objectives\n"
-            "3. Main content with clear sections and examples\n"
-            "4. Key takeaways / summary\n"
-            "5. Practice questions or exercises (if appropriate)\n\n"
-            "Make it thorough, informative and engaging for the specified audience."
-        )
-
-        try:
-            api_key = (
-                os.getenv("CEREBRAS_API_KEY", "").strip()
-                or os.getenv("CEREBRAS_ROUTER_API_KEY", "").strip()
-                or os.getenv("CEREBRAS_ROUTER_KEY", "").strip()
-                or os.getenv("CEREBRAS_KEY", "").strip()
-            )
-            base_url = os.getenv("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1").strip()
-            model_name = os.getenv("CEREBRAS_MODEL", "llama3.1-8b")
+    @action(detail=False, methods=['post'], url_path='generate-assignment',
+            permission_classes=[permissions.IsAuthenticated, IsTeacherOrAdmin])
+    def generate_assignment(self, request):
+        """Queue AI assignment question generation; the result arrives on the job."""
+        return _submit_generation_job(request, generation_jobs.ASSIGNMENT)
 
-            if not api_key:
-                return Response(
-                    {"detail": "AI service is not configured. Please set CEREBRAS_API_KEY."},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
-                )
 
-            client = OpenAI(api_key=api_key, base_url=base_url)
+def _submit_generation_job(request, kind):
+    try:
+        params = generation_jobs.build_params(kind, request.data)
+    except ValueError as exc:
+        return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        job = generation_jobs.submit_job(request.user, kind, params)
+    except QuotaExceeded as exc:
+        return _quota_exceeded_response(exc)
+    return Response(GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.7,
-                max_completion_tokens=8192,
-            )
 
-            content = completion.choices[0].message.content
-            return Response({"content": content})
+class GenerationJobListView(APIView):
+    """The caller's AI generation jobs and drafts, newest first (``?kind=lesson|assignment``, ``?limit=`` up to 50)."""
 
-        except Exception as e:
-            logger.error(f"AI lesson generation failed: {e}")
-            return Response(
-                {"detail": f"Failed to generate content: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
 
-    @action(detail=False, methods=['post'], url_path='generate-assignment',
-            permission_classes=[permissions.IsAuthenticated, IsTeacherOrAdmin])
-    def generate_assignment(self, request):
-        """Generate assignment questions using Cerebras AI."""
-        topic = (request.data.get('topic') or '').strip()
-        assignment_type = (request.data.get('assignment_type') or 'mcq').strip()
-        num_questions = int(request.data.get('num_questions', 5))
-        difficulty = (request.data.get('difficulty') or 'Intermediate').strip()
+    def get(self, request):
+        qs = GenerationJob.objects.filter(user=request.user).defer("output", "result")
+        kind = request.query_params.get("kind")
+        if kind:
+            qs = qs.filter(kind=kind)
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", "20")), 50))
+        except ValueError:
+            limit = 20
+        jobs = [generation_jobs.expire_if_stale(job) for job in qs.order_by("-created_at")[:limit]]
+        return Response(GenerationJobListSerializer(jobs, many=True).data, status=status.HTTP_200_OK)
 
-        if not topic:
-            return Response(
-                {"detail": "Topic is required."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
 
-        num_questions = max(1, min(num_questions, 20))
-
-        if assignment_type == 'mcq':
-            system_prompt = (
-                "You are an expert educational assessment designer. "
-                "Generate multiple-choice questions in valid JSON format. "
-                "Return ONLY a JSON array — no markdown, no code fences, no explanation. "
-                "Each element must have: "
-                '"question" (string), "options" (array of {"text": string, "is_correct": boolean}), "points" (number). '
-                "Each question MUST have exactly 4 options with exactly 1 correct answer. "
-                "Ensure questions test understanding, not just memorization."
-            )
-            user_prompt = (
-                f"Create {num_questions} multiple-choice questions on: {topic}\n"
-                f"Difficulty: {difficulty}\n\n"
-                "Return ONLY valid JSON array. Example:\n"
-                '[{"question": "What is X?", "options": [{"text": "A", "is_correct": false}, '
-                '{"text": "B", "is_correct": true}, {"text": "C", "is_correct": false}, '
-                '{"text": "D", "is_correct": false}], "points": 2}]'
-            )
-        else:
-            system_prompt = (
-                "You are an expert educational assessment designer. "
-                "Generate short-answer / Q&A questions in valid JSON format. "
-                "Return ONLY a JSON array — no markdown, no code fences, no explanation. "
-                "Each element must have: "
-                '"question" (string), "keywords" (array of relevant keywords for auto-grading), '
-                '"acceptable_answers" (array of acceptable exact answers), "points" (number). '
-                "Ensure questions require critical thinking and clear understanding."
-            )
-            user_prompt = (
-                f"Create {num_questions} short-answer / Q&A questions on: {topic}\n"
-                f"Difficulty: {difficulty}\n\n"
-                "Return ONLY valid JSON array. Example:\n"
-                '[{"question": "Explain the concept of X.", '
-                '"keywords": ["key1", "key2", "key3"], '
-                '"acceptable_answers": ["X is..."], "points": 5}]'
-            )
+class GenerationJobDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
 
-        try:
-            api_key = (
-                os.getenv("CEREBRAS_API_KEY", "").strip()
-                or os.getenv("CEREBRAS_ROUTER_API_KEY", "").strip()
-                or os.getenv("CEREBRAS_ROUTER_KEY", "").strip()
-                or os.getenv("CEREBRAS_KEY", "").strip()
-            )
-            base_url = os.getenv("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1").strip()
-            model_name = os.getenv("CEREBRAS_MODEL", "llama3.1-8b")
+    def get(self, request, job_id=None):
+        job = get_object_or_404(GenerationJob.objects.defer("output"), pk=job_id, user=request.user)
+        return Response(GenerationJobSerializer(generation_jobs.expire_if_stale(job)).data, status=status.HTTP_200_OK)
 
-            if not api_key:
-                return Response(
-                    {"detail": "AI service is not configured. Please set CEREBRAS_API_KEY."},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
-                )
 
-            client = OpenAI(api_key=api_key, base_url=base_url)
+class GenerationJobEventsView(APIView):
+    """Follow a generation job as SSE; ``Last-Event-ID`` resumes from that many characters."""
 
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.7,
-                max_completion_tokens=8192,
-            )
+    permission_classes = [permissions.IsAuthenticated, IsActiveUser]
 
-            raw = completion.choices[0].message.content.strip()
-            # Strip markdown code fences if present
-            if raw.startswith('```'):
-                lines = raw.split('\n')
-                lines = lines[1:]  # remove opening fence
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]
-                raw = '\n'.join(lines).strip()
-
-            import json
-            questions = json.loads(raw)
-            return Response({"questions": questions, "assignment_type": assignment_type})
-
-        except json.JSONDecodeError as e:
-            logger.error(f"AI assignment generation returned invalid JSON: {e}")
-            return Response(
-                {"detail": "AI returned invalid format. Please try again."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-        except Exception as e:
-            logger.error(f"AI assignment generation failed: {e}")
-            return Response(
-                {"detail": f"Failed to generate questions: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+    def get(self, request, job_id=None):
+        job = get_object_or_404(GenerationJob.objects.only("id"), pk=job_id, user=request.user)
+        body = generation_jobs.progress_stream(job.pk, _last_event_id(request))
+        response = StreamingHttpResponse(body, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 
 class CourseModuleViewSet(viewsets.ModelViewSet):
@@ -1958,22 +2377,31 @@ class ContentViewSet(viewsets.ModelViewSet):
             content_progress.save()
             first_time_completion = True
         
+        events = []
         # Award XP for first-time content completion
         if first_time_completion:
-            award_xp(user, XP_CONFIG['content_complete'], 'content', f'Completed: {content.title}')
-            record_daily_activity(user, content_completed=1, xp_earned=XP_CONFIG['content_complete'])
-            check_and_award_badges(user)
+            events.append(GamificationEvent(
+                source='content',
+                xp=XP_CONFIG['content_complete'],
+                description=f'Completed: {content.title}',
+                activity=True,
+                content_completed=1,
+            ))
         
         # Check if this affects course completion
         course_completed = enrollment.check_completion_and_issue_certificate()
         
         # Award XP for course completion
         if course_completed:
-            award_xp(user, XP_CONFIG['course_complete'], 'course', f'Completed course: {enrollment.course.title}')
-            stats = get_or_create_user_stats(user)
-            stats.courses_completed += 1
-            stats.save()
-            check_and_award_badges(user)
+            events.append(GamificationEvent(
+                source='course',
+                xp=XP_CONFIG['course_complete'],
+                description=f'Completed course: {enrollment.course.title}',
+                courses_completed=1,
+            ))
+        
+        if events:
+            apply_gamification_events(user, events)
         
         return Response({"detail": "Content marked as completed"})
 
@@ -2273,6 +2701,7 @@ class AssignmentSubmissionViewSet(viewsets.ModelViewSet):
         # Base XP for passing
         total_xp = XP_CONFIG['assignment_pass']
         description = f'Passed: {assignment.title}'
+        perfect_scores = 0
         
         # First attempt bonus
         if attempt_number == 1:
@@ -2283,19 +2712,16 @@ class AssignmentSubmissionViewSet(viewsets.ModelViewSet):
         if submission.grade >= 100:
             total_xp += XP_CONFIG['perfect_score']
             description += ' (Perfect!)'
-            stats = get_or_create_user_stats(user)
-            stats.perfect_scores += 1
-            stats.save()
-        
-        award_xp(user, total_xp, 'assignment', description)
-        
-        # Update stats
-        stats = get_or_create_user_stats(user)
-        stats.assignments_completed += 1
-        stats.save()
-        
-        record_daily_activity(user, assignments_completed=1, xp_earned=total_xp)
-        check_and_award_badges(user)
+            perfect_scores = 1
+        
+        apply_gamification_events(user, [GamificationEvent(
+            source='assignment',
+            xp=total_xp,
+            description=description,
+            activity=True,
+            assignments_completed=1,
+            perfect_scores=perfect_scores,
+        )])
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsTeacherOrAdmin])
     def grade(self, request, pk=None, assignment_pk=None, course_pk=None):
@@ -3234,91 +3660,6 @@ def get_or_create_user_stats(user):
     return stats
 
 
-def award_xp(user, amount, source, description=""):
-    """Award XP to user and return updated stats"""
-    stats = get_or_create_user_stats(user)
-    stats.add_xp(amount, source, description)
-    return stats
-
-
-def check_and_award_badges(user):
-    """Check and award any badges the user has earned"""
-    stats = get_or_create_user_stats(user)
-    newly_earned = []
-    
-    for badge_data in DEFAULT_BADGES:
-        # Check if user already has this badge
-        if UserBadge.objects.filter(user=user, badge__code=badge_data['code']).exists():
-            continue
-        
-        badge = Badge.objects.filter(code=badge_data['code']).first()
-        if not badge:
-            continue
-        
-        earned = False
-        
-        # Check streak badges
-        if badge.badge_type == 'streak':
-            if stats.current_streak >= badge.requirement_value or stats.longest_streak >= badge.requirement_value:
-                earned = True
-        
-        # Check completion badges
-        elif badge.badge_type == 'completion':
-            if stats.courses_completed >= badge.requirement_value:
-                earned = True
-        
-        # Check performance badges
-        elif badge.badge_type == 'performance':
-            if badge.code == 'perfect_score' and stats.perfect_scores >= badge.requirement_value:
-                earned = True
-            # Quick learner is checked separately when course is completed
-        
-        # Check engagement badges
-        elif badge.badge_type == 'engagement':
-            if badge.code == 'reviewer' and stats.reviews_written >= badge.requirement_value:
-                earned = True
-            # Top 3 is checked separately
-        
-        if earned:
-            UserBadge.objects.create(user=user, badge=badge)
-            # Award badge XP
-            if badge.xp_reward > 0:
-                award_xp(user, badge.xp_reward, 'badge', f'Earned badge: {badge.name}')
-            newly_earned.append(badge)
-    
-    return newly_earned
-
-
-def record_daily_activity(user, content_completed=0, assignments_completed=0, xp_earned=0, time_spent_seconds=0):
-    """Record or update daily activity for a user"""
-    from datetime import date
-    today = date.today()
-    
-    activity, created = DailyActivity.objects.get_or_create(
-        user=user,
-        date=today,
-        defaults={
-            'content_completed': content_completed,
-            'assignments_completed': assignments_completed,
-            'xp_earned': xp_earned,
-            'time_spent_seconds': time_spent_seconds
-        }
-    )
-    
-    if not created:
-        activity.content_completed += content_completed
-        activity.assignments_completed += assignments_completed
-        activity.xp_earned += xp_earned
-        activity.time_spent_seconds += time_spent_seconds
-        activity.save()
-    
-    # Update streak
-    stats = get_or_create_user_stats(user)
-    stats.update_streak()
-    
-    return activity
-
-
 class GamificationViewSet(viewsets.ViewSet):
     """ViewSet for gamification-related endpoints"""
     permission_classes = [permissions.IsAuthenticated, IsActiveUser]
@@ -3383,16 +3724,13 @@ class GamificationViewSet(viewsets.ViewSet):
         today = date.today()
         week_start = today - timedelta(days=today.weekday())
         
-        # Get weekly XP for all users
-        weekly_xp = {}
-        transactions = XPTransaction.objects.filter(
-            created_at__date__gte=week_start
-        ).values('user_id').annotate(weekly_xp=Count('amount'))
-        
-        # Actually sum the amounts
+        # Get weekly XP for all users. Compare against a datetime rather than
+        # created_at__date so the (created_at, user) index can be used.
         from django.db.models import Sum
+        weekly_xp = {}
+        week_start_at = timezone.make_aware(datetime.combine(week_start, datetime.min.time()))
         transactions = XPTransaction.objects.filter(
-            created_at__date__gte=week_start
+            created_at__gte=week_start_at
         ).values('user_id').annotate(weekly_xp=Sum('amount'))
         
         for t in transactions:
@@ -3443,18 +3781,17 @@ class GamificationViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['post'])
     def record_activity(self, request):
         """Record learning activity (used by frontend to update streak)"""
-        time_spent = request.data.get('time_spent_seconds', 0)
+        try:
+            time_spent = max(0, int(request.data.get('time_spent_seconds', 0) or 0))
+        except (TypeError, ValueError):
+            time_spent = 0
         
-        activity = record_daily_activity(
+        # Streak, daily activity and newly earned badges in one atomic pass
+        stats, newly_earned = apply_gamification_events(
             request.user,
-            time_spent_seconds=time_spent
+            [GamificationEvent(activity=True, time_spent_seconds=time_spent)]
         )
         
-        # Check for newly earned badges
-        newly_earned = check_and_award_badges(request.user)
-        
-        stats = get_or_create_user_stats(request.user)
-        
         return Response({
             'stats': UserStatsSerializer(stats).data,
             'newly_earned_badges': BadgeSerializer(newly_earned, many=True).data,
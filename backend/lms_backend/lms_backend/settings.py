@@ -139,6 +139,25 @@ if os.getenv('DATABASE_URL'):
         ssl_require=os.getenv('DB_SSL_REQUIRE', 'True').lower() == 'true'
     )
 
+# Shared cache. LLM quota counters, chat stream cancel flags and rule-cache
+# versions must be visible to every worker process, so production needs
+# REDIS_URL; the per-process LocMem fallback is only for local development.
+REDIS_URL = os.getenv('REDIS_URL', '').strip()
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'lms'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_USER_MODEL = 'myapp.User'
 
 
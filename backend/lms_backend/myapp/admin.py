@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Course, Enrollment, Payment, Assignment, Certificate, 
     CourseModule, Content, ContentProgress, AssignmentSubmission, ChatMessage, ChatSession,
-    Category
+    Category, GenerationJob
 )
 
 class UserAdmin(BaseUserAdmin):
@@ -65,6 +65,7 @@ admin.site.register(AssignmentSubmission, AssignmentSubmissionAdmin)
 admin.site.register(Certificate)
 admin.site.register(ChatMessage)
 admin.site.register(ChatSession)
+admin.site.register(GenerationJob)
 
 
 @admin.register(Category)
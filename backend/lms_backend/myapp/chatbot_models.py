@@ -13,6 +13,10 @@ class ChatSession(models.Model):
     role = models.CharField(max_length=20)
     title = models.CharField(max_length=200, blank=True, default='')
     is_archived = models.BooleanField(default=False)
+    # Rolling summary of turns older than the recent memory window, and the
+    # id of the last message folded into it.
+    summary = models.TextField(blank=True, default='')
+    summary_message_id = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -34,11 +38,13 @@ class ChatMessage(models.Model):
         ('completed', 'Completed'),
         ('error', 'Error'),
         ('partial', 'Partial'),
+        ('cancelled', 'Cancelled'),
     )
     SOURCE_CHOICES = (
         ('cerebras', 'Cerebras'),
         ('gemini', 'Gemini'),
         ('fallback', 'Fallback'),
+        ('cache', 'Response cache'),
     )
 
     id = models.AutoField(primary_key=True)
@@ -65,6 +71,14 @@ class ChatMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     feedback = models.CharField(max_length=20, null=True, blank=True)
     response_time_ms = models.IntegerField(null=True, blank=True)
+    # Per-stage latency breakdown in ms: session_resolve_ms, memory_load_ms,
+    # tools_ms, tool_ms {name: ms}, prompt_build_ms, ttft_ms, generation_ms,
+    # tokens_per_second, persist_ms.
+    timings = models.JSONField(default=dict, blank=True)
+    # Touched while a streamed turn is generating (checkpoints and a
+    # periodic heartbeat), so resumes in other processes can tell a live
+    # generation from one whose process died.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -0,0 +1,46 @@
+from django.db import models
+from django.conf import settings
+import uuid
+
+
+class GenerationJob(models.Model):
+    """AI lesson / assignment generation run in the background; the result is kept as a draft."""
+
+    KIND_CHOICES = (
+        ('lesson', 'Lesson'),
+        ('assignment', 'Assignment'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='generation_jobs'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    title = models.CharField(max_length=200, blank=True, default='')
+    params = models.JSONField(default=dict)
+    # Raw generated text, checkpointed while the job runs.
+    output = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    model_name = models.CharField(max_length=100, null=True, blank=True)
+    token_count = models.IntegerField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'kind', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} - {self.title[:50]} ({self.status})"
@@ -0,0 +1,167 @@
+"""
+Management command to apply the chatbot history retention policy.
+
+Three passes, each in batches of ``--batch-size`` rows so no statement holds
+locks on ``myapp_chatmessage`` for long:
+
+1. Messages older than ``--reasoning-days`` lose their ``reasoning_trace``
+   (thinking transcripts are the bulk of a row and are never shown again
+   once the answer has been read).
+2. Messages older than ``--archive-days`` are written to a gzip-compressed
+   JSONL file in ``--archive-dir`` and then deleted. Each batch is flushed
+   and fsynced before its rows are deleted, so a crash can duplicate a batch
+   in the archive but never lose one.
+3. Sessions that no longer have messages and were last active before the
+   archive cutoff are archived and deleted the same way.
+
+Defaults come from ``CHATBOT_REASONING_RETENTION_DAYS`` (30),
+``CHATBOT_ARCHIVE_AFTER_DAYS`` (180) and ``CHATBOT_ARCHIVE_DIR``
+(``<BASE_DIR>/chat_archive``); ``0`` days disables a pass.
+
+Usage (schedule nightly, e.g. from cron):
+    python manage.py archive_chat_history
+    python manage.py archive_chat_history --archive-days 365 --reasoning-days 14 --dry-run
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from myapp.chatbot_models import ChatMessage, ChatSession
+
+
+def _env_days(name, default):
+    try:
+        return max(0, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+MESSAGE_FIELDS = [
+    'id', 'session_id', 'user_id', 'role', 'query', 'response', 'function_calls', 'reasoning_trace',
+    'source', 'status', 'model_name', 'token_count_input', 'token_count_output', 'error_code',
+    'error_message', 'feedback', 'response_time_ms', 'timings', 'created_at',
+]
+SESSION_FIELDS = [
+    'id', 'user_id', 'role', 'title', 'is_archived', 'summary', 'summary_message_id',
+    'created_at', 'updated_at',
+]
+
+
+class Command(BaseCommand):
+    help = 'Drop old chatbot reasoning traces and move old chat history to compressed archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reasoning-days', type=int,
+                            default=_env_days('CHATBOT_REASONING_RETENTION_DAYS', 30),
+                            help='Clear reasoning traces of messages older than this (0 keeps them)')
+        parser.add_argument('--archive-days', type=int,
+                            default=_env_days('CHATBOT_ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive and delete messages older than this (0 keeps them)')
+        parser.add_argument('--archive-dir',
+                            default=os.getenv('CHATBOT_ARCHIVE_DIR') or str(Path(settings.BASE_DIR) / 'chat_archive'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause-ms', type=int, default=0,
+                            help='Sleep between batches to leave room for live traffic')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, options['batch_size'])
+        self.pause = max(0, options['pause_ms']) / 1000
+        dry_run = options['dry_run']
+        now = timezone.now()
+
+        if options['reasoning_days'] > 0:
+            cutoff = now - timedelta(days=options['reasoning_days'])
+            traced = ChatMessage.objects.filter(created_at__lt=cutoff).exclude(reasoning_trace=[])
+            if dry_run:
+                self.stdout.write(f'Would clear reasoning traces of {traced.count()} messages before {cutoff:%Y-%m-%d}')
+            else:
+                cleared = self._clear_reasoning(cutoff)
+                self.stdout.write(f'Cleared reasoning traces of {cleared} messages before {cutoff:%Y-%m-%d}')
+
+        if options['archive_days'] <= 0:
+            return
+        cutoff = now - timedelta(days=options['archive_days'])
+        messages = ChatMessage.objects.filter(created_at__lt=cutoff)
+        # Sessions left empty once their old messages are archived.
+        sessions = ChatSession.objects.filter(
+            ~Exists(ChatMessage.objects.filter(session=OuterRef('pk'), created_at__gte=cutoff)),
+            updated_at__lt=cutoff,
+        )
+        if dry_run:
+            self.stdout.write(
+                f'Would archive {messages.count()} messages and {sessions.count()} sessions '
+                f'before {cutoff:%Y-%m-%d}'
+            )
+            return
+        if not messages.exists() and not sessions.exists():
+            self.stdout.write(f'Nothing to archive before {cutoff:%Y-%m-%d}.')
+            return
+
+        archive_dir = Path(options['archive_dir'])
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        path = archive_dir / f'chat-history-{now:%Y%m%dT%H%M%S}.jsonl.gz'
+        with open(path, 'xb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            archived = self._archive_rows(
+                ChatMessage, messages, MESSAGE_FIELDS, 'message', archive, raw
+            )
+            # Re-evaluated after the messages are gone, so their sessions qualify too.
+            removed_sessions = self._archive_rows(
+                ChatSession, self._idle_sessions(cutoff), SESSION_FIELDS, 'session', archive, raw
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} messages and {removed_sessions} sessions before {cutoff:%Y-%m-%d} to {path}'
+        ))
+
+    @staticmethod
+    def _idle_sessions(cutoff):
+        return ChatSession.objects.filter(
+            ~Exists(ChatMessage.objects.filter(session=OuterRef('pk'))), updated_at__lt=cutoff
+        )
+
+    def _clear_reasoning(self, cutoff):
+        cleared = 0
+        last_id = 0
+        while True:
+            ids = list(
+                ChatMessage.objects.filter(created_at__lt=cutoff, id__gt=last_id)
+                .exclude(reasoning_trace=[]).order_by('id').values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return cleared
+            cleared += ChatMessage.objects.filter(id__in=ids).update(reasoning_trace=[])
+            last_id = ids[-1]
+            self._sleep()
+
+    def _archive_rows(self, model, queryset, fields, kind, archive, raw):
+        written = 0
+        while True:
+            rows = list(queryset.order_by('pk').values(*fields)[:self.batch_size])
+            if not rows:
+                return written
+            lines = ''.join(
+                json.dumps({'kind': kind, **row}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                for row in rows
+            )
+            archive.write(lines.encode('utf-8'))
+            # Sync-flush the compressed stream and fsync so the batch is on
+            # disk (and readable from a truncated file) before it is deleted.
+            archive.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+            model.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            written += len(rows)
+            self._sleep()
+
+    def _sleep(self):
+        if self.pause:
+            time.sleep(self.pause)
@@ -0,0 +1,107 @@
+"""
+Contention benchmark for the gamification write path.
+
+Fires N parallel ``apply_gamification_events`` calls (one content completion
+each, as the content-progress view sends) for a single throwaway user and
+checks that no update was lost: total XP, level, streak, the day's
+``DailyActivity`` row, ledger rows and badge awards must all agree.
+
+Usage:
+    python manage.py bench_xp_contention
+    python manage.py bench_xp_contention --awards 100 --workers 16 --amount 7
+
+Run it against PostgreSQL; SQLite serializes writers and will report
+"database is locked" errors instead of measuring contention.
+"""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+
+from api.services.gamification import GamificationEvent, apply_gamification_events
+from myapp.models import DailyActivity, User, UserBadge, UserStats, XPTransaction
+
+
+class Command(BaseCommand):
+    help = 'Fire parallel gamification events at one user and verify no update is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--awards', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--amount', type=int, default=7)
+
+    def handle(self, *args, **options):
+        awards = max(1, options['awards'])
+        workers = max(1, options['workers'])
+        amount = options['amount']
+
+        suffix = uuid.uuid4().hex[:10]
+        user = User.objects.create_user(
+            username=f'bench_xp_{suffix}',
+            email=f'bench_xp_{suffix}@example.invalid',
+            password=None,
+        )
+
+        def award(index):
+            try:
+                # Each thread uses its own DB connection; the first calls race
+                # to create the UserStats and DailyActivity rows.
+                apply_gamification_events(user, [GamificationEvent(
+                    source='content',
+                    xp=amount,
+                    description=f'bench award {index}',
+                    activity=True,
+                    content_completed=1,
+                )])
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(award, range(awards)))
+            elapsed = time.perf_counter() - started
+            close_old_connections()
+
+            stats = UserStats.objects.get(user=user)
+            daily = DailyActivity.objects.get(user=user, date=date.today())
+            content_rows = XPTransaction.objects.filter(user=user, source='content').count()
+            badge_rows = XPTransaction.objects.filter(user=user, source='badge').count()
+            badge_xp = XPTransaction.objects.filter(user=user, source='badge').aggregate(total=Sum('amount'))['total'] or 0
+            badges = UserBadge.objects.filter(user=user).count()
+            expected_xp = awards * amount + badge_xp
+            expected_level = next(
+                (level, title)
+                for level, threshold, title in reversed(UserStats.LEVEL_THRESHOLDS)
+                if expected_xp >= threshold
+            )
+
+            self.stdout.write(
+                f'{awards} awards with {workers} workers in {elapsed * 1000:.1f} ms '
+                f'({awards / elapsed:.1f} awards/s)'
+            )
+            self.stdout.write(
+                f'total_xp={stats.total_xp} (expected {expected_xp}), '
+                f'level={stats.level} {stats.level_title} (expected {expected_level[0]} {expected_level[1]}), '
+                f'streak={stats.current_streak} (expected 1), '
+                f'daily content={daily.content_completed} xp={daily.xp_earned} '
+                f'(expected {awards} / {awards * amount}), '
+                f'ledger rows={content_rows} (expected {awards}), '
+                f'badges={badges} (badge ledger rows {badge_rows})'
+            )
+            if (
+                stats.total_xp != expected_xp
+                or (stats.level, stats.level_title) != expected_level
+                or stats.current_streak != 1
+                or (daily.content_completed, daily.xp_earned) != (awards, awards * amount)
+                or content_rows != awards
+                or badge_rows > badges
+            ):
+                raise CommandError('Lost updates detected.')
+            self.stdout.write(self.style.SUCCESS('No lost updates.'))
+        finally:
+            user.delete()
@@ -0,0 +1,88 @@
+"""
+Management command to rebuild the course material search index from scratch.
+
+Every reading, module and assignment is chunked into ``MaterialPassage`` rows
+and the BM25 postings are accumulated in memory as packed arrays, then
+written as one ``MaterialPosting`` row per term and course. Day-to-day edits are indexed
+incrementally on save; run this after deploying the index, after bulk
+imports, or to repair drift.
+
+Usage:
+    python manage.py build_material_index
+    python manage.py build_material_index --batch-size 200
+"""
+from array import array
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.services.material_index import (
+    RECORD_SIZE,
+    SOURCE_ASSIGNMENT,
+    SOURCE_CONTENT,
+    SOURCE_MODULE,
+    build_passages,
+    invalidate_index_caches,
+    pack_postings,
+    postings_for,
+    source_passages,
+)
+from myapp.models import Assignment, Content, CourseModule, MaterialPassage, MaterialPosting
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the BM25 search index over course material'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        sources = [
+            (SOURCE_CONTENT, Content.objects.select_related('module').exclude(text__isnull=True).exclude(text='')),
+            (SOURCE_MODULE, CourseModule.objects.all()),
+            (SOURCE_ASSIGNMENT, Assignment.objects.all()),
+        ]
+
+        postings = defaultdict(lambda: array('I'))
+        passage_count = 0
+        with transaction.atomic():
+            MaterialPosting.objects.all().delete()
+            MaterialPassage.objects.all().delete()
+            for source_type, queryset in sources:
+                pending = []
+                for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+                    course_id, passages = source_passages(source_type, obj)
+                    pending.extend(build_passages(source_type, obj.pk, course_id, passages))
+                    if len(pending) >= batch_size:
+                        passage_count += self._flush(pending, postings)
+                        pending = []
+                passage_count += self._flush(pending, postings)
+
+            MaterialPosting.objects.bulk_create(
+                (
+                    MaterialPosting(
+                        term=term,
+                        course_id=course_id,
+                        doc_freq=len(records) // RECORD_SIZE,
+                        postings=pack_postings(records),
+                    )
+                    for (term, course_id), records in postings.items()
+                ),
+                batch_size=batch_size,
+            )
+        invalidate_index_caches()
+        term_count = len({term for term, _ in postings})
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {passage_count} passages with {term_count} terms.'
+        ))
+
+    @staticmethod
+    def _flush(pending, postings):
+        if not pending:
+            return 0
+        saved = MaterialPassage.objects.bulk_create(pending)
+        for key, records in postings_for(saved).items():
+            postings[key].extend(records)
+        return len(saved)
@@ -0,0 +1,144 @@
+"""
+Management command to compact the XPTransaction ledger.
+
+Transactions older than ``--keep-months`` full months are rolled up into
+per-user, per-source ``XPMonthlySummary`` rows and removed from the ledger,
+so its size (and the cost of xp_history / leaderboard reads) stays bounded.
+
+On PostgreSQL the compacted month's partition is detached and dropped; on
+other backends rows are deleted in batches. The command also creates the
+monthly partitions for the upcoming ``--create-ahead`` months.
+
+Usage (schedule monthly or nightly, e.g. from cron):
+    python manage.py compact_xp_ledger
+    python manage.py compact_xp_ledger --keep-months 12 --dry-run
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from myapp.models import XPMonthlySummary, XPTransaction
+from myapp.xp_ledger import (
+    add_months,
+    drop_month_partition,
+    ensure_month_partitions,
+    month_bounds,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = 'Roll old XP transactions into monthly summaries and maintain ledger partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=6,
+                            help='Full months of raw transactions to keep besides the current one')
+        parser.add_argument('--create-ahead', type=int, default=3,
+                            help='Upcoming monthly partitions to create (PostgreSQL only)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+        current_month = month_start(date.today())
+        cutoff = add_months(current_month, -max(0, options['keep_months']))
+
+        if not dry_run:
+            created = ensure_month_partitions(
+                connection, current_month, add_months(current_month, max(0, options['create_ahead']))
+            )
+            for name in created:
+                self.stdout.write(f'Created partition {name}')
+
+        oldest = XPTransaction.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        if oldest is None:
+            self.stdout.write('XP ledger is empty.')
+            return
+
+        month = month_start(oldest)
+        while month < cutoff:
+            start, end = month_bounds(month)
+            rows = (
+                XPTransaction.objects.filter(created_at__gte=start, created_at__lt=end)
+                .values('user_id', 'source')
+                .annotate(total=Sum('amount'), count=Count('id'))
+                .order_by('user_id', 'source')
+            )
+            if dry_run:
+                count = XPTransaction.objects.filter(created_at__gte=start, created_at__lt=end).count()
+                self.stdout.write(f'{month:%Y-%m}: would compact {count} transactions')
+            else:
+                with transaction.atomic():
+                    summarized = self._summarize(month, rows.iterator(chunk_size=batch_size), batch_size)
+                    removed = self._remove_month(month, start, end, batch_size)
+                self.stdout.write(
+                    f'{month:%Y-%m}: compacted {removed} transactions into {summarized} summaries'
+                )
+            # Skip straight to the next month that still has transactions.
+            following = (
+                XPTransaction.objects.filter(created_at__gte=end)
+                .order_by('created_at').values_list('created_at', flat=True).first()
+            )
+            if following is None:
+                break
+            month = month_start(following)
+
+        self.stdout.write(self.style.SUCCESS(f'XP ledger compacted up to {cutoff:%Y-%m}.'))
+
+    def _summarize(self, month, rows, batch_size):
+        written = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += self._write_summaries(month, batch)
+                batch = []
+        if batch:
+            written += self._write_summaries(month, batch)
+        return written
+
+    @staticmethod
+    def _write_summaries(month, batch):
+        # Add to existing rows so re-running after a partial compaction stays correct.
+        existing = {
+            (s.user_id, s.source): s
+            for s in XPMonthlySummary.objects.filter(
+                month=month, user_id__in={row['user_id'] for row in batch}
+            )
+        }
+        to_create = []
+        to_update = []
+        for row in batch:
+            summary = existing.get((row['user_id'], row['source']))
+            if summary is None:
+                to_create.append(XPMonthlySummary(
+                    user_id=row['user_id'],
+                    month=month,
+                    source=row['source'],
+                    total_xp=row['total'] or 0,
+                    transaction_count=row['count'],
+                ))
+            else:
+                summary.total_xp += row['total'] or 0
+                summary.transaction_count += row['count']
+                to_update.append(summary)
+        XPMonthlySummary.objects.bulk_create(to_create)
+        XPMonthlySummary.objects.bulk_update(to_update, ['total_xp', 'transaction_count'])
+        return len(to_create) + len(to_update)
+
+    @staticmethod
+    def _remove_month(month, start, end, batch_size):
+        month_qs = XPTransaction.objects.filter(created_at__gte=start, created_at__lt=end)
+        removed = month_qs.count()
+        drop_month_partition(connection, month)
+        # Whatever is left (no partitioning, or stragglers in the default
+        # partition) is deleted in batches.
+        while True:
+            ids = list(month_qs.order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            XPTransaction.objects.filter(created_at__gte=start, created_at__lt=end, id__in=ids).delete()
+        return removed
@@ -0,0 +1,166 @@
+"""
+Management command to recompute learning streaks from DailyActivity.
+
+Streaks are only advanced when a user is active, so a user who stops
+learning keeps a stale ``current_streak`` forever. This job reconciles every
+``UserStats`` row against its ``DailyActivity`` dates using a gaps-and-islands
+window query: consecutive dates share the same ``day_number - ROW_NUMBER()``
+value, so each island is one unbroken streak.
+
+Users are processed in primary-key chunks, so memory stays bounded
+regardless of user count. Each chunk is written back with one conditional
+``UPDATE``: a row is only rewritten while its ``last_activity_date`` is still
+no later than the date the recomputation was based on, so activity recorded
+after the snapshot keeps the streak it advanced, and ``longest_streak`` is
+raised with ``GREATEST`` rather than overwritten.
+
+Usage (schedule nightly, e.g. from cron):
+    python manage.py recompute_streaks
+    python manage.py recompute_streaks --chunk-size 5000 --dry-run
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+
+from myapp.models import DailyActivity, UserStats
+
+
+STREAK_ISLANDS_SQL = """
+WITH days AS (
+    SELECT user_id, date,
+           {day_number} - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date) AS island
+    FROM {table}
+    WHERE user_id IN ({placeholders})
+),
+islands AS (
+    SELECT user_id, COUNT(*) AS length, MAX(date) AS last_date
+    FROM days
+    GROUP BY user_id, island
+)
+SELECT user_id, length, last_date, longest
+FROM (
+    SELECT user_id, length, last_date,
+           MAX(length) OVER (PARTITION BY user_id) AS longest,
+           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY last_date DESC) AS rn
+    FROM islands
+) ranked
+WHERE rn = 1
+"""
+
+
+def _day_number_sql() -> str:
+    if connection.vendor == 'postgresql':
+        return "(date - DATE '1970-01-01')"
+    return "CAST(julianday(date) AS INTEGER)"
+
+
+def _streak_islands(user_ids):
+    """Map user_id -> (last island length, last active date, longest island)."""
+    sql = STREAK_ISLANDS_SQL.format(
+        day_number=_day_number_sql(),
+        table=connection.ops.quote_name(DailyActivity._meta.db_table),
+        placeholders=', '.join(['%s'] * len(user_ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(user_ids))
+        rows = cursor.fetchall()
+    result = {}
+    for user_id, length, last_date, longest in rows:
+        if isinstance(last_date, str):
+            last_date = date.fromisoformat(last_date)
+        result[user_id] = (int(length), last_date, int(longest))
+    return result
+
+
+def _write_streaks(rows, batch_size=500):
+    """Apply ``(pk, current, longest, last_date)`` rows unless newer activity won.
+
+    Returns the number of rows written; a row is skipped when its
+    ``last_activity_date`` moved past ``last_date`` since the snapshot.
+    """
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        fresh = Q()
+        for pk, _current, _longest, last_date in batch:
+            if last_date is None:
+                fresh |= Q(pk=pk, last_activity_date__isnull=True)
+            else:
+                fresh |= Q(pk=pk) & (Q(last_activity_date__isnull=True) | Q(last_activity_date__lte=last_date))
+        written += UserStats.objects.filter(fresh).update(
+            current_streak=Case(
+                *[When(pk=pk, then=Value(current)) for pk, current, _longest, _last in batch],
+                output_field=models.IntegerField(),
+            ),
+            longest_streak=Greatest(F('longest_streak'), Case(
+                *[When(pk=pk, then=Value(longest)) for pk, _current, longest, _last in batch],
+                output_field=models.IntegerField(),
+            )),
+            last_activity_date=Case(
+                *[When(pk=pk, then=Value(last_date)) for pk, _current, _longest, last_date in batch],
+                output_field=models.DateField(),
+            ),
+        )
+    return written
+
+
+class Command(BaseCommand):
+    help = 'Recompute current/longest streaks for all users from DailyActivity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        dry_run = options['dry_run']
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+
+        fields = ['current_streak', 'longest_streak', 'last_activity_date']
+        scanned = 0
+        updated = 0
+        skipped = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                UserStats.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('id', 'user_id', *fields)[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            scanned += len(chunk)
+
+            islands = _streak_islands([stats.user_id for stats in chunk])
+            changed = []
+            for stats in chunk:
+                length, last_date, longest = islands.get(
+                    stats.user_id, (0, stats.last_activity_date, 0)
+                )
+                # A streak is only alive if the user was active today or yesterday.
+                alive = last_date is not None and last_date >= yesterday
+                current = length if alive else 0
+                # Never lower longest_streak: badges may already have been awarded on it.
+                longest = max(stats.longest_streak, longest, current)
+                if (stats.current_streak, stats.longest_streak, stats.last_activity_date) != (
+                    current, longest, last_date
+                ):
+                    changed.append((stats.pk, current, longest, last_date))
+
+            if dry_run:
+                updated += len(changed)
+            elif changed:
+                written = _write_streaks(changed)
+                updated += written
+                skipped += len(changed) - written
+
+        verb = 'Would update' if dry_run else 'Updated'
+        message = f'Scanned {scanned} user stats. {verb} {updated} with streak drift.'
+        if skipped:
+            message += f' Skipped {skipped} with newer activity.'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,167 @@
+"""
+Management command to train the chatbot intent router's linear correction model.
+
+Each example is a JSON line with ``query``, ``role`` and the ``intents`` that
+should have been routed (``[]`` for none). Lines from the misroute log become
+examples once someone adds an ``intents`` list; lines without one are
+skipped. The model is a per-intent logistic regression over unigram/bigram
+features that takes the keyword automaton's logit as a fixed offset, so it
+only learns corrections, and features it never saw leave routing unchanged.
+
+Accuracy with the model is reported by k-fold cross-validation (each fold is
+routed by a model trained on the other folds); the saved model is then
+trained on every example. ``--evaluate`` scores the saved model on the given
+examples, which is only a held-out figure for files it was not trained on.
+
+Usage:
+    python manage.py train_intent_model
+    python manage.py train_intent_model --examples misroutes-labelled.jsonl --epochs 60
+    python manage.py train_intent_model --evaluate
+"""
+import json
+import math
+import random
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.services.intent_router import DEFAULT_MODEL_PATH, IntentRouter, features, load_model, tokenize
+
+
+SEED_EXAMPLES = DEFAULT_MODEL_PATH.parent / "examples.jsonl"
+
+
+def _sigmoid(value):
+    if value < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+class Command(BaseCommand):
+    help = 'Train the chatbot intent router correction model from labelled queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--examples', action='append', default=[],
+                            help='Extra labelled JSONL files (the seed examples are always used)')
+        parser.add_argument('--output', default=str(DEFAULT_MODEL_PATH))
+        parser.add_argument('--epochs', type=int, default=40)
+        parser.add_argument('--learning-rate', type=float, default=0.2)
+        parser.add_argument('--l2', type=float, default=0.1)
+        parser.add_argument('--min-weight', type=float, default=0.3,
+                            help='Drop weights smaller than this from the saved model')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--folds', type=int, default=5,
+                            help='Cross-validation folds for the reported accuracy')
+        parser.add_argument('--evaluate', action='store_true',
+                            help='Report routing accuracy of the saved model without training')
+
+    def handle(self, *args, **options):
+        examples = self._load([SEED_EXAMPLES] + [Path(p) for p in options['examples']])
+        if not examples:
+            raise CommandError('No labelled examples found.')
+        keyword_router = IntentRouter(model={})
+
+        if options['evaluate']:
+            self._report('keyword only', keyword_router, examples)
+            self._report('saved model', IntentRouter(model=load_model(options['output'])), examples)
+            return
+
+        self._report('keyword only', keyword_router, examples)
+        self._cross_validate(keyword_router, examples, options)
+        weights = self._train(keyword_router, examples, options)
+
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump({
+                'version': 1,
+                'trained_at': timezone.now().isoformat(),
+                'examples': len(examples),
+                'weights': weights,
+            }, handle, indent=1, sort_keys=True)
+            handle.write('\n')
+        total = sum(len(w) for w in weights.values())
+        self.stdout.write(self.style.SUCCESS(f'Wrote {total} weights for {len(weights)} intents to {output}'))
+
+    def _load(self, paths):
+        examples = []
+        for path in paths:
+            if not path.exists():
+                raise CommandError(f'{path} does not exist.')
+            with open(path, encoding='utf-8') as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    if not isinstance(record.get('intents'), list) or not record.get('query'):
+                        continue
+                    examples.append((record['query'], record.get('role', 'student'), set(record['intents'])))
+        return examples
+
+    def _train(self, router, examples, options):
+        prepared = []
+        for query, role, intents in examples:
+            tokens = tokenize(query)
+            offsets, _ = router.keyword_logits(tokens, role)
+            prepared.append((features(tokens), offsets, intents))
+
+        rng = random.Random(options['seed'])
+        rate, l2 = options['learning_rate'], options['l2']
+        weights = {name: {} for name in router.intents}
+        for _ in range(max(1, options['epochs'])):
+            rng.shuffle(prepared)
+            for feats, offsets, intents in prepared:
+                for name, offset in offsets.items():
+                    intent_weights = weights[name]
+                    logit = offset + sum(intent_weights.get(f, 0.0) for f in feats)
+                    gradient = (1.0 if name in intents else 0.0) - _sigmoid(logit)
+                    for f in feats:
+                        current = intent_weights.get(f, 0.0)
+                        intent_weights[f] = current + rate * (gradient - l2 * current)
+
+        minimum = options['min_weight']
+        return {
+            name: {f: round(w, 3) for f, w in sorted(intent_weights.items()) if abs(w) >= minimum}
+            for name, intent_weights in weights.items()
+            if any(abs(w) >= minimum for w in intent_weights.values())
+        }
+
+    def _cross_validate(self, router, examples, options):
+        folds = min(max(2, options['folds']), len(examples))
+        if folds < 2:
+            self.stdout.write('with model: too few examples to cross-validate')
+            return
+        shuffled = list(examples)
+        random.Random(options['seed']).shuffle(shuffled)
+        exact = 0
+        errors = []
+        for fold in range(folds):
+            held_out = shuffled[fold::folds]
+            training = [example for index, example in enumerate(shuffled) if index % folds != fold]
+            fold_router = IntentRouter(model=self._train(router, training, options))
+            fold_exact, fold_errors = self._score(fold_router, held_out)
+            exact += fold_exact
+            errors.extend(fold_errors)
+        self._write_score(f'with model ({folds}-fold cross-validation)', exact, errors, len(examples))
+
+    def _score(self, router, examples):
+        exact = 0
+        errors = []
+        for query, role, intents in examples:
+            selected = set(router.route(query, role).selected)
+            if selected == intents:
+                exact += 1
+            else:
+                errors.append((query, sorted(selected), sorted(intents)))
+        return exact, errors
+
+    def _report(self, label, router, examples):
+        exact, errors = self._score(router, examples)
+        self._write_score(label, exact, errors, len(examples))
+
+    def _write_score(self, label, exact, errors, total):
+        self.stdout.write(f'{label}: {exact}/{total} examples routed exactly')
+        for query, got, expected in errors[:10]:
+            self.stdout.write(f'  {query!r}: got {got}, expected {expected}')
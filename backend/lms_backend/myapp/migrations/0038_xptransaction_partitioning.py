@@ -0,0 +1,130 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+TABLE = 'myapp_xptransaction'
+LEGACY_TABLE = 'myapp_xptransaction_legacy'
+ID_SEQUENCE = 'myapp_xptransaction_part_id_seq'
+# Monthly partitions created ahead of time; compact_xp_ledger keeps extending them.
+MONTHS_AHEAD = 3
+
+
+def _add_months(year, month, count):
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+
+def partition_xp_ledger(apps, schema_editor):
+    """Rebuild myapp_xptransaction as a table range-partitioned by month.
+
+    PostgreSQL only: other backends keep the plain table and rely on the
+    composite indexes plus compact_xp_ledger to bound its size.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    user_table = apps.get_model('myapp', 'User')._meta.db_table
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, TABLE)
+        pkey = next(name for name, c in constraints.items() if c['primary_key'])
+        fkey = next(name for name, c in constraints.items() if c['foreign_key'])
+        user_index = next(
+            (
+                name for name, c in constraints.items()
+                if c['index'] and c['columns'] == ['user_id']
+                and not (c['primary_key'] or c['unique'] or c['foreign_key'])
+            ),
+            None,
+        )
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        cursor.execute(f'ALTER TABLE {LEGACY_TABLE} RENAME CONSTRAINT {pkey} TO {LEGACY_TABLE}_pkey')
+        if user_index:
+            cursor.execute(f'ALTER INDEX {user_index} RENAME TO {LEGACY_TABLE}_user_id_idx')
+
+        cursor.execute(f'CREATE SEQUENCE {ID_SEQUENCE}')
+        cursor.execute(f"""
+            CREATE TABLE {TABLE} (
+                id integer NOT NULL DEFAULT nextval('{ID_SEQUENCE}'),
+                amount integer NOT NULL,
+                source varchar(20) NOT NULL,
+                description varchar(200) NOT NULL,
+                created_at timestamp with time zone NOT NULL,
+                user_id integer NOT NULL,
+                CONSTRAINT {pkey} PRIMARY KEY (id, created_at),
+                CONSTRAINT {fkey} FOREIGN KEY (user_id) REFERENCES {user_table} (id)
+                    DEFERRABLE INITIALLY DEFERRED
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute(f'ALTER SEQUENCE {ID_SEQUENCE} OWNED BY {TABLE}.id')
+        cursor.execute(f'CREATE TABLE {TABLE}_pdefault PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f"SELECT min(created_at) AT TIME ZONE 'UTC' FROM {LEGACY_TABLE}")
+        oldest = cursor.fetchone()[0]
+        cursor.execute("SELECT now() AT TIME ZONE 'UTC'")
+        now = cursor.fetchone()[0]
+        year, month = (oldest.year, oldest.month) if oldest else (now.year, now.month)
+        last = _add_months(now.year, now.month, MONTHS_AHEAD)
+        while (year, month) <= last:
+            next_year, next_month = _add_months(year, month, 1)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{year:04d}{month:02d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{year:04d}-{month:02d}-01 00:00:00+00') "
+                f"TO ('{next_year:04d}-{next_month:02d}-01 00:00:00+00')"
+            )
+            year, month = next_year, next_month
+
+        cursor.execute(
+            f'INSERT INTO {TABLE} (id, amount, source, description, created_at, user_id) '
+            f'SELECT id, amount, source, description, created_at, user_id FROM {LEGACY_TABLE}'
+        )
+        cursor.execute(
+            f"SELECT setval('{ID_SEQUENCE}', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+        )
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
+        if user_index:
+            cursor.execute(f'CREATE INDEX {user_index} ON {TABLE} (user_id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0037_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_xp_ledger, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='XPMonthlySummary',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('month', models.DateField()),
+                ('source', models.CharField(choices=[('content', 'Content Completion'), ('assignment', 'Assignment'), ('perfect_score', 'Perfect Score Bonus'), ('course', 'Course Completion'), ('streak', 'Streak Bonus'), ('badge', 'Badge Reward'), ('review', 'Course Review'), ('first_attempt', 'First Attempt Bonus')], max_length=20)),
+                ('total_xp', models.IntegerField(default=0)),
+                ('transaction_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='xptransaction',
+            index=models.Index(fields=['user', 'created_at'], name='myapp_xptra_user_id_091711_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='xptransaction',
+            index=models.Index(fields=['created_at', 'user'], name='myapp_xptra_created_bade87_idx'),
+        ),
+        migrations.AddField(
+            model_name='xpmonthlysummary',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='xp_monthly_summaries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='xpmonthlysummary',
+            unique_together={('user', 'month', 'source')},
+        ),
+    ]
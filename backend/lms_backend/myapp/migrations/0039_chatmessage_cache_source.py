@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0038_xptransaction_partitioning'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='source',
+            field=models.CharField(choices=[('cerebras', 'Cerebras'), ('gemini', 'Gemini'), ('fallback', 'Fallback'), ('cache', 'Response cache')], default='cerebras', max_length=20),
+        ),
+    ]
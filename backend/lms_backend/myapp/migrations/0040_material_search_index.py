@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0039_chatmessage_cache_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialTerm',
+            fields=[
+                ('term', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('doc_freq', models.PositiveIntegerField(default=0)),
+                ('postings', models.BinaryField(default=bytes)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MaterialPassage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('source_type', models.CharField(choices=[('content', 'Content'), ('module', 'Module'), ('assignment', 'Assignment')], max_length=20)),
+                ('source_id', models.IntegerField()),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('title', models.CharField(max_length=200)),
+                ('text', models.TextField()),
+                ('length', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='material_passages', to='myapp.course')),
+            ],
+            options={
+                'ordering': ['source_type', 'source_id', 'position'],
+                'indexes': [models.Index(fields=['source_type', 'source_id'], name='myapp_mater_source__4a2d2f_idx')],
+            },
+        ),
+    ]
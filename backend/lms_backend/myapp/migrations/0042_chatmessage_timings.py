@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0041_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
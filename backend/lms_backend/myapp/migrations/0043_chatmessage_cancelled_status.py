@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0042_chatmessage_timings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='status',
+            field=models.CharField(choices=[('completed', 'Completed'), ('error', 'Error'), ('partial', 'Partial'), ('cancelled', 'Cancelled')], default='completed', max_length=20),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:40
+
+from django.db import migrations
+
+
+INDEX = 'myapp_chatmessage_search_idx'
+FTS_TABLE = 'myapp_chatmessage_fts'
+# Must match SEARCH_CONFIG / SEARCH_DOCUMENT in api/services/chat_search.py.
+DOCUMENT = "to_tsvector('english', coalesce(query, '') || ' ' || coalesce(response, ''))"
+
+
+def create_search_index(apps, schema_editor):
+    """GIN tsvector index on PostgreSQL, an FTS5 table plus sync triggers on SQLite.
+
+    Searches filter by user through the existing (user, -created_at) index;
+    a composite GIN index would need the btree_gin extension.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        # Built concurrently so a large history table stays writable.
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} ON myapp_chatmessage USING GIN ({DOCUMENT})')
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    "query, response, content='myapp_chatmessage', content_rowid='id', "
+                    "tokenize='porter unicode61')"
+                )
+            except Exception:
+                # FTS5 not compiled in; chat_search falls back to a per-user scan.
+                return
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON myapp_chatmessage BEGIN
+                    INSERT INTO {FTS_TABLE}(rowid, query, response) VALUES (new.id, new.query, new.response);
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON myapp_chatmessage BEGIN
+                    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, query, response)
+                    VALUES ('delete', old.id, old.query, old.response);
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF query, response ON myapp_chatmessage BEGIN
+                    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, query, response)
+                    VALUES ('delete', old.id, old.query, old.response);
+                    INSERT INTO {FTS_TABLE}(rowid, query, response) VALUES (new.id, new.query, new.response);
+                END
+            """)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX}')
+    elif connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('myapp', '0043_chatmessage_cancelled_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-18 23:09
+
+import sys
+from array import array
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _unpack(blob):
+    values = array('I')
+    values.frombytes(bytes(blob or b''))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _pack(values):
+    if sys.byteorder == 'big':
+        values = array('I', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def split_postings_by_course(apps, schema_editor):
+    """Split each global (passage, course, tf, length) blob into per-course (passage, tf, length) rows."""
+    MaterialTerm = apps.get_model('myapp', 'MaterialTerm')
+    MaterialPosting = apps.get_model('myapp', 'MaterialPosting')
+    Course = apps.get_model('myapp', 'Course')
+    course_ids = set(Course.objects.values_list('id', flat=True))
+    pending = []
+    for row in MaterialTerm.objects.iterator(chunk_size=500):
+        by_course = defaultdict(lambda: array('I'))
+        records = _unpack(row.postings)
+        for i in range(0, len(records), 4):
+            if records[i + 1] in course_ids:
+                by_course[records[i + 1]].extend((records[i], records[i + 2], records[i + 3]))
+        for course_id, course_records in by_course.items():
+            pending.append(MaterialPosting(
+                term=row.term,
+                course_id=course_id,
+                doc_freq=len(course_records) // 3,
+                postings=_pack(course_records),
+            ))
+        if len(pending) >= 500:
+            MaterialPosting.objects.bulk_create(pending)
+            pending = []
+    MaterialPosting.objects.bulk_create(pending)
+
+
+def merge_postings_by_term(apps, schema_editor):
+    MaterialTerm = apps.get_model('myapp', 'MaterialTerm')
+    MaterialPosting = apps.get_model('myapp', 'MaterialPosting')
+    merged = defaultdict(lambda: array('I'))
+    for row in MaterialPosting.objects.order_by('term', 'course_id').iterator(chunk_size=500):
+        records = _unpack(row.postings)
+        for i in range(0, len(records), 3):
+            merged[row.term].extend((records[i], row.course_id, records[i + 1], records[i + 2]))
+    MaterialTerm.objects.bulk_create(
+        (
+            MaterialTerm(term=term, doc_freq=len(records) // 4, postings=_pack(records))
+            for term, records in merged.items()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0046_chatmessage_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialPosting',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('term', models.CharField(max_length=64)),
+                ('doc_freq', models.PositiveIntegerField(default=0)),
+                ('postings', models.BinaryField(default=bytes)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='material_postings', to='myapp.course')),
+            ],
+            options={
+                'unique_together': {('term', 'course')},
+            },
+        ),
+        migrations.RunPython(split_postings_by_course, merge_postings_by_term),
+        migrations.DeleteModel(
+            name='MaterialTerm',
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThanOrEqual
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from cloudinary.models import CloudinaryField
@@ -650,29 +653,36 @@ class UserStats(models.Model):
     def __str__(self):
         return f"{self.user.username} - Level {self.level} ({self.total_xp} XP)"
 
-    def add_xp(self, amount, source, description=""):
-        """Add XP and update level if needed"""
-        self.total_xp += amount
-        self._update_level()
-        self.save()
-        
-        # Log the transaction
-        XPTransaction.objects.create(
-            user=self.user,
-            amount=amount,
-            source=source,
-            description=description
+    @classmethod
+    def level_expressions(cls, total_xp):
+        """SQL expressions for ``level`` and ``level_title`` given a total XP expression"""
+        total_xp = ExpressionWrapper(total_xp, output_field=models.IntegerField())
+        level_whens = []
+        title_whens = []
+        for level, threshold, title in reversed(cls.LEVEL_THRESHOLDS):
+            reached = GreaterThanOrEqual(total_xp, threshold)
+            level_whens.append(When(reached, then=Value(level)))
+            title_whens.append(When(reached, then=Value(title)))
+        return {
+            'level': Case(*level_whens, default=Value(1), output_field=models.IntegerField()),
+            'level_title': Case(*title_whens, default=Value('Beginner'), output_field=models.CharField()),
+        }
+
+    @staticmethod
+    def streak_expressions(today):
+        """SQL expressions that record activity on ``today``: keep, extend or restart the streak"""
+        from datetime import timedelta
+        current = Case(
+            When(last_activity_date=today, then=F('current_streak')),
+            When(last_activity_date=today - timedelta(days=1), then=F('current_streak') + 1),
+            default=Value(1),
+            output_field=models.IntegerField(),
         )
-        
-        return self.total_xp
-
-    def _update_level(self):
-        """Update level based on total XP"""
-        for level, threshold, title in reversed(self.LEVEL_THRESHOLDS):
-            if self.total_xp >= threshold:
-                self.level = level
-                self.level_title = title
-                break
+        return {
+            'current_streak': current,
+            'longest_streak': Greatest(F('longest_streak'), current),
+            'last_activity_date': Value(today, output_field=models.DateField()),
+        }
 
     def get_xp_for_next_level(self):
         """Get XP required for next level"""
@@ -699,30 +709,6 @@ class UserStats(models.Model):
         progress = ((self.total_xp - current_threshold) / (next_threshold - current_threshold)) * 100
         return min(100, max(0, round(progress, 1)))
 
-    def update_streak(self):
-        """Update streak based on activity"""
-        from datetime import date, timedelta
-        today = date.today()
-        
-        if self.last_activity_date is None:
-            self.current_streak = 1
-        elif self.last_activity_date == today:
-            # Already recorded today
-            return self.current_streak
-        elif self.last_activity_date == today - timedelta(days=1):
-            # Consecutive day
-            self.current_streak += 1
-        else:
-            # Streak broken
-            self.current_streak = 1
-        
-        self.last_activity_date = today
-        if self.current_streak > self.longest_streak:
-            self.longest_streak = self.current_streak
-        
-        self.save()
-        return self.current_streak
-
 
 class DailyActivity(models.Model):
     """Track daily learning activity for detailed analytics"""
@@ -763,10 +749,35 @@ class XPTransaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # On PostgreSQL the table is range-partitioned by month on created_at
+        # (see migration 0038 and the compact_xp_ledger command).
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at', 'user']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} +{self.amount} XP ({self.source})"
+
+
+class XPMonthlySummary(models.Model):
+    """Per-user monthly XP totals rolled up from compacted XPTransaction rows"""
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='xp_monthly_summaries')
+    month = models.DateField()  # first day of the month
+    source = models.CharField(max_length=20, choices=XPTransaction.XP_SOURCES)
+    total_xp = models.IntegerField(default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'month', 'source')
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.user.username} {self.month:%Y-%m} {self.total_xp} XP ({self.source})"
 from .chatbot_models import ChatMessage, ChatSession
+from .generation_models import GenerationJob
+from .search_models import MaterialPassage, MaterialPosting
 
 
 class Category(models.Model):
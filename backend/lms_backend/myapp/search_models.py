@@ -0,0 +1,52 @@
+from django.db import models
+
+
+class MaterialPassage(models.Model):
+    """A chunk of course material indexed for chatbot retrieval."""
+
+    SOURCE_CHOICES = (
+        ('content', 'Content'),
+        ('module', 'Module'),
+        ('assignment', 'Assignment'),
+    )
+
+    id = models.AutoField(primary_key=True)
+    course = models.ForeignKey('myapp.Course', on_delete=models.CASCADE, related_name='material_passages')
+    source_type = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.IntegerField()
+    position = models.PositiveIntegerField(default=0)
+    title = models.CharField(max_length=200)
+    text = models.TextField()
+    length = models.PositiveIntegerField(default=0)  # Indexed term count, for BM25 length normalization
+
+    class Meta:
+        ordering = ['source_type', 'source_id', 'position']
+        indexes = [
+            models.Index(fields=['source_type', 'source_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.source_type}:{self.source_id}#{self.position} {self.title[:50]}"
+
+
+class MaterialPosting(models.Model):
+    """Inverted-index entry: packed postings for one term within one course.
+
+    ``postings`` is a little-endian uint32 array of
+    ``(passage_id, term_frequency, passage_length)`` records, so a query
+    scores candidates without touching the passage table. Keying by course
+    bounds both sides: re-indexing a source rewrites only its course's blob
+    of each term, and a query reads only the courses it searches.
+    """
+
+    id = models.AutoField(primary_key=True)
+    term = models.CharField(max_length=64)
+    course = models.ForeignKey('myapp.Course', on_delete=models.CASCADE, related_name='material_postings')
+    doc_freq = models.PositiveIntegerField(default=0)
+    postings = models.BinaryField(default=bytes)
+
+    class Meta:
+        unique_together = ('term', 'course')
+
+    def __str__(self):
+        return f"{self.term}@{self.course_id} ({self.doc_freq})"
@@ -0,0 +1,111 @@
+"""Helpers for the month-partitioned XPTransaction ledger.
+
+On PostgreSQL ``myapp_xptransaction`` is range-partitioned by month on
+``created_at`` (migration 0038) with one ``<table>_pYYYYMM`` partition per
+month and a ``<table>_pdefault`` catch-all. Other backends keep a plain
+table; every helper here is a no-op for them.
+"""
+import logging
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import DatabaseError, transaction
+
+from .models import XPTransaction
+
+logger = logging.getLogger(__name__)
+
+TABLE = XPTransaction._meta.db_table
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + (month.month - 1) + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date):
+    """Return the [start, end) UTC datetimes covering ``month``."""
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    nxt = add_months(month, 1)
+    end = datetime(nxt.year, nxt.month, 1, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(connection) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def month_partitions(connection) -> dict:
+    """Map month -> partition table name for existing monthly partitions."""
+    if not is_partitioned(connection):
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f"{TABLE}_p"
+    result = {}
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit() and len(suffix) == 6:
+            result[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return result
+
+
+def ensure_month_partitions(connection, first_month: date, last_month: date) -> list:
+    """Create missing monthly partitions in [first_month, last_month]."""
+    if not is_partitioned(connection):
+        return []
+    existing = month_partitions(connection)
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if month not in existing:
+            start, end = month_bounds(month)
+            name = partition_name(month)
+            try:
+                with transaction.atomic(using=connection.alias):
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            f"CREATE TABLE {connection.ops.quote_name(name)} "
+                            f"PARTITION OF {connection.ops.quote_name(TABLE)} "
+                            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                        )
+                created.append(name)
+            except DatabaseError:
+                # Rows for this month already landed in the default partition.
+                logger.warning("Could not create XP ledger partition %s", name, exc_info=True)
+        month = add_months(month, 1)
+    return created
+
+
+def drop_month_partition(connection, month: date) -> bool:
+    """Detach and drop the partition holding ``month``; True if one existed."""
+    name = month_partitions(connection).get(month)
+    if not name:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {connection.ops.quote_name(TABLE)} "
+            f"DETACH PARTITION {connection.ops.quote_name(name)}"
+        )
+        cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+    return True
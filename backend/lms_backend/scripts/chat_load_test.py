@@ -0,0 +1,435 @@
+"""
+Load test the chatbot endpoints without spending provider quota.
+
+Runs N concurrent users through scripted multi-turn conversations against
+the chatbot query or stream endpoint, with the LLM replaced by the local stub
+in ``llm_stub_server.py``, and reports throughput, time to first token,
+latency percentiles, body chunks per streamed response, DB queries and
+memory.
+
+Modes:
+    wsgi   in-process, one thread per user through Django's WSGI handler
+    asgi   in-process, one task per user through Django's ASGI handler
+           (the stream endpoint uses the async view)
+    --target URL   a running server (e.g. gunicorn vs uvicorn); start the
+           stub separately and point the server's CEREBRAS_BASE_URL at it.
+           DB queries and memory are then the server's, not reported here.
+
+The run creates throwaway ``loadtest_<n>`` students and their chat history
+in the configured database: use a dev or staging database, never production.
+``--cleanup`` deletes them afterwards. Per-user quotas are lifted for
+in-process runs.
+
+Usage:
+    python scripts/chat_load_test.py --users 20 --turns 4
+    python scripts/chat_load_test.py --mode asgi --endpoint stream --users 50
+    python scripts/chat_load_test.py --tool-cache off --response-cache off
+    python scripts/chat_load_test.py --ttft-ms 800 --tokens-per-second 40 --error-rate 0.05
+    python scripts/chat_load_test.py --target http://127.0.0.1:8000 --users 20 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CURRENT_FILE = Path(__file__).resolve()
+PROJECT_ROOT = CURRENT_FILE.parents[1]  # .../backend/lms_backend
+for path in (PROJECT_ROOT, CURRENT_FILE.parent):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from llm_stub_server import add_stub_arguments, start_stub_server, stub_config_from_args  # noqa: E402
+
+CHAT_SCRIPTS = [
+    [
+        "Can you recommend beginner courses in web development?",
+        "Which of those has the best rating?",
+        "How long would it take me to finish it?",
+        "Make me a learning roadmap for web development.",
+    ],
+    [
+        "How is my progress in my enrolled courses?",
+        "What should I focus on next?",
+        "Explain what a Python decorator is.",
+        "Give me a practice exercise for that.",
+    ],
+    [
+        "Show me the top rated courses.",
+        "Are there any cheaper options under 20 dollars?",
+        "What does the data science course cover?",
+        "Thanks! Summarize what we discussed.",
+    ],
+]
+
+
+@dataclass
+class Result:
+    ok: bool
+    status: int
+    latency: float
+    ttft: Optional[float] = None
+    error: str = ''
+    chunks: int = 0
+
+
+@dataclass
+class Report:
+    results: List[Result] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, result: Result):
+        with self.lock:
+            self.results.append(result)
+
+
+class QueryCounter:
+    """Counts SQL statements on every connection, including worker threads'."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _attach(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(lambda sender, connection, **kwargs: self._attach(connection), weak=False)
+        for connection in connections.all():
+            self._attach(connection)
+
+
+def percentile(values, fraction):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    position = fraction * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+
+
+def parse_sse(buffer: str):
+    """Split complete SSE blocks off ``buffer``; returns (events, rest)."""
+    events = []
+    while '\n\n' in buffer:
+        block, buffer = buffer.split('\n\n', 1)
+        name, data = None, None
+        for line in block.splitlines():
+            if line.startswith('event:'):
+                name = line[6:].strip()
+            elif line.startswith('data:'):
+                data = line[5:].strip()
+        if name:
+            events.append((name, json.loads(data) if data else {}))
+    return events, buffer
+
+
+class TurnState:
+    """Consumes one streamed turn, tracking TTFT, session id and errors."""
+
+    def __init__(self, started):
+        self.started = started
+        self.buffer = ''
+        self.ttft = None
+        self.session_id = None
+        self.error = ''
+        self.chunks = 0
+
+    def feed(self, chunk):
+        self.chunks += 1
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8', 'replace')
+        events, self.buffer = parse_sse(self.buffer + chunk)
+        for name, data in events:
+            if name == 'meta':
+                self.session_id = data.get('session_id')
+            elif name == 'token' and self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+            elif name == 'error':
+                self.error = data.get('code') or 'stream_error'
+
+
+def _endpoint_path(args):
+    if args.endpoint == 'query':
+        return '/api/chatbot/query/'
+    return '/api/chatbot/stream/async/' if args.mode == 'asgi' and not args.target else '/api/chatbot/stream/'
+
+
+def _body(query, session_id):
+    body = {'query': query, 'show_reasoning': False}
+    if session_id:
+        body['session_id'] = session_id
+    return body
+
+
+def _finish(report, started, status_code, state, error):
+    latency = time.perf_counter() - started
+    ok = status_code == 200 and not error
+    ttft = state.ttft if state.ttft is not None else latency
+    report.add(Result(ok=ok, status=status_code, latency=latency, ttft=ttft, error=error, chunks=state.chunks))
+
+
+def run_user_sync(args, token, script, report):
+    if args.target:
+        import httpx
+
+        client = httpx.Client(base_url=args.target, timeout=300)
+    else:
+        from django.test import Client
+
+        client = Client()
+    headers = {'Authorization': f'Bearer {token}'}
+    path = _endpoint_path(args)
+    session_id = None
+    for query in script[: args.turns]:
+        started = time.perf_counter()
+        if args.target and args.endpoint == 'stream':
+            state = TurnState(started)
+            with client.stream('POST', path, json=_body(query, session_id), headers=headers) as response:
+                for chunk in response.iter_text():
+                    state.feed(chunk)
+                status_code = response.status_code
+        elif args.target:
+            response = client.post(path, json=_body(query, session_id), headers=headers)
+            status_code = response.status_code
+            state = TurnState(started)
+            if status_code == 200:
+                state.session_id = response.json().get('session_id')
+        else:
+            response = client.post(path, _body(query, session_id), content_type='application/json', headers=headers)
+            status_code = response.status_code
+            state = TurnState(started)
+            if args.endpoint == 'stream' and status_code == 200:
+                for chunk in response.streaming_content:
+                    state.feed(chunk)
+            elif status_code == 200:
+                state.session_id = response.json().get('session_id')
+        _finish(report, started, status_code, state, state.error or ('' if status_code == 200 else f'http_{status_code}'))
+        session_id = state.session_id or session_id
+        if args.think_ms:
+            time.sleep(args.think_ms / 1000)
+
+
+async def run_user_async(args, token, script, report):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    headers = {'Authorization': f'Bearer {token}'}
+    path = _endpoint_path(args)
+    session_id = None
+    for query in script[: args.turns]:
+        started = time.perf_counter()
+        response = await client.post(path, _body(query, session_id), content_type='application/json', headers=headers)
+        state = TurnState(started)
+        if args.endpoint == 'stream' and response.status_code == 200:
+            async for chunk in response.streaming_content:
+                state.feed(chunk)
+        elif response.status_code == 200:
+            state.session_id = json.loads(response.content).get('session_id')
+        status_code = response.status_code
+        _finish(report, started, status_code, state, state.error or ('' if status_code == 200 else f'http_{status_code}'))
+        session_id = state.session_id or session_id
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+
+
+def prepare_users(count):
+    from myapp.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    tokens = []
+    for index in range(count):
+        user, created = User.objects.get_or_create(
+            username=f'loadtest_{index}',
+            defaults={'email': f'loadtest_{index}@example.invalid', 'role': 'student'},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        tokens.append(str(RefreshToken.for_user(user).access_token))
+    return tokens
+
+
+def configure(args, stub_url):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_backend.settings')
+    if stub_url:
+        os.environ['CEREBRAS_BASE_URL'] = stub_url
+        os.environ['CEREBRAS_API_KEY'] = 'stub'
+        os.environ.pop('LLM_PROVIDERS', None)
+        # Quotas would throttle the synthetic users, not measure the app.
+        for suffix in ('CONCURRENT', 'RPM', 'DAILY_TOKENS'):
+            os.environ[f'CHATBOT_QUOTA_STUDENT_{suffix}'] = '0'
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+
+    # In-process requests go through Django's test client host.
+    if '*' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+    from api.services import gemini_service, tool_registry
+
+    tool_registry.TOOL_CACHE_ENABLED = args.tool_cache == 'on'
+    if args.response_cache == 'off':
+        gemini_service.RESPONSE_CACHE_TTL = 0
+
+
+def summarize(args, report, wall, queries, rss_before, rss_after, heap_peak, stub_stats):
+    results = report.results
+    ok = [r for r in results if r.ok]
+    errors = {}
+    for result in results:
+        if not result.ok:
+            errors[result.error or f'http_{result.status}'] = errors.get(result.error or f'http_{result.status}', 0) + 1
+
+    def stats(values):
+        return {f'p{int(p * 100)}': _ms(percentile(values, p)) for p in (0.5, 0.95, 0.99)} | {'max': _ms(max(values, default=None))}
+
+    return {
+        'config': {
+            'mode': 'http' if args.target else args.mode,
+            'endpoint': args.endpoint,
+            'users': args.users,
+            'turns': args.turns,
+            'tool_cache': args.tool_cache,
+            'response_cache': args.response_cache,
+        },
+        'requests': len(results),
+        'ok': len(ok),
+        'errors': errors,
+        'wall_seconds': round(wall, 2),
+        'throughput_rps': round(len(ok) / wall, 2) if wall else None,
+        'ttft_ms': stats([r.ttft for r in ok]),
+        'latency_ms': stats([r.latency for r in ok]),
+        'stream_chunks_per_response': (
+            round(sum(r.chunks for r in ok) / len(ok), 1) if ok and args.endpoint == 'stream' else None
+        ),
+        'db_queries': queries,
+        'db_queries_per_request': round(queries / len(results), 1) if queries is not None and results else None,
+        'peak_rss_mb': round(rss_after, 1) if rss_after else None,
+        'rss_growth_mb': round(rss_after - rss_before, 1) if rss_after and rss_before else None,
+        'python_heap_peak_mb': round(heap_peak / (1024 * 1024), 1) if heap_peak else None,
+        'stub': stub_stats,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def print_summary(summary):
+    config = summary['config']
+    print('Chat load test: ' + ', '.join(f'{k}={v}' for k, v in config.items()))
+    print(f"  requests   {summary['requests']} ({summary['ok']} ok), errors: {summary['errors'] or 'none'}")
+    print(f"  wall       {summary['wall_seconds']} s, throughput {summary['throughput_rps']} req/s")
+    for name in ('ttft_ms', 'latency_ms'):
+        values = summary[name]
+        print(f"  {name:<10} " + '  '.join(f'{k} {v}' for k, v in values.items()))
+    if summary['stream_chunks_per_response'] is not None:
+        print(f"  stream     {summary['stream_chunks_per_response']} body chunks per response")
+    if summary['db_queries'] is not None:
+        print(f"  db queries {summary['db_queries']} total, {summary['db_queries_per_request']} per request")
+    if summary['peak_rss_mb'] is not None:
+        print(f"  memory     peak RSS {summary['peak_rss_mb']} MB (+{summary['rss_growth_mb']} MB during run)")
+    if summary['python_heap_peak_mb'] is not None:
+        print(f"  heap peak  {summary['python_heap_peak_mb']} MB (tracemalloc)")
+    if summary['stub']:
+        print(f"  stub       {summary['stub']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help='Concurrent users')
+    parser.add_argument('--turns', type=int, default=4, help='Turns per user (max script length)')
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--endpoint', choices=('query', 'stream'), default='stream')
+    parser.add_argument('--target', help='Base URL of a running server instead of in-process handlers')
+    parser.add_argument('--tool-cache', choices=('on', 'off'), default='on')
+    parser.add_argument('--response-cache', choices=('on', 'off'), default='on')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Pause between turns of one user')
+    parser.add_argument('--trace-memory', action='store_true', help='Track Python heap peak (slower)')
+    parser.add_argument('--no-stub', action='store_true', help='Do not start the embedded LLM stub')
+    parser.add_argument('--cleanup', action='store_true', help='Delete loadtest_* users afterwards')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub, stub_stats = None, None
+    if not args.no_stub and not args.target:
+        stub, stub_stats = start_stub_server(stub_config_from_args(args))
+    configure(args, f'http://127.0.0.1:{stub.server_address[1]}/v1' if stub else None)
+
+    tokens = prepare_users(args.users)
+    scripts = [CHAT_SCRIPTS[i % len(CHAT_SCRIPTS)] for i in range(args.users)]
+    report = Report()
+    counter = None
+    if not args.target:
+        counter = QueryCounter()
+        counter.install()
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = rss_mb()
+
+    started = time.perf_counter()
+    if args.mode == 'asgi' and not args.target:
+        async def run_all():
+            await asyncio.gather(*(run_user_async(args, t, s, report) for t, s in zip(tokens, scripts)))
+
+        asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            list(pool.map(lambda pair: run_user_sync(args, *pair, report), zip(tokens, scripts)))
+    wall = time.perf_counter() - started
+
+    heap_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    summary = summarize(
+        args, report, wall, counter.count if counter else None, rss_before, rss_mb(), heap_peak,
+        stub_stats.snapshot() if stub_stats else None,
+    )
+    if args.cleanup:
+        from myapp.models import User
+
+        User.objects.filter(username__startswith='loadtest_', email__endswith='@example.invalid').delete()
+    if stub:
+        stub.shutdown()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Local OpenAI-compatible chat-completions server for load testing the chatbot.
+
+Speaks enough of ``POST /v1/chat/completions`` (streaming and non-streaming,
+with ``usage``) for the OpenAI SDK, with configurable time to first token,
+token rate, answer length and error injection, so capacity can be measured
+without spending real provider quota.
+
+Usage:
+    python scripts/llm_stub_server.py --port 8900 --ttft-ms 400 --tokens-per-second 60
+    python scripts/llm_stub_server.py --error-rate 0.02 --rate-limit-rate 0.05
+
+Then point the backend at it:
+    CEREBRAS_BASE_URL=http://127.0.0.1:8900/v1 CEREBRAS_API_KEY=stub
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "learning course module lesson practice project python data design review "
+    "concept example progress skill goal week exercise quiz topic build"
+).split()
+
+
+@dataclass
+class StubConfig:
+    ttft_ms: float = 300.0
+    jitter_ms: float = 50.0
+    tokens_per_second: float = 80.0
+    response_tokens: int = 120
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 2
+
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+                'tokens': self.tokens,
+            }
+
+
+def _prompt_tokens(body):
+    text = ' '.join(str(m.get('content') or '') for m in body.get('messages') or [])
+    return max(1, len(text) // 4)
+
+
+def make_handler(config: StubConfig, stats: StubStats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, code, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._json(400, {'error': {'message': 'invalid JSON', 'type': 'invalid_request_error'}})
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self._json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            stats.add(requests=1)
+
+            roll = random.random()
+            if roll < config.rate_limit_rate:
+                stats.add(rate_limited=1)
+                return self._json(
+                    429,
+                    {'error': {'message': 'Rate limit exceeded (stub)', 'type': 'rate_limit_error'}},
+                    {'Retry-After': str(config.retry_after)},
+                )
+            if roll < config.rate_limit_rate + config.error_rate:
+                stats.add(errors=1)
+                return self._json(500, {'error': {'message': 'Injected failure (stub)', 'type': 'server_error'}})
+
+            delay = max(0.0, config.ttft_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            time.sleep(delay)
+            words = [random.choice(WORDS) for _ in range(max(1, config.response_tokens))]
+            usage = {
+                'prompt_tokens': _prompt_tokens(body),
+                'completion_tokens': len(words),
+                'total_tokens': _prompt_tokens(body) + len(words),
+            }
+            model = body.get('model') or 'stub'
+            if body.get('stream'):
+                self._stream(model, words, usage)
+            else:
+                time.sleep(len(words) / config.tokens_per_second if config.tokens_per_second else 0)
+                self._json(200, {
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': ' '.join(words)},
+                        'finish_reason': 'stop',
+                    }],
+                    'usage': usage,
+                })
+            stats.add(tokens=len(words))
+
+        def _stream(self, model, words, usage):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            interval = 1 / config.tokens_per_second if config.tokens_per_second else 0
+            base = {'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model}
+            try:
+                for index, word in enumerate(words):
+                    if index and interval:
+                        time.sleep(interval)
+                    chunk = dict(base, choices=[{
+                        'index': 0,
+                        'delta': {'content': word if index == 0 else ' ' + word},
+                        'finish_reason': None,
+                    }])
+                    self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                    self.wfile.flush()
+                final = dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], usage=usage)
+                self.wfile.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client closed the stream (cancelled or lost a hedge).
+                pass
+
+    return Handler
+
+
+def start_stub_server(config: StubConfig, host='127.0.0.1', port=0):
+    """Start the stub on a daemon thread; returns ``(server, stats)``."""
+    stats = StubStats()
+    server = ThreadingHTTPServer((host, port), make_handler(config, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='llm-stub').start()
+    return server, stats
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--ttft-ms', type=float, default=300.0, help='Delay before the first token')
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help='Uniform +/- jitter on the first-token delay')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--response-tokens', type=int, default=120)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 429')
+
+
+def stub_config_from_args(args) -> StubConfig:
+    return StubConfig(
+        ttft_ms=args.ttft_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server, stats = start_stub_server(stub_config_from_args(args), args.host, args.port)
+    print(f'LLM stub listening on http://{args.host}:{server.server_address[1]}/v1')
+    try:
+        while True:
+            time.sleep(30)
+            print('stub stats:', stats.snapshot())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark SSE framing of a streamed chat answer: per-delta frames vs coalescing.
+
+Replays synthetic responses (meta, optional reasoning deltas, answer deltas,
+done, timing) through the legacy framing -- one ``json.dumps`` frame and one
+write per delta -- and through ``SSECoalescer``, writing every chunk to a
+real socket. Reports CPU time, socket writes (one ``send`` syscall each),
+frames and bytes per response. Deltas arrive on a simulated clock at
+``--tokens-per-second``, so runs are fast and repeatable.
+
+Usage:
+    python scripts/sse_framing_benchmark.py
+    python scripts/sse_framing_benchmark.py --tokens 1500 --tokens-per-second 400 --reasoning-tokens 600
+    python scripts/sse_framing_benchmark.py --flush-ms 25 --flush-chars 256 --json
+"""
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+CURRENT_FILE = Path(__file__).resolve()
+PROJECT_ROOT = CURRENT_FILE.parents[1]  # .../backend/lms_backend
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from api.services.sse_coalescer import SSECoalescer  # noqa: E402
+
+WORDS = (
+    "learning course module lesson practice project python data design review "
+    "concept example progress skill goal week exercise quiz topic build"
+).split()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def synthetic_events(tokens, reasoning_tokens, seed):
+    rng = random.Random(seed)
+    events = [("meta", {"session_id": "0" * 32, "message_id": "1" * 32, "role": "student", "source": "cerebras"})]
+    events += [("reasoning_token", {"text": " " + rng.choice(WORDS)}) for _ in range(reasoning_tokens)]
+    events += [("token", {"text": " " + rng.choice(WORDS)}) for _ in range(tokens)]
+    events.append(("done", {"source": "cerebras", "function_calls": [], "token_count_output": tokens}))
+    events.append(("timing", {"ttft_ms": 310.0, "generation_ms": 2400.0, "total_ms": 2900.0}))
+    return events
+
+
+def legacy_frame(event, data):
+    payload = json.dumps(data, ensure_ascii=True)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def legacy_stream(events, clock, interval):
+    for event, data in events:
+        if event in ("token", "reasoning_token"):
+            clock.now += interval
+        yield legacy_frame(event, data)
+
+
+def coalesced_stream(events, clock, interval, flush_ms, flush_chars):
+    coalescer = SSECoalescer(flush_ms=flush_ms, flush_chars=flush_chars, clock=clock)
+    for event, data in events:
+        if event in ("token", "reasoning_token"):
+            clock.now += interval
+        chunk = coalescer.push(event, data)
+        if chunk:
+            yield chunk
+    chunk = coalescer.flush()
+    if chunk:
+        yield chunk
+
+
+def _drain(sock):
+    while sock.recv(1 << 16):
+        pass
+
+
+def measure(stream_factory, events, responses, interval):
+    writer, reader = socket.socketpair()
+    drainer = threading.Thread(target=_drain, args=(reader,), daemon=True)
+    drainer.start()
+    writes = frames = sent = 0
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    for _ in range(responses):
+        for chunk in stream_factory(events, FakeClock(), interval):
+            data = chunk.encode("utf-8")
+            writer.sendall(data)
+            writes += 1
+            frames += chunk.count("\n\n")
+            sent += len(data)
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    writer.close()
+    drainer.join()
+    reader.close()
+    return {
+        "cpu_ms_per_response": round(cpu * 1000 / responses, 3),
+        "wall_ms_per_response": round(wall * 1000 / responses, 3),
+        "writes_per_response": round(writes / responses, 1),
+        "frames_per_response": round(frames / responses, 1),
+        "bytes_per_response": round(sent / responses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, default=200)
+    parser.add_argument('--tokens', type=int, default=800, help='Answer deltas per response')
+    parser.add_argument('--reasoning-tokens', type=int, default=0, help='Reasoning deltas per response')
+    parser.add_argument('--tokens-per-second', type=float, default=250.0, help='Upstream delta rate')
+    parser.add_argument('--flush-ms', type=int, default=50)
+    parser.add_argument('--flush-chars', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    events = synthetic_events(args.tokens, args.reasoning_tokens, args.seed)
+    interval = 1 / args.tokens_per_second if args.tokens_per_second else 0.0
+    results = {
+        "config": {
+            "responses": args.responses,
+            "tokens": args.tokens,
+            "reasoning_tokens": args.reasoning_tokens,
+            "tokens_per_second": args.tokens_per_second,
+            "flush_ms": args.flush_ms,
+            "flush_chars": args.flush_chars,
+        },
+        "per_delta": measure(legacy_stream, events, args.responses, interval),
+        "coalesced": measure(
+            lambda e, c, i: coalesced_stream(e, c, i, args.flush_ms, args.flush_chars),
+            events, args.responses, interval,
+        ),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('SSE framing benchmark: ' + ', '.join(f'{k}={v}' for k, v in results['config'].items()))
+    print(f"  {'':<22}{'per delta':>12}{'coalesced':>12}")
+    for metric in results['per_delta']:
+        before, after = results['per_delta'][metric], results['coalesced'][metric]
+        print(f"  {metric:<22}{before:>12}{after:>12}")
+
+
+if __name__ == '__main__':
+    main()
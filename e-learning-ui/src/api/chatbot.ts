@@ -24,8 +24,19 @@ export interface ChatbotResponse {
 }
 
 export interface ChatbotStreamEvent {
-  type: "meta" | "reasoning" | "reasoning_token" | "tool_call" | "token" | "done" | "error";
+  type:
+    | "meta"
+    | "reasoning"
+    | "reasoning_token"
+    | "tool_call"
+    | "token"
+    | "snapshot"
+    | "done"
+    | "cancelled"
+    | "timing"
+    | "error";
   data: Record<string, unknown>;
+  id?: number;
 }
 
 export interface StreamQueryInput {
@@ -41,12 +52,18 @@ const parseSseBlock = (block: string): ChatbotStreamEvent | null => {
   if (!lines.length) return null;
   const eventLine = lines.find((line) => line.startsWith("event:"));
   const dataLine = lines.find((line) => line.startsWith("data:"));
+  const idLine = lines.find((line) => line.startsWith("id:"));
   if (!eventLine || !dataLine) return null;
 
   const type = eventLine.replace("event:", "").trim() as ChatbotStreamEvent["type"];
   const rawData = dataLine.replace("data:", "").trim();
+  const id = idLine ? Number(idLine.replace("id:", "").trim()) : undefined;
   try {
-    return { type, data: JSON.parse(rawData) as Record<string, unknown> };
+    return {
+      type,
+      data: JSON.parse(rawData) as Record<string, unknown>,
+      ...(id !== undefined && Number.isFinite(id) ? { id } : {}),
+    };
   } catch {
     return null;
   }
@@ -59,6 +76,45 @@ const resolveStreamUrl = () => {
   return "/api/chatbot/stream/";
 };
 
+const resolveResumeUrl = (messageId: string) => `${resolveStreamUrl()}${messageId}/resume/`;
+
+// Reconnect attempts after the stream drops mid-answer (1s, 2s, 4s apart).
+const RESUME_ATTEMPTS = 3;
+
+const authHeaders = (): Record<string, string> => {
+  const tokens = getTokens();
+  return tokens?.access ? { Authorization: `Bearer ${tokens.access}` } : {};
+};
+
+const readSseStream = async (
+  response: Response,
+  onEvent: (event: ChatbotStreamEvent) => void,
+): Promise<void> => {
+  if (!response.ok || !response.body) {
+    const text = await response.text().catch(() => "");
+    throw new Error(text || `Stream request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let markerIndex = buffer.indexOf("\n\n");
+    while (markerIndex !== -1) {
+      const block = buffer.slice(0, markerIndex);
+      buffer = buffer.slice(markerIndex + 2);
+      const event = parseSseBlock(block);
+      if (event) onEvent(event);
+      markerIndex = buffer.indexOf("\n\n");
+    }
+  }
+};
+
 export interface ChatMessageRecord {
   id: number;
   session: string;
@@ -68,19 +124,50 @@ export interface ChatMessageRecord {
   function_calls: ChatbotFunctionCall[];
   reasoning_trace: ReasoningStep[];
   source: "cerebras" | "gemini" | "fallback";
-  status: "completed" | "error" | "partial";
+  status: "completed" | "error" | "partial" | "cancelled";
+  created_at: string;
+}
+
+export interface ChatSessionRecord {
+  id: string;
+  role: string;
+  title: string;
+  is_archived: boolean;
+  created_at: string;
+  updated_at: string;
+}
+
+export interface ChatSessionSummary extends ChatSessionRecord {
+  message_count: number;
+  last_query_preview: string | null;
+  last_activity_at: string | null;
+}
+
+export interface ChatSessionPage {
+  next: string | null;
+  previous: string | null;
+  results: ChatSessionSummary[];
+}
+
+export interface ChatSearchHit {
+  message_id: number;
+  session_id: string | null;
+  session_title: string | null;
   created_at: string;
+  rank: number;
+  // HTML-escaped text with matches wrapped in <mark>.
+  query_snippet: string;
+  response_snippet: string;
+}
+
+export interface ChatSearchResponse {
+  query: string;
+  offset: number;
+  results: ChatSearchHit[];
 }
 
 export interface SessionMessagesResponse {
-  session: {
-    id: string;
-    role: string;
-    title: string;
-    is_archived: boolean;
-    created_at: string;
-    updated_at: string;
-  };
+  session: ChatSessionRecord;
   messages: ChatMessageRecord[];
 }
 
@@ -90,6 +177,21 @@ export const chatbotApi = {
     return data;
   },
 
+  // One page of sessions with previews; pass the previous page's `next` URL to continue.
+  async listSessions(nextUrl?: string | null): Promise<ChatSessionPage> {
+    const { data } = await apiClient.get<ChatSessionPage>(nextUrl || "/chatbot/sessions/", {
+      params: nextUrl ? undefined : { limit: 20 },
+    });
+    return data;
+  },
+
+  async searchHistory(q: string, offset = 0): Promise<ChatSearchResponse> {
+    const { data } = await apiClient.get<ChatSearchResponse>("/chatbot/search/", {
+      params: { q, limit: 20, offset },
+    });
+    return data;
+  },
+
   async getSessionMessages(sessionId: string): Promise<SessionMessagesResponse> {
     const { data } = await apiClient.get<SessionMessagesResponse>(
       `/chatbot/sessions/${sessionId}/messages/`,
@@ -98,41 +200,52 @@ export const chatbotApi = {
     return data;
   },
 
+  async cancelStream(messageId: string): Promise<void> {
+    await apiClient.post(`/chatbot/stream/${messageId}/cancel/`);
+  },
+
   async streamQuery(
     payload: StreamQueryInput,
     onEvent: (event: ChatbotStreamEvent) => void,
   ): Promise<void> {
-    const tokens = getTokens();
-    const response = await fetch(resolveStreamUrl(), {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        ...(tokens?.access ? { Authorization: `Bearer ${tokens.access}` } : {}),
-      },
-      body: JSON.stringify(payload),
-    });
-
-    if (!response.ok || !response.body) {
-      const text = await response.text().catch(() => "");
-      throw new Error(text || `Stream request failed with status ${response.status}`);
+    const stream: { messageId: string | null; lastEventId: number; finished: boolean } = {
+      messageId: null,
+      lastEventId: 0,
+      finished: false,
+    };
+    const track = (event: ChatbotStreamEvent) => {
+      if (event.id !== undefined) stream.lastEventId = event.id;
+      if (event.type === "meta" && event.data.message_id) stream.messageId = String(event.data.message_id);
+      if (event.type === "done" || event.type === "error" || event.type === "cancelled") stream.finished = true;
+      onEvent(event);
+    };
+
+    try {
+      const response = await fetch(resolveStreamUrl(), {
+        method: "POST",
+        headers: { "Content-Type": "application/json", ...authHeaders() },
+        body: JSON.stringify(payload),
+      });
+      await readSseStream(response, track);
+    } catch (err) {
+      // Errors raised by onEvent (e.g. an "error" event) and failures before
+      // the answer started are not resumable.
+      if (stream.finished || !stream.messageId) throw err;
     }
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let buffer = "";
-
-    while (true) {
-      const { value, done } = await reader.read();
-      if (done) break;
-      buffer += decoder.decode(value, { stream: true });
-
-      let markerIndex = buffer.indexOf("\n\n");
-      while (markerIndex !== -1) {
-        const block = buffer.slice(0, markerIndex);
-        buffer = buffer.slice(markerIndex + 2);
-        const event = parseSseBlock(block);
-        if (event) onEvent(event);
-        markerIndex = buffer.indexOf("\n\n");
+    // The connection dropped mid-answer: the server keeps generating, so
+    // resume after the last event seen instead of asking again.
+    for (let attempt = 0; attempt < RESUME_ATTEMPTS; attempt += 1) {
+      const messageId = stream.messageId;
+      if (stream.finished || !messageId) return;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+      try {
+        const response = await fetch(resolveResumeUrl(messageId), {
+          headers: { ...authHeaders(), "Last-Event-ID": String(stream.lastEventId) },
+        });
+        await readSseStream(response, track);
+      } catch (err) {
+        if (stream.finished || attempt === RESUME_ATTEMPTS - 1) throw err;
       }
     }
   },
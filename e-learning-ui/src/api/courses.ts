@@ -153,11 +153,13 @@ export const coursesApi = {
     audience: string,
     tone: string
   ): Promise<{ content: string; detail?: string }> {
+    // Generation runs as a background job; wait for its draft.
     const response = await apiClient.post(
       `/courses/generate-lesson/`,
       { topic, audience, tone }
     );
-    return response.data;
+    const job = await waitForGenerationJob(response.data as GenerationJob);
+    return job.result as GeneratedLessonResult;
   },
 
   async createModuleContentUpload(
@@ -481,10 +483,63 @@ export const coursesApi = {
       `/courses/generate-assignment/`,
       { topic, assignment_type: assignmentType, num_questions: numQuestions, difficulty }
     );
-    return response.data;
+    const job = await waitForGenerationJob(response.data as GenerationJob);
+    return job.result as GeneratedAssignmentResult;
+  },
+
+  async getGenerationJob(jobId: string): Promise<GenerationJob> {
+    const res = await apiClient.get(`/generation-jobs/${jobId}/`);
+    return res.data as GenerationJob;
+  },
+
+  /** Earlier AI drafts, newest first (without their results). */
+  async listGenerationJobs(kind?: GenerationJobKind, limit = 20): Promise<GenerationJob[]> {
+    const res = await apiClient.get(`/generation-jobs/`, { params: { kind, limit } });
+    return res.data as GenerationJob[];
   },
 };
 
+const GENERATION_POLL_MS = 1500;
+
+async function waitForGenerationJob(job: GenerationJob): Promise<GenerationJob> {
+  let current = job;
+  while (current.status === 'queued' || current.status === 'running') {
+    await new Promise((resolve) => setTimeout(resolve, GENERATION_POLL_MS));
+    current = await coursesApi.getGenerationJob(current.id);
+  }
+  if (current.status === 'failed') {
+    throw new Error(current.error_message || 'Generation failed.');
+  }
+  return current;
+}
+
+export type GenerationJobKind = 'lesson' | 'assignment';
+export type GenerationJobStatus = 'queued' | 'running' | 'completed' | 'failed';
+
+export interface GeneratedLessonResult {
+  content: string;
+}
+
+export interface GeneratedAssignmentResult {
+  questions: GeneratedQuestion[];
+  assignment_type: string;
+}
+
+export interface GenerationJob {
+  id: string;
+  kind: GenerationJobKind;
+  status: GenerationJobStatus;
+  title: string;
+  params: Record<string, unknown>;
+  model_name: string | null;
+  token_count: number | null;
+  error_message: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  result?: GeneratedLessonResult | GeneratedAssignmentResult | null;
+}
+
 export interface GeneratedMCQOption {
   text: string;
   is_correct: boolean;
@@ -1,5 +1,5 @@
 import React from "react";
-import { ChevronDown, Loader2, MessageSquare, Send, X, Maximize2, Minimize2 } from "lucide-react";
+import { ChevronDown, Loader2, MessageSquare, Send, Square, X, Maximize2, Minimize2 } from "lucide-react";
 import { DotLottieReact } from '@lottiefiles/dotlottie-react';
 
 import ReactMarkdown from "react-markdown";
@@ -54,6 +54,7 @@ const ChatWidget: React.FC = () => {
   const [isExpanded, setIsExpanded] = React.useState(false);
   const [isLoadingHistory, setIsLoadingHistory] = React.useState(false);
   const historyLoadedRef = React.useRef<string | null>(null);
+  const streamingMessageIdRef = React.useRef<string | null>(null);
   const [copiedBlockId, setCopiedBlockId] = React.useState<string | null>(null);
   const textareaRef = React.useRef<HTMLTextAreaElement>(null);
   const navigate = useNavigate();
@@ -259,6 +260,7 @@ const ChatWidget: React.FC = () => {
           if (event.type === "meta") {
             const sid = (event.data.session_id as string | undefined) || undefined;
             saveSessionId(sid);
+            if (event.data.message_id) streamingMessageIdRef.current = String(event.data.message_id);
             return;
           }
           if (event.type === "reasoning") {
@@ -301,6 +303,12 @@ const ChatWidget: React.FC = () => {
             }));
             return;
           }
+          if (event.type === "snapshot") {
+            // Resumed from the server's checkpoint: it replaces what we have.
+            const text = String(event.data.text || "");
+            updateAssistantMessage(assistantId, (message) => ({ ...message, text }));
+            return;
+          }
           if (event.type === "done") {
             const source = (event.data.source as "cerebras" | "fallback" | undefined) || "cerebras";
             const warning = (event.data.warning as string | null | undefined) ?? null;
@@ -317,6 +325,10 @@ const ChatWidget: React.FC = () => {
             }
             return;
           }
+          if (event.type === "cancelled") {
+            updateAssistantMessage(assistantId, (message) => ({ ...message, isStreaming: false }));
+            return;
+          }
           if (event.type === "error") {
             throw new Error(String(event.data.message || "Stream failed"));
           }
@@ -342,10 +354,18 @@ const ChatWidget: React.FC = () => {
         variant: "destructive",
       });
     } finally {
+      streamingMessageIdRef.current = null;
       setIsSending(false);
     }
   }, [input, isSending, saveSessionId, sessionId, toast, updateAssistantMessage]);
 
+  const handleStop = React.useCallback(() => {
+    const messageId = streamingMessageIdRef.current;
+    if (!messageId) return;
+    // The stream itself ends with a "cancelled" event; nothing else to do here.
+    chatbotApi.cancelStream(messageId).catch(() => undefined);
+  }, []);
+
   const handleKeyDown = React.useCallback((e: React.KeyboardEvent<HTMLTextAreaElement>) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -753,19 +773,27 @@ const ChatWidget: React.FC = () => {
               disabled={isSending || !getTokens()?.access}
               rows={1}
             />
-            <Button
-              type="submit"
-              size="icon"
-              disabled={isSending || !input.trim()}
-              className={`absolute right-1.5 bottom-1.5 h-7 w-7 sm:h-8 sm:w-8 rounded-full shadow-sm transition-all duration-200 ${input.trim() ? "bg-primary text-primary-foreground hover:bg-primary/90" : "bg-muted text-muted-foreground"
-                }`}
-            >
-              {isSending ? (
-                <Loader2 className="h-4 w-4 animate-spin" />
-              ) : (
+            {isSending ? (
+              <Button
+                type="button"
+                size="icon"
+                onClick={handleStop}
+                aria-label="Stop generating"
+                className="absolute right-1.5 bottom-1.5 h-7 w-7 sm:h-8 sm:w-8 rounded-full shadow-sm transition-all duration-200 bg-primary text-primary-foreground hover:bg-primary/90"
+              >
+                <Square className="h-3.5 w-3.5 fill-current" />
+              </Button>
+            ) : (
+              <Button
+                type="submit"
+                size="icon"
+                disabled={!input.trim()}
+                className={`absolute right-1.5 bottom-1.5 h-7 w-7 sm:h-8 sm:w-8 rounded-full shadow-sm transition-all duration-200 ${input.trim() ? "bg-primary text-primary-foreground hover:bg-primary/90" : "bg-muted text-muted-foreground"
+                  }`}
+              >
                 <Send className="h-4 w-4 ml-0.5" />
-              )}
-            </Button>
+              </Button>
+            )}
           </form>
         </footer>
       </section>